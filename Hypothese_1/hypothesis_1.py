@@ -1,86 +1,31 @@
-import matplotlib.pyplot as plt
-from fpdf import FPDF
-import pandas as pd
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
 import os
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Database connection details from environment variables
-db_host = os.getenv('DB_HOST')
-db_port = os.getenv('DB_PORT')
-db_user = os.getenv('DB_USER')
-db_password = os.getenv('DB_PASSWORD')
-db_name = os.getenv('DB_NAME')
-
-# Create the SQLAlchemy engine
-engine = create_engine(f"mysql+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}")
-
-# Query to fetch the data
-query = """
-SELECT
-    IFNULL(orders.order_year, refunds.refund_year) AS year,
-    IFNULL(orders.total_orders, 0) AS total_orders,
-    IFNULL(refunds.refund_count, 0) AS refund_count,
-    IFNULL((refunds.refund_count / NULLIF(orders.total_orders, 0)), 0) AS refund_rate
-FROM
-    (
-        SELECT
-            YEAR(paidon) AS order_year,
-            COUNT(*) AS total_orders
-        FROM
-            `12go`.analytic_test_booking
-        GROUP BY
-            order_year
-    ) AS orders
-RIGHT JOIN
-    (
-        SELECT
-            YEAR(refund_date) AS refund_year,
-            COUNT(*) AS refund_count
-        FROM
-            `12go`.analytic_test_booking
-        WHERE
-            refund_date IS NOT NULL
-        GROUP BY
-            refund_year
-    ) AS refunds
-ON
-    orders.order_year = refunds.refund_year
-ORDER BY year;
-"""
-
-# Execute the query and save the data into a DataFrame
-df = pd.read_sql(query, engine)
-
-# Replace anomalies with descriptive text
-def calculate_refund_rate(row):
-    if row['total_orders'] == 0:
-        if row['refund_count'] > 0:
-            return "N/A (No Orders)"
-        else:
-            return "0.0000"
-    elif row['refund_rate'] > 1:
-        return "Anomaly"
-    else:
-        return row['refund_rate']
-
-df['refund_rate'] = df.apply(calculate_refund_rate, axis=1)
-
-# Correct the refund_rate column for string cases before rounding
-def safe_round(refund_rate):
-    try:
-        return round(float(refund_rate), 4)
-    except (ValueError, TypeError):
-        return refund_rate
-
-# Apply the safe rounding function
-df['refund_rate'] = df['refund_rate'].apply(safe_round)
-
-# Convert refund_rate to float for visualization (ignore anomalies for plotting)
-df['refund_rate_float'] = pd.to_numeric(df['refund_rate'], errors='coerce')
+import sys
+
+# Make the shared analytics package importable when running this script directly
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from analytics.db import get_engine, use_snapshot
+from analytics.partials import incremental, refresh_partials, yearly_refunds
+from analytics.profiling import report_profile
+from analytics.query_cache import query_cache_report
+from analytics.refunds import classify_refund_rates, fetch_yearly_refunds, refund_rates_by_year, refund_summary_lines
+from analytics.rendering import render_figures
+from analytics.report import ReportBuilder, chart_format
+from analytics.snapshot import load_snapshot
+
+# Orders, refunds and refund rate per year in a single scan of the booking table
+if incremental():
+    # INCREMENTAL=1: rolled up from the (year, month) partials, refreshing only partitions touched since the last run
+    df = yearly_refunds(refresh_partials())
+elif use_snapshot():
+    df = refund_rates_by_year(load_snapshot(['paidon', 'refund_date']))
+else:
+    # Create the SQLAlchemy engine from the DB_* settings in .env
+    df = fetch_yearly_refunds(get_engine())
+
+# Classify refund rates as "ok", "anomaly" or "no orders" and round them in one vectorised pass;
+# refund_rate stays numeric (NaN for anomalies) so it can be plotted directly
+df = classify_refund_rates(df)
 
 # Generate refund statistics
 total_orders = df['total_orders'].sum()
@@ -93,82 +38,73 @@ total_refunds_rounded = f"{total_refunds:,}"
 refund_percentage_rounded = round(refund_percentage, 2)
 
 # Calculate yearly refund statistics
-yearly_refund_stats = []
-for _, row in df.iterrows():
-    year = int(row['year'])
-    total_orders_year = row['total_orders']
-    refund_count_year = row['refund_count']
-    
-    if total_orders_year > 0:
-        refund_stat = f"{year}: 1 of every {round(total_orders_year / refund_count_year)} orders refunded ({row['refund_rate']} refund rate)"
-    else:
-        refund_stat = f"{year}: N/A (No Orders)"
-    
-    yearly_refund_stats.append(refund_stat)
-
-yearly_refund_stats_str = "\n".join(yearly_refund_stats)
+yearly_refund_stats_str = "\n".join(refund_summary_lines(df))
+
+# Charts are described as figure specs and rendered off-screen in a process pool
+years = df['year'].tolist()
 
 # Visualization: Total Orders and Refunds by Year
-plt.figure(figsize=(12, 6))
-plt.bar(df['year'], df['total_orders'], color='blue', alpha=0.7, label='Total Orders')
-plt.bar(df['year'], df['refund_count'], color='red', alpha=0.7, label='Refund Count')
-plt.title('Total Orders and Refund Count by Year')
-plt.xlabel('Year')
-plt.ylabel('Count')
-plt.legend()
-plt.xticks(df['year'])
-plt.savefig('total_orders_refunds_by_year.png')
-plt.close()
+orders_refunds_spec = {
+    'figsize': (12, 6),
+    'series': [
+        {'kind': 'bar', 'x': years, 'y': df['total_orders'].tolist(), 'color': 'blue', 'alpha': 0.7, 'label': 'Total Orders'},
+        {'kind': 'bar', 'x': years, 'y': df['refund_count'].tolist(), 'color': 'red', 'alpha': 0.7, 'label': 'Refund Count'},
+    ],
+    'title': 'Total Orders and Refund Count by Year',
+    'xlabel': 'Year',
+    'ylabel': 'Count',
+    'xticks': years,
+    'legend': True,
+}
 
 # Visualization: Refund Rate by Year with Labels
-plt.figure(figsize=(12, 6))
-plt.plot(df['year'], df['refund_rate_float'], marker='o', linestyle='-', color='green', label='Refund Rate')
-
-# Adding data labels
-for i, txt in enumerate(df['refund_rate_float']):
-    plt.annotate(f'{txt:.4f}', (df['year'].iloc[i], df['refund_rate_float'].iloc[i]), textcoords="offset points", xytext=(0,10), ha='center')
-
-plt.title('Refund Rate by Year')
-plt.xlabel('Year')
-plt.ylabel('Refund Rate')
-plt.xticks(df['year'])
-plt.legend()
-plt.grid(True)
-plt.savefig('refund_rate_by_year.png')
-plt.close()
+refund_rate_spec = {
+    'figsize': (12, 6),
+    'series': [
+        {'kind': 'line', 'x': years, 'y': df['refund_rate'].tolist(), 'marker': 'o', 'linestyle': '-', 'color': 'green', 'label': 'Refund Rate'},
+    ],
+    # Adding data labels
+    'annotations': [(f'{rate:.4f}', (year, rate)) for year, rate in zip(years, df['refund_rate'])],
+    'title': 'Refund Rate by Year',
+    'xlabel': 'Year',
+    'ylabel': 'Refund Rate',
+    'xticks': years,
+    'legend': True,
+    'grid': True,
+}
 
 # Focused Analysis: Pre-COVID (2019) vs. Post-COVID (2023)
 df_focus = df[df['year'].isin([2019, 2023])]
 
 # Visualization: 2019 vs 2023
-plt.figure(figsize=(8, 6))
 width = 0.35
-years = df_focus['year']
-total_orders = df_focus['total_orders'].astype(int)
-refund_count = df_focus['refund_count'].astype(int)
-
-plt.bar(years - width/2, total_orders, width, label='Total Orders', color='blue')
-plt.bar(years + width/2, refund_count, width, label='Refund Count', color='red')
-
-plt.title('Comparison of Total Orders and Refund Count: 2019 vs 2023')
-plt.xlabel('Year')
-plt.ylabel('Count')
-plt.xticks(years)
-plt.legend()
-plt.savefig('comparison_2019_2023.png')
-plt.close()
-
-# Create a PDF and add the saved images
-pdf = FPDF()
+focus_years = df_focus['year']
+comparison_spec = {
+    'figsize': (8, 6),
+    'series': [
+        {'kind': 'bar', 'x': (focus_years - width/2).tolist(), 'y': df_focus['total_orders'].astype(int).tolist(), 'width': width, 'label': 'Total Orders', 'color': 'blue'},
+        {'kind': 'bar', 'x': (focus_years + width/2).tolist(), 'y': df_focus['refund_count'].astype(int).tolist(), 'width': width, 'label': 'Refund Count', 'color': 'red'},
+    ],
+    'title': 'Comparison of Total Orders and Refund Count: 2019 vs 2023',
+    'xlabel': 'Year',
+    'ylabel': 'Count',
+    'xticks': focus_years.tolist(),
+    'legend': True,
+}
+
+orders_refunds_png, refund_rate_png, comparison_png = render_figures([orders_refunds_spec, refund_rate_spec, comparison_spec], fmt=chart_format())
+
+# Create a PDF and add the rendered images
+pdf = ReportBuilder()
 
 # Introduction Page
 pdf.add_page()
-pdf.set_font("Arial", 'B', 16)
-pdf.cell(200, 10, 'Refund Analysis Report', ln=True, align='C')
-pdf.set_font("Arial", size=12)
-pdf.cell(200, 10, 'Prepared by Ismat Samadov', ln=True, align='C')
+pdf.set_font("Helvetica", 'B', 16)
+pdf.cell(200, 10, 'Refund Analysis Report', new_x="LMARGIN", new_y="NEXT", align='C')
+pdf.set_font("Helvetica", size=12)
+pdf.cell(200, 10, 'Prepared by Ismat Samadov', new_x="LMARGIN", new_y="NEXT", align='C')
 pdf.ln(20)
-pdf.set_font("Arial", size=12)
+pdf.set_font("Helvetica", size=12)
 pdf.multi_cell(0, 10, f"This report provides an analysis of refunds for orders made on the 12Go platform. The data "
                       f"covers multiple years, focusing on the refund rates and their trends. The report includes "
                       f"visual comparisons of key metrics and provides actionable insights based on the findings.\n\n"
@@ -180,24 +116,24 @@ pdf.multi_cell(0, 10, f"This report provides an analysis of refunds for orders m
 
 # Add the first image
 pdf.add_page()
-pdf.image('total_orders_refunds_by_year.png', x=10, y=10, w=180)
+pdf.add_chart(orders_refunds_png, x=10, y=10, w=180)
 
 pdf.add_page()
 
 # Add the second image
-pdf.image('refund_rate_by_year.png', x=10, y=10, w=180)
+pdf.add_chart(refund_rate_png, x=10, y=10, w=180)
 
 pdf.add_page()
 
 # Add the third image
-pdf.image('comparison_2019_2023.png', x=10, y=10, w=180)
+pdf.add_chart(comparison_png, x=10, y=10, w=180)
 
 # Actionable Insights Page
 pdf.add_page()
-pdf.set_font("Arial", 'B', 14)
-pdf.cell(200, 10, 'Actionable Insights', ln=True, align='C')
+pdf.set_font("Helvetica", 'B', 14)
+pdf.cell(200, 10, 'Actionable Insights', new_x="LMARGIN", new_y="NEXT", align='C')
 pdf.ln(10)
-pdf.set_font("Arial", size=12)
+pdf.set_font("Helvetica", size=12)
 pdf.multi_cell(0, 10, "1. Station-Specific Decline: Certain stations may show a higher decline in EPS, "
                       "indicating decreased demand or increased competition. Consider targeted marketing or "
                       "adjusting services at these stations.\n\n"
@@ -211,6 +147,12 @@ pdf.multi_cell(0, 10, "1. Station-Specific Decline: Certain stations may show a
 
 # Save the PDF
 pdf_output_path = 'hypo_1.pdf'
-pdf.output(pdf_output_path)
+pdf.save(pdf_output_path)
 
 pdf_output_path
+
+# Report how many queries were answered from the result cache
+print(query_cache_report())
+
+# Per-stage timings and the JSON trace (PROFILE=1)
+report_profile()
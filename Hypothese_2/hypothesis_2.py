@@ -1,53 +1,96 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from fpdf import FPDF
-
-# Data for 2019
-data_2019 = {
-    "from_station_name": ["Chiang Mai Town", "Kuala Lumpur Airport", "Queen Aliya Amman Jordan", "Casablanca Airport", "zzDoNotUse", "Incheon Airport", "Manama Airport", "Berlin Tegel Airport", "Narita Airport", "Soekarno Hatta Airport"],
-    "to_station_name": ["Suvarnabhumi Airport", "Heathrow Airport", "Istanbul New Airport", "Istanbul New Airport", "Manama Airport", "Phnom Penh Airport", "Jeddah Airport", "Domodedovo Airport", "Hanoi Noi Bai Airport", "Sorong Airport"],
-    "country": ["Thailand", "Malaysia", "Jordan", "Morocco", "Bahrain", "South Korea", "Bahrain", "Germany", "Japan", "Indonesia"],
-    "vehclass_id": ["bus", "avia", "avia", "avia", "avia", "avia", "avia", "avia", "avia", "avia"],
-    "class_name": ["Express", "Economy", "Economy", "Economy", "Economy", "Economy", "Economy", "Economy", "Economy", "Economy"],
-    "total_seats": [1, 1, 1, 1, 1, 3, 1, 2, 2, 1],
-    "total_netprice": [20.02, 0.0, 0.0, 0.0, 0.0, 267.02, 0.0, 0.0, 482.97, 0.0],
-    "total_revenue": [3458.58, 710.25, 561.58, 443.27, 365.77, 1228.48, 318.94, 606.69, 1085.83, 291.02],
-    "EPS": [3438.56, 710.25, 561.58, 443.27, 365.77, 320.49, 318.94, 303.35, 301.43, 291.02],
-    "year": [2019] * 10
-}
-
-# Data for 2023
-data_2023 = {
-    "from_station_name": ["Dubai International Airport", "Suvarnabhumi Airport", "Abidjan Airport", "Suvarnabhumi Airport", "Casablanca Airport", "Abidjan Airport", "Charles de Gaulle Airport", "Beijing Daxing Airport", "Harare Airport", "Singapore Airport"],
-    "to_station_name": ["Agadir Airport", "Charles de Gaulle Airport", "Casablanca Airport", "Amsterdam Schiphol Airport", "Abidjan Airport", "Bamako Airport", "Suvarnabhumi Airport", "Narita Airport", "OR Tambo Airport", "Hong Kong Airport"],
-    "country": ["UAE", "Thailand", "Ivory Coast", "Thailand", "Morocco", "Ivory Coast", "France", "China", "Zimbabwe", "Singapore"],
-    "vehclass_id": ["avia", "avia", "avia", "avia", "avia", "avia", "avia", "avia", "avia", "avia"],
-    "class_name": ["Economy", "Economy", "Economy", "Economy", "Economy", "Economy", "Economy", "Economy", "Economy", "Economy"],
-    "total_seats": [1, 5, 8, 2, 8, 2, 5, 2, 1, 2],
-    "total_netprice": [0.0, 652.72, 1744.64, 865.65, 1318.92, 0.0, 562.31, 885.95, 0.0, 0.0],
-    "total_revenue": [608.38, 3530.67, 6307.94, 1903.58, 5346.09, 996.19, 2857.59, 1797.44, 452.60, 880.06],
-    "EPS": [608.38, 575.59, 570.41, 518.96, 503.40, 498.10, 459.06, 455.74, 452.60, 440.03],
-    "year": [2023] * 10
-}
-
-# Create DataFrames
-df_2019 = pd.DataFrame(data_2019)
-df_2023 = pd.DataFrame(data_2023)
+import os
+import sys
+
+# Make the shared analytics package importable when running this script directly
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from analytics.db import get_engine, read_sql, use_snapshot
+from analytics.decomposition import DEFAULT_THRESHOLD, decompose_eps, decomposition_labels
+from analytics.dictionary import decode
+from analytics.eps_cube import ROUTE_DIMENSIONS, get_cube, with_eps
+from analytics.metrics import seat_metrics
+from analytics.partials import incremental, refresh_partials, route_year_totals
+from analytics.profiling import report_profile
+from analytics.query_cache import query_cache_report
+from analytics.rendering import render_figures
+from analytics.report import ReportBuilder, chart_format
+from analytics.topn import top_routes
+from analytics.yoy import route_year_totals_query
+
+YEARS = [2019, 2023]
+
+# Number of top routes per year, and optionally per country (from_country_id) or vehclass_id
+TOP_N = int(os.getenv('TOP_N') or 10)
+TOP_N_PER = os.getenv('TOP_N_PER') or None
+
+# Share of the gross EPS movement a segment's rate effect needs before the decomposition drills into it
+DECOMPOSITION_THRESHOLD = float(os.getenv('DECOMPOSITION_THRESHOLD') or DEFAULT_THRESHOLD)
+DECOMPOSITION_LINES = 15
+
+ROUTE_COLUMNS = ['from_country_id'] + ROUTE_DIMENSIONS
+
+# Route totals per year: rolled up from the (year, month) partials refreshed since the last run (INCREMENTAL=1),
+# from the EPS cube over the local snapshot, or one GROUP BY on the database
+if incremental():
+    routes = with_eps(route_year_totals(refresh_partials(), YEARS))
+elif use_snapshot():
+    routes = get_cube().rollup(['year'] + ROUTE_COLUMNS, years=YEARS)
+else:
+    engine = get_engine()
+    routes = with_eps(read_sql(route_year_totals_query(YEARS, dimensions=ROUTE_COLUMNS), engine))
+
+# EPS change split into mix and rate effects, country -> vehclass -> class -> route, drilling only into hot branches
+decomposition = decompose_eps(routes, YEARS[0], YEARS[1], threshold=DECOMPOSITION_THRESHOLD)
+# The core PDF fonts are Latin-1 only, so station names outside it print with '?'
+decomposition['segment'] = decomposition_labels(decomposition).str.encode('latin-1', 'replace').str.decode('latin-1')
+decomposition_total = decomposition.iloc[0]
+decomposition_lines = decomposition[(decomposition['level'] == 1) | decomposition['parent'].isin(
+    decomposition.loc[decomposition['expanded'] & (decomposition['level'] > 0), 'node'])].head(DECOMPOSITION_LINES)
+
+# Top routes by EPS, selected with a partial sort instead of ordering every route;
+# dictionary-encoded dimensions are decoded to labels only for these few rows
+top = decode(top_routes(routes, TOP_N, per=TOP_N_PER)).rename(columns={
+    'from_country_id': 'country',
+    'seats': 'total_seats',
+    'netprice_usd': 'total_netprice',
+    'total_usd': 'total_revenue',
+})
+top = top[['from_station_name', 'to_station_name', 'country', 'vehclass_id', 'class_name',
+           'total_seats', 'total_netprice', 'total_revenue', 'EPS', 'year']]
+top['country'] = top['country'].astype(str)
+
+df_2019 = top[top['year'] == 2019].reset_index(drop=True)
+df_2023 = top[top['year'] == 2023].reset_index(drop=True)
 
 # Combine the two DataFrames
 df_combined = pd.concat([df_2019, df_2023])
 
-# Visualization: 2019 vs 2023 EPS Route Comparison
-plt.figure(figsize=(8, 6))
-sns.barplot(x='from_station_name', y='EPS', hue='year', data=df_combined)
-plt.title('2019 vs 2023 EPS Route Comparison')
-plt.xlabel('From Station Name')
-plt.ylabel('EPS')
-plt.xticks(rotation=45, ha="right")
-plt.tight_layout()
-plt.savefig('eps_route_comparison.png')
-plt.close()
+# Charts are described as figure specs and rendered off-screen in a process pool
+
+# Side-by-side EPS bars per from-station, one bar per year (mean EPS, like sns.barplot with hue='year')
+def eps_by_station_spec(data, title):
+    means = data.pivot_table(index='from_station_name', columns='year', values='EPS', aggfunc='mean', sort=False)
+    return {
+        'figsize': (8, 6),
+        'grouped_bars': {'categories': means.index.tolist(), 'groups': {year: means[year].tolist() for year in means.columns}},
+        'title': title,
+        'xlabel': 'From Station Name',
+        'ylabel': 'EPS (USD per Seat)',
+        'xticks_rotation': 45,
+        'legend': True,
+        'tight_layout': True,
+    }
+
+def simple_bar_spec(x, y, title, ylabel, xlabel=''):
+    return {
+        'figsize': (8, 6),
+        'series': [{'kind': 'bar', 'x': [str(v) for v in x], 'y': list(y)}],
+        'title': title,
+        'xlabel': xlabel,
+        'ylabel': ylabel,
+        'tight_layout': True,
+    }
 
 # Filter out routes that were in the top 2019 EPS but are not in 2023 EPS
 top_2019_routes = df_2019.nlargest(5, 'EPS')
@@ -56,117 +99,94 @@ top_2019_routes_names = top_2019_routes['from_station_name'].tolist()
 # Check if these routes are present in the top of 2023
 not_in_2023 = df_2023[~df_2023['from_station_name'].isin(top_2019_routes_names)]
 
-# Visualization: EPS Comparison for Top 2019 Routes (Highlighting those not in 2023)
-plt.figure(figsize=(8, 6))
-sns.barplot(x='from_station_name', y='EPS', hue='year', data=df_combined[df_combined['from_station_name'].isin(top_2019_routes_names)])
-plt.title('EPS Comparison for Top 2019 Routes (2019 vs. 2023)')
-plt.xlabel('From Station Name')
-plt.ylabel('EPS')
-plt.xticks(rotation=45, ha="right")
-plt.tight_layout()
-plt.savefig('eps_comparison_top_routes.png')
-plt.close()
+# Calculate Overall EPS Statistics: SUM(total_usd - netprice_usd) / SUM(seats) over every route of the year,
+# the same seat-weighted EPS the decomposition starts from, rather than a mean of the top routes' ratios
+overall_eps = seat_metrics(routes, ['year'], ['eps']).set_index('year')['eps']
+overall_eps_2019 = overall_eps.get(2019, float('nan'))
+overall_eps_2023 = overall_eps.get(2023, float('nan'))
 
-# Highlight routes that were top in 2019 but not in 2023
-if not not_in_2023.empty:
-    plt.figure(figsize=(8, 6))
-    sns.barplot(x='from_station_name', y='EPS', hue='year', data=not_in_2023)
-    plt.title('Top 2019 Routes Not in Top 2023')
-    plt.xlabel('From Station Name')
-    plt.ylabel('EPS')
-    plt.xticks(rotation=45, ha="right")
-    plt.tight_layout()
-    plt.savefig('eps_not_in_2023.png')
-    plt.close()
-
-# EPS Comparison for both 2019 and 2023 in one chart
-plt.figure(figsize=(8, 6))
-sns.barplot(x='from_station_name', y='EPS', hue='year', data=df_combined)
-plt.title('EPS Comparison by Route (2019 vs. 2023)')
-plt.xlabel('From Station Name')
-plt.ylabel('EPS')
-plt.xticks(rotation=45, ha="right")
-plt.tight_layout()
-plt.savefig('eps_comparison_all_routes.png')
-plt.close()
-
-# Calculate Overall EPS Statistics
-overall_eps_2019 = df_2019['EPS'].mean()
-overall_eps_2023 = df_2023['EPS'].mean()
-
-# Visualization: Overall EPS Comparison
-plt.figure(figsize=(8, 6))
-sns.barplot(x=['2019', '2023'], y=[overall_eps_2019, overall_eps_2023])
-plt.title('Overall EPS Comparison (2019 vs. 2023)')
-plt.ylabel('Average EPS')
-plt.tight_layout()
-plt.savefig('overall_eps_comparison.png')
-plt.close()
-
-# Country-based insights
+# Country-based insights, seat-weighted over all routes departing from the country
+country_eps = decode(seat_metrics(routes, ['year', 'from_country_id'], ['eps']))
+country_eps['from_country_id'] = country_eps['from_country_id'].astype(str)
 # Top countries in 2019 by EPS
-top_countries_2019 = df_2019.groupby('country')['EPS'].mean().nlargest(5)
+top_countries_2019 = country_eps[country_eps['year'] == 2019].set_index('from_country_id')['eps'].nlargest(5)
 # Top countries in 2023 by EPS
-top_countries_2023 = df_2023.groupby('country')['EPS'].mean().nlargest(5)
-
-# Visualization: Top Countries by EPS in 2019 and 2023
-plt.figure(figsize=(8, 6))
-sns.barplot(x=top_countries_2019.index, y=top_countries_2019.values)
-plt.title('Top 5 Countries by Average EPS in 2019')
-plt.xlabel('Country')
-plt.ylabel('Average EPS')
-plt.tight_layout()
-plt.savefig('top_countries_2019.png')
-plt.close()
-
-plt.figure(figsize=(8, 6))
-sns.barplot(x=top_countries_2023.index, y=top_countries_2023.values)
-plt.title('Top 5 Countries by Average EPS in 2023')
-plt.xlabel('Country')
-plt.ylabel('Average EPS')
-plt.tight_layout()
-plt.savefig('top_countries_2023.png')
-plt.close()
+top_countries_2023 = country_eps[country_eps['year'] == 2023].set_index('from_country_id')['eps'].nlargest(5)
+
+chart_specs = {
+    # EPS Comparison for both 2019 and 2023 in one chart
+    'eps_comparison_all_routes': eps_by_station_spec(df_combined, 'EPS Comparison by Route (2019 vs. 2023)'),
+    # EPS Comparison for Top 2019 Routes (Highlighting those not in 2023)
+    'eps_comparison_top_routes': eps_by_station_spec(df_combined[df_combined['from_station_name'].isin(top_2019_routes_names)],
+                                                     'EPS Comparison for Top 2019 Routes (2019 vs. 2023)'),
+    # Overall EPS Comparison
+    'overall_eps_comparison': simple_bar_spec(['2019', '2023'], [overall_eps_2019, overall_eps_2023],
+                                              'Overall EPS Comparison (2019 vs. 2023)', 'EPS (USD per Seat)'),
+    # Top Countries by EPS in 2019 and 2023
+    'top_countries_2019': simple_bar_spec(top_countries_2019.index, top_countries_2019.values,
+                                          'Top 5 Countries by EPS in 2019', 'EPS (USD per Seat)', 'Country'),
+    'top_countries_2023': simple_bar_spec(top_countries_2023.index, top_countries_2023.values,
+                                          'Top 5 Countries by EPS in 2023', 'EPS (USD per Seat)', 'Country'),
+}
+
+# Highlight routes that were top in 2019 but not in 2023
+if not not_in_2023.empty:
+    chart_specs['eps_not_in_2023'] = eps_by_station_spec(not_in_2023, 'Top 2019 Routes Not in Top 2023')
+
+# Render all charts in parallel; image bytes stay in memory, keyed by chart name
+charts = dict(zip(chart_specs, render_figures(chart_specs.values(), fmt=chart_format())))
 
 # Create PDF with all charts
-pdf = FPDF()
+pdf = ReportBuilder()
 
 # Add the eps_comparison_all_routes
 pdf.add_page()
-pdf.image('eps_comparison_all_routes.png', x=10, y=10, w=180)
+pdf.add_chart(charts['eps_comparison_all_routes'], x=10, y=10, w=180)
 
 # Add the EPS Comparison Chart for Top 2019 Routes
 pdf.add_page()
-pdf.image('eps_comparison_top_routes.png', x=10, y=10, w=180)
+pdf.add_chart(charts['eps_comparison_top_routes'], x=10, y=10, w=180)
 
 # Add the EPS Not in 2023 Chart
 if not not_in_2023.empty:
     pdf.add_page()
-    pdf.image('eps_not_in_2023.png', x=10, y=10, w=180)
+    pdf.add_chart(charts['eps_not_in_2023'], x=10, y=10, w=180)
 
 # Add the Overall EPS Comparison Chart
 pdf.add_page()
-pdf.image('overall_eps_comparison.png', x=10, y=10, w=180)
+pdf.add_chart(charts['overall_eps_comparison'], x=10, y=10, w=180)
 
 # Add the Country-based Insights
 pdf.add_page()
 
 # Add the Top Countries by EPS in 2019 Chart
-pdf.image('top_countries_2019.png', x=10, y=10, w=180)
+pdf.add_chart(charts['top_countries_2019'], x=10, y=10, w=180)
 
 # Add the Top Countries by EPS in 2023 Chart
 pdf.add_page()
-pdf.image('top_countries_2023.png', x=10, y=10, w=180)
+pdf.add_chart(charts['top_countries_2023'], x=10, y=10, w=180)
+
+# Add the EPS change decomposition
+pdf.add_page()
+pdf.set_font("Helvetica", 'B', 14)
+pdf.cell(200, 10, 'EPS Change Decomposition (2019 vs. 2023)', new_x="LMARGIN", new_y="NEXT", align='C')
+pdf.set_font("Courier", size=9)
+pdf.multi_cell(0, 5, f"EPS {decomposition_total['EPS_2019']:.4f} -> {decomposition_total['EPS_2023']:.4f} "
+                     f"(change {decomposition_total['contribution']:+.4f}): "
+                     f"mix {decomposition_total['mix']:+.4f}, rate {decomposition_total['rate']:+.4f}\n\n"
+                     f"{'segment':<44}{'mix':>10}{'rate':>10}{'total':>10}\n" +
+                     ''.join(f"{row.segment[:44]:<44}{row.mix:>+10.4f}{row.rate:>+10.4f}{row.contribution:>+10.4f}\n"
+                             for row in decomposition_lines.itertuples()))
 
 # Add a summary page with insights
 pdf.add_page()
-pdf.set_font("Arial", size=12)
+pdf.set_font("Helvetica", size=12)
 pdf.multi_cell(0, 10, f"Summary of Insights:\n\n"
                       f"1. 2019 vs 2023 EPS Route Comparison:\n"
                       f"   - This chart compares EPS for the top routes in both 2019 and 2023. Significant changes in EPS between the two years highlight shifts in route profitability.\n\n"
                       f"   - Focus on the routes in Thailand that saw a decline in EPS from 2019 to 2023.\n"
                       f"2. Overall EPS Comparison:\n"
-                      f"   - The average EPS decreased from {overall_eps_2019:.2f} in 2019 to {overall_eps_2023:.2f} in 2023.\n"
+                      f"   - EPS across all routes (margin per seat sold) decreased from {overall_eps_2019:.2f} in 2019 to {overall_eps_2023:.2f} in 2023.\n"
                       f"   - This suggests a general decline in profitability per seat across routes.\n\n"
                       f"3. Top 2019 Routes Not Performing in 2023:\n"
                       f"   - Some of the top-performing routes in 2019 did not maintain their positions in 2023.\n"
@@ -178,11 +198,11 @@ pdf.multi_cell(0, 10, f"Summary of Insights:\n\n"
 
 # Add a summary page with detailed actionable insights
 pdf.add_page()
-pdf.set_font("Arial", 'B', 14)
-pdf.cell(200, 10, 'Actionable Insights', ln=True, align='C')
+pdf.set_font("Helvetica", 'B', 14)
+pdf.cell(200, 10, 'Actionable Insights', new_x="LMARGIN", new_y="NEXT", align='C')
 pdf.ln(10)
 
-pdf.set_font("Arial", size=12)
+pdf.set_font("Helvetica", size=12)
 pdf.multi_cell(0, 10, f"1. Targeted Promotions:\n"
                       f"   - Focus on routes that saw a decline in EPS from 2019 to 2023.\n"
                       f"   - Consider offering promotions such as discounts, bundle offers, and loyalty rewards to regain market share.\n"
@@ -198,7 +218,13 @@ pdf.multi_cell(0, 10, f"1. Targeted Promotions:\n"
 
 # Save the PDF
 pdf_output_path = 'eps_analysis_report.pdf'
-pdf.output(pdf_output_path)
+pdf.save(pdf_output_path)
 
 # Display the path of the generated PDF report
 print(f"PDF report generated and saved as: {pdf_output_path}")
+
+# Report how many queries were answered from the result cache
+print(query_cache_report())
+
+# Per-stage timings and the JSON trace (PROFILE=1)
+report_profile()
@@ -1,30 +1,28 @@
-from fpdf import FPDF
-import matplotlib.pyplot as plt
-import pandas as pd
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
 import os
+import sys
 
-# Load environment variables from .env file
-load_dotenv()
+# Make the shared analytics package importable when running this script directly
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
-# Database connection details from environment variables
-db_host = os.getenv('DB_HOST')
-db_port = os.getenv('DB_PORT')
-db_user = os.getenv('DB_USER')
-db_password = os.getenv('DB_PASSWORD')
-db_name = os.getenv('DB_NAME')
+from analytics.db import get_engine, read_sql, use_snapshot
+from analytics.metrics import booking_eps, seat_metrics, with_seat_metrics
+from analytics.partials import incremental, refresh_partials, rollup
+from analytics.profiling import report_profile
+from analytics.query_builder import period_predicate
+from analytics.query_cache import query_cache_report
+from analytics.rendering import render_figures
+from analytics.report import ReportBuilder, chart_format
+from analytics.sketches import KllSketch, load_sketches
+from analytics.snapshot import load_snapshot, with_date_parts
+from analytics.streaming import GroupAccumulator, stream_sql
 
-# Create the SQLAlchemy engine
-engine = create_engine(f"mysql+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}")
-
-# Query to fetch the relevant data
-query = """
+# Query to fetch the relevant data; the half-open godate ranges keep the filter index-friendly
+query = f"""
 SELECT
     vehclass_id,
     netprice_usd,
     seats,
-    netprice_usd / seats AS eps,
+    (total_usd - netprice_usd) / seats AS eps,
     YEAR(godate) AS year,
     refund_usd,
     total_usd,
@@ -32,144 +30,200 @@ SELECT
 FROM
     `12go`.analytic_test_booking
 WHERE
-    YEAR(godate) IN (2019, 2023)
+    {period_predicate('godate', [2019, 2023])}
 """
 
-# Execute the query and save the data into a DataFrame
-df = pd.read_sql(query, engine)
-
-# Group by vehicle class and year for analysis
-grouped = df.groupby(['vehclass_id', 'year']).agg({
-    'eps': 'mean',
+# Aggregations per vehicle class and year used by the charts; EPS (total minus net price per seat,
+# analytics.metrics) is derived from the sums afterwards, so it is seat-weighted whichever way the sums were produced
+aggregations = {
     'netprice_usd': 'sum',
     'seats': 'sum',
     'refund_usd': 'sum',
     'total_usd': 'sum',
     'trip_duration_minutes': 'mean'
-}).reset_index()
+}
+
+# STREAM_CHUNKSIZE enables streaming mode: rows are read through a server-side cursor and
+# folded into running accumulators, so peak memory no longer grows with the number of bookings
+stream_chunksize = int(os.getenv('STREAM_CHUNKSIZE') or 0)
+
+if incremental():
+    # INCREMENTAL=1: per-class sums and means rolled up from the stored (year, month) partials (exact),
+    # and the 2023 EPS distribution merged from their per-partition sketches (approximate)
+    partials = refresh_partials()
+    grouped = rollup(partials.table('vehclass_id'), ['vehclass_id', 'year'], years=[2019, 2023])
+    grouped = grouped.rename(columns={'avg_duration': 'trip_duration_minutes'})[['vehclass_id', 'year'] + list(aggregations)]
+    eps_2023 = partials.eps_sketch(years=[2023])
+elif stream_chunksize and not use_snapshot():
+    by_class_year = GroupAccumulator(['vehclass_id', 'year'], aggregations)
+    # The 2023 EPS distribution is folded into a KLL sketch, a few KB whatever the number of bookings
+    eps_2023 = KllSketch()
+    # Create the SQLAlchemy engine from the DB_* settings in .env
+    for chunk in stream_sql(query, get_engine(), stream_chunksize):
+        by_class_year.add(chunk)
+        eps_2023.add(chunk.loc[chunk['year'] == 2023, 'eps'])
+
+    grouped = by_class_year.result()
+else:
+    # Execute the query and save the data into a DataFrame
+    if use_snapshot():
+        # Same rows from the local snapshot, reading only the 2019/2023 partitions
+        df = load_snapshot(['vehclass_id', 'netprice_usd', 'seats', 'godate', 'refund_usd', 'total_usd', 'trip_duration_minutes'], years=[2019, 2023])
+        df['eps'] = booking_eps(df)
+        df = with_date_parts(df, 'godate').drop(columns=['godate', 'month'])
+    else:
+        df = read_sql(query, get_engine())
+
+    # Group by vehicle class and year for analysis
+    grouped = df.groupby(['vehclass_id', 'year']).agg(aggregations).reset_index()
+    if use_snapshot():
+        # Stored per-partition sketch of the 2023 partition (refreshed when new parts arrive)
+        eps_2023 = load_sketches(years=[2023], dimensions=['all']).get('all', 'eps') or KllSketch()
+    else:
+        # Every 2023 booking is already in memory, so the histogram is drawn from the exact values
+        eps_2023 = None
+        eps_2023_values = df.loc[df['year'] == 2023, 'eps'].dropna().tolist()
+
+# Seat-weighted EPS per class and year, and per class over both years for the seat efficiency chart
+grouped = with_seat_metrics(grouped, ['eps'])
+seat_efficiency = seat_metrics(grouped, ['vehclass_id'], ['eps']).rename(columns={'eps': 'eps_per_seat'})
+
+# On the incremental, streaming and snapshot paths the EPS histogram is drawn from the sketch's weighted
+# items rather than every booking, so its bin heights are approximate (KLL rank error of a percent or two);
+# the other charts are exact
+eps_2023_hist = {'kind': 'hist', 'bins': 20, 'color': 'skyblue'}
+if eps_2023 is None:
+    eps_2023_hist['x'] = eps_2023_values
+else:
+    eps_2023_values, eps_2023_weights = eps_2023.values_and_weights()
+    eps_2023_hist.update(x=list(eps_2023_values), weights=list(eps_2023_weights))
 
 # Insights and Plots
+# Each chart is described as a figure spec from the aggregated frames and rendered off-screen
+# in a process pool; the PNG bytes go straight into the PDF, nothing is written to the CWD.
+
+# Helper for the per-year series drawn on the vehicle-class charts
+def yearly_series(column, kind, label, **style):
+    series = []
+    for year in [2019, 2023]:
+        subset = grouped[grouped['year'] == year]
+        series.append({'kind': kind, 'x': subset['vehclass_id'].tolist(), 'y': subset[column].tolist(), 'label': f'{label} {year}', **style})
+    return series
+
+chart_specs = []
 
 # 1. EPS by Vehicle Class for 2019 vs 2023
-plt.figure(figsize=(14, 8))
-for year in [2019, 2023]:
-    subset = grouped[grouped['year'] == year]
-    plt.plot(subset['vehclass_id'], subset['eps'], marker='o', label=f'EPS {year}')
-plt.title('EPS by Vehicle Class for 2019 vs 2023')
-plt.xlabel('Vehicle Class ID')
-plt.ylabel('Average EPS')
-plt.legend()
-plt.grid(True)
-plt.savefig("plot_1.png")
-plt.close()
+chart_specs.append({
+    'figsize': (14, 8),
+    'series': yearly_series('eps', 'line', 'EPS', marker='o'),
+    'title': 'EPS by Vehicle Class for 2019 vs 2023',
+    'xlabel': 'Vehicle Class ID',
+    'ylabel': 'EPS (USD per Seat)',
+    'legend': True,
+    'grid': True,
+})
 
 # 2. Total Net Revenue by Vehicle Class
-plt.figure(figsize=(14, 8))
-for year in [2019, 2023]:
-    subset = grouped[grouped['year'] == year]
-    plt.bar(subset['vehclass_id'], subset['netprice_usd'], alpha=0.6, label=f'Total Net Revenue {year}')
-plt.title('Total Net Revenue by Vehicle Class for 2019 vs 2023')
-plt.xlabel('Vehicle Class ID')
-plt.ylabel('Total Net Revenue (USD)')
-plt.legend()
-plt.grid(True)
-plt.savefig("plot_2.png")
-plt.close()
+chart_specs.append({
+    'figsize': (14, 8),
+    'series': yearly_series('netprice_usd', 'bar', 'Total Net Revenue', alpha=0.6),
+    'title': 'Total Net Revenue by Vehicle Class for 2019 vs 2023',
+    'xlabel': 'Vehicle Class ID',
+    'ylabel': 'Total Net Revenue (USD)',
+    'legend': True,
+    'grid': True,
+})
 
 # 3. Seat Occupancy Comparison between 2019 and 2023
-plt.figure(figsize=(14, 8))
-for year in [2019, 2023]:
-    subset = grouped[grouped['year'] == year]
-    plt.bar(subset['vehclass_id'], subset['seats'], alpha=0.6, label=f'Seats {year}')
-plt.title('Seat Occupancy by Vehicle Class for 2019 vs 2023')
-plt.xlabel('Vehicle Class ID')
-plt.ylabel('Total Seats')
-plt.legend()
-plt.grid(True)
-plt.savefig("plot_3.png")
-plt.close()
+chart_specs.append({
+    'figsize': (14, 8),
+    'series': yearly_series('seats', 'bar', 'Seats', alpha=0.6),
+    'title': 'Seat Occupancy by Vehicle Class for 2019 vs 2023',
+    'xlabel': 'Vehicle Class ID',
+    'ylabel': 'Total Seats',
+    'legend': True,
+    'grid': True,
+})
 
 # 4. Refund Impact on Net Revenue by Vehicle Class
 grouped['net_revenue_after_refund'] = grouped['netprice_usd'] - grouped['refund_usd']
-plt.figure(figsize=(14, 8))
-for year in [2019, 2023]:
-    subset = grouped[grouped['year'] == year]
-    plt.bar(subset['vehclass_id'], subset['net_revenue_after_refund'], alpha=0.6, label=f'Net Revenue After Refund {year}')
-plt.title('Net Revenue After Refund by Vehicle Class for 2019 vs 2023')
-plt.xlabel('Vehicle Class ID')
-plt.ylabel('Net Revenue After Refund (USD)')
-plt.legend()
-plt.grid(True)
-plt.savefig("plot_4.png")
-plt.close()
+chart_specs.append({
+    'figsize': (14, 8),
+    'series': yearly_series('net_revenue_after_refund', 'bar', 'Net Revenue After Refund', alpha=0.6),
+    'title': 'Net Revenue After Refund by Vehicle Class for 2019 vs 2023',
+    'xlabel': 'Vehicle Class ID',
+    'ylabel': 'Net Revenue After Refund (USD)',
+    'legend': True,
+    'grid': True,
+})
 
 # 5. EPS Growth Comparison between 2019 and 2023
 grouped['eps_growth'] = grouped.groupby('vehclass_id')['eps'].pct_change().fillna(0)
 eps_growth = grouped[grouped['year'] == 2023][['vehclass_id', 'eps_growth']]
-plt.figure(figsize=(14, 8))
-plt.bar(eps_growth['vehclass_id'], eps_growth['eps_growth'])
-plt.title('EPS Growth by Vehicle Class from 2019 to 2023')
-plt.xlabel('Vehicle Class ID')
-plt.ylabel('EPS Growth (%)')
-plt.grid(True)
-plt.savefig("plot_5.png")
-plt.close()
+chart_specs.append({
+    'figsize': (14, 8),
+    'series': [{'kind': 'bar', 'x': eps_growth['vehclass_id'].tolist(), 'y': eps_growth['eps_growth'].tolist()}],
+    'title': 'EPS Growth by Vehicle Class from 2019 to 2023',
+    'xlabel': 'Vehicle Class ID',
+    'ylabel': 'EPS Growth (%)',
+    'grid': True,
+})
 
 # 6. Average Trip Duration by Vehicle Class
-plt.figure(figsize=(14, 8))
-for year in [2019, 2023]:
-    subset = grouped[grouped['year'] == year]
-    plt.plot(subset['vehclass_id'], subset['trip_duration_minutes'], marker='o', label=f'Average Trip Duration {year}')
-plt.title('Average Trip Duration by Vehicle Class for 2019 vs 2023')
-plt.xlabel('Vehicle Class ID')
-plt.ylabel('Average Trip Duration (Minutes)')
-plt.legend()
-plt.grid(True)
-plt.savefig("plot_6.png")
-plt.close()
-
-# 7. Seat Usage Efficiency (EPS per Seat) by Vehicle Class
-seat_efficiency = df.groupby('vehclass_id').apply(lambda x: (x['netprice_usd'] / x['seats']).mean()).reset_index(name='eps_per_seat')
-plt.figure(figsize=(14, 8))
-plt.bar(seat_efficiency['vehclass_id'], seat_efficiency['eps_per_seat'])
-plt.title('Seat Usage Efficiency (EPS per Seat) by Vehicle Class')
-plt.xlabel('Vehicle Class ID')
-plt.ylabel('EPS per Seat (USD)')
-plt.grid(True)
-plt.savefig("plot_7.png")
-plt.close()
+chart_specs.append({
+    'figsize': (14, 8),
+    'series': yearly_series('trip_duration_minutes', 'line', 'Average Trip Duration', marker='o'),
+    'title': 'Average Trip Duration by Vehicle Class for 2019 vs 2023',
+    'xlabel': 'Vehicle Class ID',
+    'ylabel': 'Average Trip Duration (Minutes)',
+    'legend': True,
+    'grid': True,
+})
+
+# 7. Seat Usage Efficiency (EPS over 2019 and 2023) by Vehicle Class
+chart_specs.append({
+    'figsize': (14, 8),
+    'series': [{'kind': 'bar', 'x': seat_efficiency['vehclass_id'].tolist(), 'y': seat_efficiency['eps_per_seat'].tolist()}],
+    'title': 'Seat Usage Efficiency (EPS over 2019 and 2023) by Vehicle Class',
+    'xlabel': 'Vehicle Class ID',
+    'ylabel': 'EPS (USD per Seat)',
+    'grid': True,
+})
 
 # 8. Top 3 Vehicle Classes Contributing to the Highest EPS in 2023
 top_eps_classes = grouped[grouped['year'] == 2023].nlargest(3, 'eps')
-plt.figure(figsize=(14, 8))
-plt.bar(top_eps_classes['vehclass_id'], top_eps_classes['eps'], color='green')
-plt.title('Top 3 Vehicle Classes Contributing to the Highest EPS in 2023')
-plt.xlabel('Vehicle Class ID')
-plt.ylabel('Average EPS')
-plt.grid(True)
-plt.savefig("plot_8.png")
-plt.close()
+chart_specs.append({
+    'figsize': (14, 8),
+    'series': [{'kind': 'bar', 'x': top_eps_classes['vehclass_id'].tolist(), 'y': top_eps_classes['eps'].tolist(), 'color': 'green'}],
+    'title': 'Top 3 Vehicle Classes Contributing to the Highest EPS in 2023',
+    'xlabel': 'Vehicle Class ID',
+    'ylabel': 'EPS (USD per Seat)',
+    'grid': True,
+})
 
 # 9. Distribution of EPS by Vehicle Class in 2023
-plt.figure(figsize=(14, 8))
-plt.hist(df[df['year'] == 2023]['eps'], bins=20, color='skyblue')
-plt.title('Distribution of EPS by Vehicle Class in 2023')
-plt.xlabel('EPS')
-plt.ylabel('Frequency')
-plt.grid(True)
-plt.savefig("plot_9.png")
-plt.close()
+chart_specs.append({
+    'figsize': (14, 8),
+    'series': [eps_2023_hist],
+    'title': 'Distribution of EPS by Vehicle Class in 2023',
+    'xlabel': 'EPS per Booking (USD per Seat)',
+    'ylabel': 'Frequency',
+    'grid': True,
+})
 
 # 10. Revenue Contribution by Vehicle Class
 revenue_contribution = grouped.groupby('vehclass_id')['total_usd'].sum().reset_index()
-plt.figure(figsize=(14, 8))
-plt.bar(revenue_contribution['vehclass_id'], revenue_contribution['total_usd'], color='purple')
-plt.title('Revenue Contribution by Vehicle Class')
-plt.xlabel('Vehicle Class ID')
-plt.ylabel('Total Revenue (USD)')
-plt.grid(True)
-plt.savefig("plot_10.png")
-plt.close()
+chart_specs.append({
+    'figsize': (14, 8),
+    'series': [{'kind': 'bar', 'x': revenue_contribution['vehclass_id'].tolist(), 'y': revenue_contribution['total_usd'].tolist(), 'color': 'purple'}],
+    'title': 'Revenue Contribution by Vehicle Class',
+    'xlabel': 'Vehicle Class ID',
+    'ylabel': 'Total Revenue (USD)',
+    'grid': True,
+})
+
+# Render all charts in parallel, in chart order
+chart_images = render_figures(chart_specs, fmt=chart_format())
 
 # Summary of insights
 insights = [
@@ -179,39 +233,45 @@ insights = [
     "4. Refunds significantly impact net revenue in some vehicle classes.",
     "5. EPS growth from 2019 to 2023 shows certain classes have improved while others may have declined.",
     "6. Average trip duration by vehicle class indicates which classes might be preferred for longer or shorter trips.",
-    "7. Seat usage efficiency (EPS per seat) varies, indicating potential for optimizing seat allocation.",
+    "7. Seat usage efficiency (EPS over both years) varies, indicating potential for optimizing seat allocation.",
     "8. The top 3 vehicle classes for EPS in 2023 provide a benchmark for other classes.",
-    "9. Distribution of EPS by vehicle class in 2023 helps understand how EPS is spread across classes.",
+    "9. Distribution of EPS by vehicle class in 2023 helps understand how EPS is spread across classes" +
+    ("." if eps_2023 is None else " (drawn from a quantile sketch, so bin heights are approximate)."),
     "10. Revenue contribution by vehicle class gives insight into which classes are the most profitable."
 ]
 
 # Initialize PDF
-pdf = FPDF()
+pdf = ReportBuilder()
 
 # Add a title page
 pdf.add_page()
-pdf.set_font("Arial", 'B', 16)
-pdf.cell(200, 10, txt="Hypothesis Testing: Impact of Vehicle Class on EPS", ln=True, align='C')
+pdf.set_font("Helvetica", 'B', 16)
+pdf.cell(200, 10, text="Hypothesis Testing: Impact of Vehicle Class on EPS", new_x="LMARGIN", new_y="NEXT", align='C')
 
 # Add a page for insights
 pdf.add_page()
-pdf.set_font("Arial", size=12)
-pdf.cell(0, 10, txt="Insights Summary:", ln=True)
+pdf.set_font("Helvetica", size=12)
+pdf.cell(0, 10, text="Insights Summary:", new_x="LMARGIN", new_y="NEXT")
 pdf.ln(10)
-pdf.set_font("Arial", size=10)
+pdf.set_font("Helvetica", size=10)
 
 for i, insight in enumerate(insights, 1):
     pdf.multi_cell(0, 10, f"{i}. {insight}")
     pdf.ln(5)
 
-# Save each plot as an image and add to the PDF
-for i in range(1, 11):
-    image_path = f"plot_{i}.png"
+# Add each rendered chart to the PDF straight from memory
+for image in chart_images:
     pdf.add_page()
-    pdf.image(image_path, x=10, y=30, w=190)
+    pdf.add_chart(image, x=10, y=30, w=190)
 
 # Output the PDF
 pdf_output_path = "hypothesis_testing_results.pdf"
-pdf.output(pdf_output_path)
+pdf.save(pdf_output_path)
 
 print(f"PDF saved as {pdf_output_path}")
+
+# Report how many queries were answered from the result cache
+print(query_cache_report())
+
+# Per-stage timings and the JSON trace (PROFILE=1)
+report_profile()
@@ -47,7 +47,7 @@ SELECT
     vehclass_id,
     netprice_usd,
     seats,
-    netprice_usd / seats AS eps,
+    (total_usd - netprice_usd) / seats AS eps,
     YEAR(godate) AS year,
     refund_usd,
     total_usd,
@@ -64,7 +64,7 @@ WHERE
 SELECT
     vehclass_id,
     year,
-    AVG(eps) AS avg_eps,
+    (SUM(total_usd) - SUM(netprice_usd)) / NULLIF(SUM(seats), 0) AS avg_eps,
     SUM(netprice_usd) AS total_net_revenue,
     SUM(seats) AS total_seats,
     SUM(refund_usd) AS total_refunds,
@@ -76,7 +76,7 @@ FROM
         vehclass_id,
         netprice_usd,
         seats,
-        netprice_usd / seats AS eps,
+        (total_usd - netprice_usd) / seats AS eps,
         YEAR(godate) AS year,
         refund_usd,
         total_usd,
@@ -108,7 +108,7 @@ FROM
         SELECT
             vehclass_id,
             YEAR(godate) AS year,
-            AVG(netprice_usd / seats) AS avg_eps
+            (SUM(total_usd) - SUM(netprice_usd)) / NULLIF(SUM(seats), 0) AS avg_eps
         FROM
             `12go`.analytic_test_booking
         WHERE
@@ -124,7 +124,7 @@ FROM
 
 SELECT
     vehclass_id,
-    AVG(netprice_usd / seats) AS avg_eps
+    (SUM(total_usd) - SUM(netprice_usd)) / NULLIF(SUM(seats), 0) AS avg_eps
 FROM
     `12go`.analytic_test_booking
 WHERE
@@ -159,7 +159,7 @@ ORDER BY
 
 SELECT
     vehclass_id,
-    AVG(netprice_usd / seats) AS eps_per_seat
+    (SUM(total_usd) - SUM(netprice_usd)) / NULLIF(SUM(seats), 0) AS eps_per_seat
 FROM
     `12go`.analytic_test_booking
 WHERE
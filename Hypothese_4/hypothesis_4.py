@@ -1,42 +1,71 @@
 import matplotlib.pyplot as plt
 import pandas as pd
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
 import os
+import sys
 from matplotlib.backends.backend_pdf import PdfPages
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Database connection details from environment variables
-db_host = os.getenv('DB_HOST')
-db_port = os.getenv('DB_PORT')
-db_user = os.getenv('DB_USER')
-db_password = os.getenv('DB_PASSWORD')
-db_name = os.getenv('DB_NAME')
-
-# Create the SQLAlchemy engine
-engine = create_engine(f"mysql+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}")
-
-# Function to fetch data from the database
-def fetch_data(query):
-    return pd.read_sql(query, engine)
+# Make the shared analytics package importable when running this script directly
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from analytics.aggregation import (
+    DEFAULT_MEASURES, aggregate_dimensions, aggregate_dimensions_parallel, dimension_grouping_sets, split_by_year,
+)
+from analytics.db import env_flag, read_sql, use_snapshot
+from analytics.dictionary import align_categories, decode, encode_frame
+from analytics.executor import get_pooled_engine, run_queries
+from analytics.mapped import analysis_workers, temporary_mapped
+from analytics.metrics import with_margin
+from analytics.partials import incremental, partial_aggregates, refresh_partials
+from analytics.profiling import profiled, report_profile, span
+from analytics.query_cache import query_cache_report
+from analytics.query_builder import period_predicate
+from analytics.snapshot import load_snapshot, with_date_parts
+from analytics.user_agents import with_user_agent_family
+
+# BATCH_MODE=1 runs headless (e.g. on a worker without a display): pyplot is switched to the
+# non-interactive Agg backend and charts are never shown, so pages go straight to the vector PDF
+# backend without any on-screen raster rendering
+batch_mode = env_flag('BATCH_MODE')
+if batch_mode:
+    plt.switch_backend('Agg')
+
+YEARS = [2019, 2023]
+
+# Dimensions compared year over year in the "Top 5" charts
+DIMENSIONS = [
+    'class_name',
+    'website_language',
+    'user_agent',
+    'from_country_id',
+    'from_station_name',
+    'to_station_name',
+    'createdby_role_id',
+    'channel',
+    'user_origin_country_id',
+]
+
+# Raw user_agent strings are nearly unique, so charts group by the parsed device / OS / browser family
+GROUPING_DIMENSIONS = ['user_agent_family' if d == 'user_agent' else d for d in DIMENSIONS]
 
 # Function to create comparison bar charts with proper y-axis scaling
-def create_comparison_chart(df_2019, df_2023, column, title, xlabel, ylabel):
+@profiled('chart')
+def create_comparison_chart(aggregates, column, title, xlabel, ylabel, value='num_bookings'):
+    df_2019, df_2023 = split_by_year(aggregates[column], YEARS)
+
     # Combine and rank data for consistent comparison
-    combined = pd.concat([df_2019, df_2023]).groupby(column).sum().reset_index()
-    top_combined = combined.nlargest(5, 'num_bookings')
+    combined = pd.concat([df_2019, df_2023]).groupby(column, observed=True)[value].sum()
+    top_combined = combined.nlargest(5)
     
     # Reindex original dataframes to only include top items
-    df_2019_top = df_2019[df_2019[column].isin(top_combined[column])]
-    df_2023_top = df_2023[df_2023[column].isin(top_combined[column])]
+    df_2019_top = df_2019[df_2019[column].isin(top_combined.index)]
+    df_2023_top = df_2023[df_2023[column].isin(top_combined.index)]
     
     # Prepare data for plotting
     comparison = pd.DataFrame({
-        '2019': df_2019_top.groupby(column)['num_bookings'].sum(),
-        '2023': df_2023_top.groupby(column)['num_bookings'].sum()
+        '2019': df_2019_top.groupby(column, observed=True)[value].sum(),
+        '2023': df_2023_top.groupby(column, observed=True)[value].sum()
     }).fillna(0)  # Fill NaN with 0 for better comparison
+    comparison.index = decode(comparison.index)  # Dictionary codes back to labels for the axis
     
     ax = comparison.plot(kind='bar', figsize=(10, 6))
     ax.set_ylim(0, comparison.max().max() * 1.1)  # Set y-axis limits from 0 to slightly above the max value
@@ -46,390 +75,206 @@ def create_comparison_chart(df_2019, df_2023, column, title, xlabel, ylabel):
     plt.grid(True)
     return ax.figure
 
-# Initialize the PDF
-pdf_path = 'comparison_charts.pdf'
-pdf = PdfPages(pdf_path)
-
-# 1. Average Trip Duration in 2019 and 2023
-query_avg_trip_duration = """
+# Fetch every column the charts need, one query per year partition so the partitions
+# are read concurrently; the half-open godate ranges keep each filter index-friendly
+def bookings_query(year):
+    return f"""
 SELECT 
     YEAR(godate) as year, 
-    AVG(trip_duration_minutes) as avg_duration 
+    MONTH(godate) as month, 
+    {', '.join(DIMENSIONS)}, 
+    netprice_usd, 
+    total_usd, 
+    seats, 
+    trip_duration_minutes 
 FROM 
     `12go`.analytic_test_booking 
 WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    year
+    {period_predicate('godate', [year])}
 """
-df_avg_trip_duration = fetch_data(query_avg_trip_duration)
-ax = df_avg_trip_duration.plot(kind='bar', x='year', y='avg_duration', color='lightblue', figsize=(10, 6))
-ax.set_ylim(0, df_avg_trip_duration['avg_duration'].max() * 1.1)  # Adjust y-axis limit
-plt.title('Average Trip Duration in 2019 and 2023')
-plt.xlabel('Year')
-plt.ylabel('Average Trip Duration (Minutes)')
-plt.grid(True)
-pdf.savefig(ax.figure)
-plt.show()
 
-# 2. Top 5 Distribution of Transportation Modes
-query_transport_modes = """
-SELECT 
-    class_name, 
-    COUNT(*) as num_bookings, 
-    YEAR(godate) as year 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    class_name, year
-"""
-df_transport_modes = fetch_data(query_transport_modes)
+# Grouping sets behind the charts: every dimension per year, plus year and month totals
+grouping_sets = dimension_grouping_sets(GROUPING_DIMENSIONS)
+grouping_sets['year'] = ['year']
+grouping_sets['month'] = ['month', 'year']
+
+if incremental():
+    # INCREMENTAL=1: roll the grouping sets up from the stored (year, month) partials,
+    # re-aggregating only the partitions touched since the last run
+    aggregates = partial_aggregates(refresh_partials(), grouping_sets, YEARS)
+else:
+    if use_snapshot():
+        # Same rows from the local snapshot (USE_SNAPSHOT=1), reading only the 2019/2023 partitions
+        df_bookings = load_snapshot(DIMENSIONS + ['godate', 'netprice_usd', 'total_usd', 'seats', 'trip_duration_minutes'], years=YEARS, encode=True)
+        df_bookings = with_date_parts(df_bookings, 'godate')
+        df_bookings = with_user_agent_family(df_bookings)
+    else:
+        # Create the SQLAlchemy engine, with its pool capped at MAX_CONCURRENT_QUERIES connections
+        engine = get_pooled_engine()
+        frames, query_timings = run_queries({f"bookings_{year}": bookings_query(year) for year in YEARS},
+                                            lambda query: read_sql(query, engine))
+        # String dimensions are dictionary-encoded per partition, so grouping runs on integer codes,
+        # and user agents are normalised partition by partition as they arrive; the dictionaries
+        # are built in memory, since these rows do not come from the snapshot
+        frames = align_categories([with_user_agent_family(encode_frame(f, persist=False)) for f in frames.values()])
+        df_bookings = pd.concat(frames, ignore_index=True)
+        print(query_timings.to_string(index=False))
+
+    # EPS is SUM(total_usd - netprice_usd) / SUM(seats), see analytics.metrics
+    df_bookings = with_margin(df_bookings)
+
+    # Aggregate all grouping sets from the one fetched frame. With ANALYSIS_WORKERS > 1 the grouping
+    # sets are spread over worker processes that memory-map the booking columns instead of each
+    # getting a pickled copy of the frame
+    workers = analysis_workers()
+    with span('aggregate', rows=len(df_bookings), workers=workers):
+        if workers > 1:
+            columns = {c for keys in grouping_sets.values() for c in keys} | {c for c, how in DEFAULT_MEASURES.values()}
+            with temporary_mapped(df_bookings, sorted(columns | {'seats'})) as mapped:
+                aggregates = aggregate_dimensions_parallel(mapped, grouping_sets, max_workers=workers)
+        else:
+            aggregates = aggregate_dimensions(df_bookings, grouping_sets)
+
+# Initialize the PDF
+pdf_path = 'comparison_charts.pdf'
+pdf = PdfPages(pdf_path)
+
+# Add a finished chart as a PDF page (timed as a 'savefig' span with PROFILE=1), then release it:
+# pyplot keeps every figure alive until it is closed, so memory stays flat however many charts there are
+def save_page(fig, name):
+    with span('savefig', chart=name):
+        pdf.savefig(fig)
+    if not batch_mode:
+        plt.show()
+    plt.close(fig)
 
-# Split data by year
-df_transport_modes_2019 = df_transport_modes[df_transport_modes['year'] == 2019]
-df_transport_modes_2023 = df_transport_modes[df_transport_modes['year'] == 2023]
+# 1. Average Trip Duration in 2019 and 2023
+with span('chart', chart='chart_1'):
+    df_avg_trip_duration = aggregates['year'].sort_values('year')
+    ax = df_avg_trip_duration.plot(kind='bar', x='year', y='avg_duration', color='lightblue', figsize=(10, 6))
+    ax.set_ylim(0, df_avg_trip_duration['avg_duration'].max() * 1.1)  # Adjust y-axis limit
+    plt.title('Average Trip Duration in 2019 and 2023')
+    plt.xlabel('Year')
+    plt.ylabel('Average Trip Duration (Minutes)')
+    plt.grid(True)
+save_page(ax.figure, 'chart_1')
 
-fig = create_comparison_chart(df_transport_modes_2019, 
-                        df_transport_modes_2023, 
+# 2. Top 5 Distribution of Transportation Modes
+fig = create_comparison_chart(aggregates, 
                         'class_name', 
                         'Top 5 Distribution of Transportation Modes', 
                         'Transport Mode', 'Number of Bookings')
-pdf.savefig(fig)
-plt.show()
+save_page(fig, 'chart_2')
 
 # 3. Top 5 Revenue by Country of Origin
-query_revenue_by_country = """
-SELECT 
-    from_country_id, 
-    SUM(netprice_usd) as total_revenue, 
-    YEAR(godate) as year 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    from_country_id, year
-"""
-df_revenue_by_country = fetch_data(query_revenue_by_country)
-
-# Split data by year
-df_revenue_by_country_2019 = df_revenue_by_country[df_revenue_by_country['year'] == 2019]
-df_revenue_by_country_2023 = df_revenue_by_country[df_revenue_by_country['year'] == 2023]
-
-# Combine and rank data for consistent comparison
-combined_revenue = pd.concat([df_revenue_by_country_2019, df_revenue_by_country_2023]).groupby('from_country_id').sum()
-top_combined_revenue = combined_revenue.nlargest(5, 'total_revenue')
-
-# Reindex original dataframes to only include top items
-df_revenue_by_country_2019_top = df_revenue_by_country_2019[df_revenue_by_country_2019['from_country_id'].isin(top_combined_revenue.index)]
-df_revenue_by_country_2023_top = df_revenue_by_country_2023[df_revenue_by_country_2023['from_country_id'].isin(top_combined_revenue.index)]
-
-# Prepare data for plotting
-comparison_revenue = pd.DataFrame({
-    '2019': df_revenue_by_country_2019_top.groupby('from_country_id')['total_revenue'].sum(),
-    '2023': df_revenue_by_country_2023_top.groupby('from_country_id')['total_revenue'].sum()
-}).fillna(0)  # Fill NaN with 0 for better comparison
-
-ax = comparison_revenue.plot(kind='bar', figsize=(10, 6))
-ax.set_ylim(0, comparison_revenue.max().max() * 1.1)  # Set y-axis limits from 0 to slightly above the max value
-plt.title('Top 5 Revenue by Country of Origin in 2019 and 2023')
-plt.xlabel('Country')
-plt.ylabel('Total Revenue (USD)')
-plt.grid(True)
-pdf.savefig(ax.figure)
-plt.show()
+fig = create_comparison_chart(aggregates, 
+                        'from_country_id', 
+                        'Top 5 Revenue by Country of Origin in 2019 and 2023', 
+                        'Country', 'Total Revenue (USD)', 
+                        value='total_revenue')
+save_page(fig, 'chart_3')
 
 # 4. Top 5 Language Preferences Comparison
-query_language_prefs = """
-SELECT 
-    website_language, 
-    COUNT(*) as num_bookings, 
-    YEAR(godate) as year 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    website_language, year
-"""
-df_language_prefs = fetch_data(query_language_prefs)
-
-# Split data by year
-df_language_prefs_2019 = df_language_prefs[df_language_prefs['year'] == 2019]
-df_language_prefs_2023 = df_language_prefs[df_language_prefs['year'] == 2023]
-
-fig = create_comparison_chart(df_language_prefs_2019, 
-                        df_language_prefs_2023, 
+fig = create_comparison_chart(aggregates, 
                         'website_language', 
                         'Top 5 Language Preferences Comparison', 
                         'Language', 'Number of Bookings')
-pdf.savefig(fig)
-plt.show()
+save_page(fig, 'chart_4')
 
-# 5. Top 5 User Agents Comparison
-query_user_agents = """
-SELECT 
-    user_agent, 
-    COUNT(*) as num_bookings, 
-    YEAR(godate) as year 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    user_agent, year
-"""
-df_user_agents = fetch_data(query_user_agents)
-
-# Split data by year
-df_user_agents_2019 = df_user_agents[df_user_agents['year'] == 2019]
-df_user_agents_2023 = df_user_agents[df_user_agents['year'] == 2023]
-
-fig = create_comparison_chart(df_user_agents_2019, 
-                        df_user_agents_2023, 
-                        'user_agent', 
-                        'Top 5 User Agents in 2019 and 2023', 
+# 5. Top 5 User Agent Families Comparison
+fig = create_comparison_chart(aggregates, 
+                        'user_agent_family', 
+                        'Top 5 User Agents (Device / OS / Browser) in 2019 and 2023', 
                         'User Agent', 'Number of Bookings')
-pdf.savefig(fig)
-plt.show()
+save_page(fig, 'chart_5')
 
 # 6. Top 5 Countries Comparison
-query_top_countries = """
-SELECT 
-    from_country_id, 
-    COUNT(*) as num_bookings, 
-    YEAR(godate) as year 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    from_country_id, year
-"""
-df_top_countries = fetch_data(query_top_countries)
-
-# Split data by year
-df_top_countries_2019 = df_top_countries[df_top_countries['year'] == 2019]
-df_top_countries_2023 = df_top_countries[df_top_countries['year'] == 2023]
-
-fig = create_comparison_chart(df_top_countries_2019, 
-                        df_top_countries_2023, 
+fig = create_comparison_chart(aggregates, 
                         'from_country_id', 
                         'Top 5 Countries in 2019 and 2023', 
                         'Country', 'Number of Bookings')
-pdf.savefig(fig)
-plt.show()
+save_page(fig, 'chart_6')
 
 # 7. Top 5 From Station Name Comparison
-query_from_station_names = """
-SELECT 
-    from_station_name, 
-    COUNT(*) as num_bookings, 
-    YEAR(godate) as year 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    from_station_name, year
-"""
-df_from_station_names = fetch_data(query_from_station_names)
-
-# Split data by year
-df_from_station_names_2019 = df_from_station_names[df_from_station_names['year'] == 2019]
-df_from_station_names_2023 = df_from_station_names[df_from_station_names['year'] == 2023]
-
-fig = create_comparison_chart(df_from_station_names_2019, 
-                        df_from_station_names_2023, 
+fig = create_comparison_chart(aggregates, 
                         'from_station_name', 
                         'Top 5 From Station Names in 2019 and 2023', 
                         'Station Name', 'Number of Bookings')
-pdf.savefig(fig)
-plt.show()
+save_page(fig, 'chart_7')
 
 # 8. Top 5 To Station Name Comparison
-query_to_station_names = """
-SELECT 
-    to_station_name, 
-    COUNT(*) as num_bookings, 
-    YEAR(godate) as year 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    to_station_name, year
-"""
-df_to_station_names = fetch_data(query_to_station_names)
-
-# Split data by year
-df_to_station_names_2019 = df_to_station_names[df_to_station_names['year'] == 2019]
-df_to_station_names_2023 = df_to_station_names[df_to_station_names['year'] == 2023]
-
-fig = create_comparison_chart(df_to_station_names_2019, 
-                        df_to_station_names_2023, 
+fig = create_comparison_chart(aggregates, 
                         'to_station_name', 
                         'Top 5 To Station Names in 2019 and 2023', 
                         'Station Name', 'Number of Bookings')
-pdf.savefig(fig)
-plt.show()
+save_page(fig, 'chart_8')
 
 # 9. Average Monthly Orders Count for 2019 and 2023
-query_monthly_orders = """
-SELECT 
-    MONTH(godate) as month, 
-    COUNT(*) as num_orders, 
-    YEAR(godate) as year 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    month, year
-"""
-df_monthly_orders = fetch_data(query_monthly_orders)
+df_monthly_orders = aggregates['month']
 
 # Pivot the data for better visualization
-ax = df_monthly_orders.pivot(index='month', columns='year', values='num_orders').plot(kind='bar', figsize=(10, 6))
-ax.set_ylim(0, df_monthly_orders['num_orders'].max() * 1.1)  # Adjust y-axis limit
-plt.title('Average Monthly Orders Count in 2019 and 2023')
-plt.xlabel('Month')
-plt.ylabel('Number of Orders')
-plt.grid(True)
-pdf.savefig(ax.figure)
-plt.show()
-
-# 10. Average Monthly EPS for 2019 and 2023
-query_monthly_eps = """
-SELECT 
-    MONTH(godate) as month, 
-    AVG(netprice_usd / seats) as avg_eps, 
-    YEAR(godate) as year 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    month, year
-"""
-df_monthly_eps = fetch_data(query_monthly_eps)
+with span('chart', chart='chart_9'):
+    ax = df_monthly_orders.pivot(index='month', columns='year', values='num_bookings').plot(kind='bar', figsize=(10, 6))
+    ax.set_ylim(0, df_monthly_orders['num_bookings'].max() * 1.1)  # Adjust y-axis limit
+    plt.title('Average Monthly Orders Count in 2019 and 2023')
+    plt.xlabel('Month')
+    plt.ylabel('Number of Orders')
+    plt.grid(True)
+save_page(ax.figure, 'chart_9')
+
+# 10. Monthly EPS for 2019 and 2023
+df_monthly_eps = aggregates['month']
 
 # Pivot the data for better visualization
-ax = df_monthly_eps.pivot(index='month', columns='year', values='avg_eps').plot(kind='bar', figsize=(10, 6))
-ax.set_ylim(0, df_monthly_eps['avg_eps'].max() * 1.1)  # Adjust y-axis limit
-plt.title('Average Monthly EPS in 2019 and 2023')
-plt.xlabel('Month')
-plt.ylabel('Average EPS')
-plt.grid(True)
-pdf.savefig(ax.figure)
-plt.show()
+with span('chart', chart='chart_10'):
+    ax = df_monthly_eps.pivot(index='month', columns='year', values='avg_eps').plot(kind='bar', figsize=(10, 6))
+    ax.set_ylim(0, df_monthly_eps['avg_eps'].max() * 1.1)  # Adjust y-axis limit
+    plt.title('Monthly EPS in 2019 and 2023')
+    plt.xlabel('Month')
+    plt.ylabel('EPS (USD per Seat)')
+    plt.grid(True)
+save_page(ax.figure, 'chart_10')
 
 # 11. Top 5 Created By Role ID Comparison
-query_createdby_role = """
-SELECT 
-    createdby_role_id, 
-    COUNT(*) as num_bookings, 
-    YEAR(godate) as year 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    createdby_role_id, year
-"""
-df_createdby_role = fetch_data(query_createdby_role)
-
-# Split data by year
-df_createdby_role_2019 = df_createdby_role[df_createdby_role['year'] == 2019]
-df_createdby_role_2023 = df_createdby_role[df_createdby_role['year'] == 2023]
-
-fig = create_comparison_chart(df_createdby_role_2019, 
-                        df_createdby_role_2023, 
+fig = create_comparison_chart(aggregates, 
                         'createdby_role_id', 
                         'Top 5 Created By Role ID in 2019 and 2023', 
                         'Role ID', 'Number of Bookings')
-pdf.savefig(fig)
-plt.show()
+save_page(fig, 'chart_11')
 
 # 12. Top 5 Channels Comparison
-query_channel = """
-SELECT 
-    channel, 
-    COUNT(*) as num_bookings, 
-    YEAR(godate) as year 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    channel, year
-"""
-df_channel = fetch_data(query_channel)
-
-# Split data by year
-df_channel_2019 = df_channel[df_channel['year'] == 2019]
-df_channel_2023 = df_channel[df_channel['year'] == 2023]
-
-fig = create_comparison_chart(df_channel_2019, 
-                        df_channel_2023, 
+fig = create_comparison_chart(aggregates, 
                         'channel', 
                         'Top 5 Channels in 2019 and 2023', 
                         'Channel', 'Number of Bookings')
-pdf.savefig(fig)
-plt.show()
+save_page(fig, 'chart_12')
 
 # 13. Top 5 User Origin Country Comparison
-query_user_origin_country = """
-SELECT 
-    user_origin_country_id, 
-    COUNT(*) as num_bookings, 
-    YEAR(godate) as year 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    user_origin_country_id, year
-"""
-df_user_origin_country = fetch_data(query_user_origin_country)
-
-# Split data by year
-df_user_origin_country_2019 = df_user_origin_country[df_user_origin_country['year'] == 2019]
-df_user_origin_country_2023 = df_user_origin_country[df_user_origin_country['year'] == 2023]
-
-fig = create_comparison_chart(df_user_origin_country_2019, 
-                        df_user_origin_country_2023, 
+fig = create_comparison_chart(aggregates, 
                         'user_origin_country_id', 
                         'Top 5 User Origin Countries in 2019 and 2023', 
                         'Country', 'Number of Bookings')
-pdf.savefig(fig)
-plt.show()
+save_page(fig, 'chart_13')
 
 # 14. Total Order Count Comparison between 2019 and 2023
-query_order_count = """
-SELECT 
-    YEAR(godate) as year, 
-    COUNT(*) as total_orders 
-FROM 
-    `12go`.analytic_test_booking 
-WHERE 
-    YEAR(godate) IN (2019, 2023)
-GROUP BY 
-    year
-"""
-df_order_count = fetch_data(query_order_count)
-ax = df_order_count.plot(kind='bar', x='year', y='total_orders', color='purple', figsize=(10, 6))
-ax.set_ylim(0, df_order_count['total_orders'].max() * 1.1)  # Adjust y-axis limit
-plt.title('Total Order Count Comparison between 2019 and 2023')
-plt.xlabel('Year')
-plt.ylabel('Total Orders')
-plt.grid(True)
-pdf.savefig(ax.figure)
-plt.show()
+with span('chart', chart='chart_14'):
+    df_order_count = aggregates['year'].sort_values('year').rename(columns={'num_bookings': 'total_orders'})
+    ax = df_order_count.plot(kind='bar', x='year', y='total_orders', color='purple', figsize=(10, 6))
+    ax.set_ylim(0, df_order_count['total_orders'].max() * 1.1)  # Adjust y-axis limit
+    plt.title('Total Order Count Comparison between 2019 and 2023')
+    plt.xlabel('Year')
+    plt.ylabel('Total Orders')
+    plt.grid(True)
+save_page(ax.figure, 'chart_14')
 
 # Close the PDF file
-pdf.close()
+with span('pdf.close', path=pdf_path):
+    pdf.close()
 
 print(f"All charts have been generated and saved in {pdf_path}.")
+
+# Report how many queries were answered from the result cache
+print(query_cache_report())
+
+# Per-stage timings and the JSON trace (PROFILE=1)
+report_profile()
@@ -179,7 +179,7 @@ GROUP BY
 SELECT
     MONTH(godate) AS month,
     YEAR(godate) AS year,
-    AVG(netprice_usd / seats) AS avg_eps
+    (SUM(total_usd) - SUM(netprice_usd)) / NULLIF(SUM(seats), 0) AS avg_eps
 FROM
     `12go`.analytic_test_booking
 WHERE
@@ -0,0 +1 @@
+# Shared building blocks for the Hypothese_* report scripts
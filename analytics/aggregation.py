@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+from analytics.metrics import group_codes, group_count, group_sum, per_seat
+
+# Measures computed for every grouping set: output column -> (source column, aggregation)
+# 'size' counts rows like COUNT(*), 'count' non-NULL values like COUNT(column); 'sum' and 'mean'
+# skip NULLs like SQL SUM()/AVG(); 'per_seat' is SUM(column) / SUM(seats) (NaN without seats),
+# so avg_eps over margin_usd (analytics.metrics.with_margin) is the seat-weighted EPS defined in analytics.metrics
+DEFAULT_MEASURES = {
+    'num_bookings': ('netprice_usd', 'size'),
+    'total_revenue': ('netprice_usd', 'sum'),
+    'avg_eps': ('margin_usd', 'per_seat'),
+    'avg_duration': ('trip_duration_minutes', 'mean'),
+}
+
+
+def aggregate_measure(df, codes, groups, column, how):
+    if how == 'size':
+        return np.bincount(codes, minlength=groups)
+    if how == 'count':
+        return group_count(codes, df[column].to_numpy(), groups)
+    sums = group_sum(codes, df[column], groups)
+    if how == 'sum':
+        return sums.astype('int64') if df[column].dtype.kind in 'iub' else sums
+    if how == 'mean':
+        return per_seat(sums, group_count(codes, df[column].to_numpy(), groups))
+    if how == 'per_seat':
+        return per_seat(sums, group_sum(codes, df['seats'], groups))
+    raise ValueError(f"Unknown aggregation {how!r}")
+
+
+# Aggregate one row-level frame into every grouping set in a single call.
+# grouping_sets maps a name to the list of key columns, e.g. {'channel': ['channel', 'year']}.
+# The frame is fetched once, so the database is scanned once no matter how many
+# dimensions are reported on. Each set is one hash of its keys into integer group codes,
+# then one np.bincount per measure.
+def aggregate_dimensions(df, grouping_sets, measures=None):
+    measures = measures or DEFAULT_MEASURES
+    measures = {
+        name: (column, how) for name, (column, how) in measures.items()
+        if column in df.columns and (how != 'per_seat' or 'seats' in df.columns)
+    }
+
+    results = {}
+    for name, keys in grouping_sets.items():
+        # NULL keys are kept as their own group, matching SQL GROUP BY
+        codes, result = group_codes(df, keys)
+        for measure, (column, how) in measures.items():
+            result[measure] = aggregate_measure(df, codes, len(result), column, how)
+        results[name] = result
+    return results
+
+
+def _aggregate_set(mapped, grouping_set):
+    name, keys, measures = grouping_set
+    columns = list(dict.fromkeys(keys + [column for column, how in measures.values()] + ['seats']))
+    return aggregate_dimensions(mapped.frame(columns), {name: keys}, measures)[name]
+
+
+# aggregate_dimensions over a MappedFrame (analytics.mapped), one grouping set per worker process.
+# Workers map the booking arrays read-only instead of each receiving a pickled copy of the frame,
+# and only the small aggregates travel back.
+def aggregate_dimensions_parallel(mapped, grouping_sets, measures=None, max_workers=None):
+    from analytics.mapped import map_workers
+
+    measures = {
+        name: (column, how) for name, (column, how) in (measures or DEFAULT_MEASURES).items()
+        if column in mapped.columns and (how != 'per_seat' or 'seats' in mapped.columns)
+    }
+    items = [(name, list(keys), measures) for name, keys in grouping_sets.items()]
+    return dict(zip(grouping_sets, map_workers(_aggregate_set, mapped, items, max_workers)))
+
+
+# Build the usual "<dimension> x year" grouping sets for a list of dimensions
+def dimension_grouping_sets(dimensions, year_column='year'):
+    return {dimension: [dimension, year_column] for dimension in dimensions}
+
+
+# One row per index value and one column per value and year, e.g. order_count_2019 / order_count_2023 per month
+def year_columns(df, index, values, years, year_column='year'):
+    values = [values] if isinstance(values, str) else list(values)
+    wide = df[df[year_column].isin(years)].pivot_table(index=index, columns=year_column, values=values, aggfunc='sum')
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([values, years]))
+    wide.columns = [f"{value}_{year}" for value, year in wide.columns]
+    return wide.reset_index()
+
+
+# Split an aggregate into one frame per year, in the order the years are given
+def split_by_year(df, years, year_column='year'):
+    return [df[df[year_column] == year] for year in years]
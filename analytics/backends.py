@@ -0,0 +1,156 @@
+import os
+import re
+import sqlite3
+
+import pandas as pd
+from sqlalchemy import create_engine, event
+
+# Pluggable SQL backends, switched with DB_BACKEND in .env:
+#   mysql   the remote replica from the DB_* settings (default)
+#   duckdb  an embedded, vectorised DuckDB over the local Parquet snapshot (SNAPSHOT_DIR); the
+#           `12go`.analytic_test_booking view reads the part files directly, nothing is copied
+#   sqlite  an embedded SQLite database: SQLITE_PATH (a directory laid out like the benchmark
+#           datasets), or else a copy of the snapshot kept under <SNAPSHOT_DIR>/sqlite/
+# Every backend is a SQLAlchemy engine, so read_sql, stream_sql, the executor and the runner work
+# unchanged; the report SQL is written for MySQL and translated on the fly just before execution:
+# backtick-quoted identifiers become "double-quoted", IFNULL() becomes COALESCE(), YEAR()/MONTH()/
+# QUARTER() are native in DuckDB and registered as functions in SQLite, and DuckDB is set to return
+# NULL on division by zero like MySQL. SQLite still divides integers as integers, so ratios of
+# counts (hypothesis_1.sql) are only exact on DuckDB.
+BACKENDS = ['mysql', 'duckdb', 'sqlite']
+BOOKING_TABLE_NAME = 'analytic_test_booking'
+SCHEMA = '12go'
+
+STRING_LITERAL = re.compile(r"('(?:[^'\\]|\\.|'')*')")
+BACKTICK_IDENTIFIER = re.compile(r'`([^`]*)`')
+IFNULL = re.compile(r'\bIFNULL\s*\(', re.IGNORECASE)
+
+
+def db_backend():
+    backend = (os.getenv('DB_BACKEND') or 'mysql').strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown DB_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+    return backend
+
+
+# Rewrite MySQL-only syntax for an embedded backend, leaving string literals untouched
+def translate_sql(query, backend):
+    if backend == 'mysql':
+        return query
+    parts = STRING_LITERAL.split(query)
+    for i in range(0, len(parts), 2):
+        part = BACKTICK_IDENTIFIER.sub(r'"\1"', parts[i])
+        parts[i] = IFNULL.sub('COALESCE(', part)
+    return ''.join(parts)
+
+
+def translate_statements(engine, backend):
+    @event.listens_for(engine, 'before_cursor_execute', retval=True)
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        return translate_sql(statement, backend), parameters
+
+    return engine
+
+
+# --- DuckDB over the Parquet snapshot ---
+
+def duckdb_engine(path=None, **kwargs):
+    from analytics.snapshot import partition_files, snapshot_dir
+
+    directory = snapshot_dir(path)
+    if not partition_files(directory):
+        raise FileNotFoundError(f"No snapshot found in {directory}; run `python -m analytics.snapshot` first")
+    pattern = os.path.join(directory, 'year=*', 'part-*.parquet').replace("'", "''")
+    engine = create_engine('duckdb:///:memory:', **kwargs)
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.execute('SET ieee_floating_point_ops = false')
+        dbapi_connection.execute(f"ATTACH ':memory:' AS \"{SCHEMA}\"")
+        dbapi_connection.execute(
+            f"CREATE VIEW \"{SCHEMA}\".{BOOKING_TABLE_NAME} AS "
+            f"SELECT * FROM read_parquet('{pattern}', union_by_name = true, hive_partitioning = false)"
+        )
+
+    return translate_statements(engine, 'duckdb')
+
+
+# --- SQLite ---
+
+def sqlite_paths(path):
+    return os.path.join(path, 'main.sqlite'), os.path.join(path, f"{SCHEMA}.sqlite")
+
+
+def year_of(value):
+    return int(value[:4]) if value else None
+
+
+def month_of(value):
+    return int(value[5:7]) if value else None
+
+
+def quarter_of(value):
+    return (int(value[5:7]) - 1) // 3 + 1 if value else None
+
+
+# Register the MySQL date functions the report SQL uses and attach the `12go` schema
+def prepare_connection(connection, path):
+    connection.create_function('YEAR', 1, year_of, deterministic=True)
+    connection.create_function('MONTH', 1, month_of, deterministic=True)
+    connection.create_function('QUARTER', 1, quarter_of, deterministic=True)
+    connection.execute(f"ATTACH DATABASE '{sqlite_paths(path)[1]}' AS \"{SCHEMA}\"")
+
+
+# SQLAlchemy engine over a SQLite stand-in, usable wherever the MySQL engine is
+def sqlite_engine(path, **kwargs):
+    engine = create_engine(f"sqlite:///{sqlite_paths(path)[0]}", **kwargs)
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        prepare_connection(dbapi_connection, path)
+
+    return translate_statements(engine, 'sqlite')
+
+
+# Copy the snapshot into SQLite (dates as text, as MySQL returns them), redone when its watermark moves
+def sqlite_from_snapshot(path=None):
+    from analytics.query_cache import snapshot_watermark
+    from analytics.snapshot import partition_files, snapshot_dir
+
+    directory = os.path.join(snapshot_dir(path), 'sqlite')
+    main_path, table_path = sqlite_paths(directory)
+    stamp_path = os.path.join(directory, 'watermark')
+    watermark = snapshot_watermark(path)
+    if os.path.exists(table_path) and os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            if f.read() == str(watermark):
+                return directory
+
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{table_path}.{os.getpid()}.tmp"
+    connection = sqlite3.connect(tmp_path)
+    try:
+        for part_file in partition_files(path):
+            chunk = pd.read_parquet(part_file)
+            for column in chunk.select_dtypes('datetime').columns:
+                chunk[column] = chunk[column].dt.strftime('%Y-%m-%d %H:%M:%S')
+            chunk.to_sql(BOOKING_TABLE_NAME, connection, if_exists='append', index=False)
+        for column in ('paidon', 'godate', 'refund_date'):
+            connection.execute(f"CREATE INDEX idx_{column} ON {BOOKING_TABLE_NAME} ({column})")
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, table_path)
+    sqlite3.connect(main_path).close()
+    with open(stamp_path, 'w') as f:
+        f.write(str(watermark))
+    return directory
+
+
+# Engine for an embedded backend; pool sizing is a MySQL concern and is dropped
+def embedded_engine(backend, **kwargs):
+    for option in ('pool_size', 'max_overflow', 'pool_pre_ping'):
+        kwargs.pop(option, None)
+    if backend == 'duckdb':
+        return duckdb_engine(**kwargs)
+    return sqlite_engine(os.getenv('SQLITE_PATH') or sqlite_from_snapshot(), **kwargs)
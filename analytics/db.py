@@ -0,0 +1,76 @@
+import os
+
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+# Load environment variables from .env file
+load_dotenv()
+
+BOOKING_TABLE = '`12go`.analytic_test_booking'
+
+# Column list of analytic_test_booking, as selected in Hypothese_4/hypothesis_4.sql
+BOOKING_COLUMNS = [
+    'bid', 'paidon', 'paygate_code', 'status_id', 'seller_id', 'operator_id', 'class_id', 'class_name',
+    'from_id', 'from_province_id', 'from_country_id', 'from_station_name',
+    'to_id', 'to_province_id', 'to_country_id', 'to_station_name',
+    'seats', 'vehclass_id', 'godate', 'trip_duration_minutes', 'payment_currency', 'cust_id',
+    'website_language', 'stamp', 'createdby', 'createdby_role_id', 'createdon', 'createdon_date',
+    'refund_date', 'refund_usd', 'netprice_usd', 'sysfee_usd', 'agfee_usd', 'total_usd',
+    'sysfee_total_usd', 'agfee_total_usd', 'netprice_total_usd',
+    'channel', 'user_agent', 'useragent', 'referer', 'landing', 'user_origin_country_id',
+]
+
+
+# Create the SQLAlchemy engine from the DB_* settings in .env;
+# DB_BACKEND=duckdb or sqlite returns an embedded engine over the local snapshot instead
+def get_engine(**kwargs):
+    from analytics.backends import db_backend, embedded_engine
+
+    backend = db_backend()
+    if backend != 'mysql':
+        return embedded_engine(backend, **kwargs)
+    db_host = os.getenv('DB_HOST')
+    db_port = os.getenv('DB_PORT')
+    db_user = os.getenv('DB_USER')
+    db_password = os.getenv('DB_PASSWORD')
+    db_name = os.getenv('DB_NAME')
+    return create_engine(f"mysql+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}", **kwargs)
+
+
+# Read a boolean switch such as USE_SNAPSHOT=1 from the environment
+def env_flag(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Whether the reports should read from the local snapshot instead of the live DB
+def use_snapshot():
+    return env_flag('USE_SNAPSHOT')
+
+
+# Function to fetch data from the database; parameterised queries use :name placeholders.
+# Whole-frame reads go through the query result cache (QUERY_CACHE=0 disables it);
+# chunked reads stream straight from the database.
+# With PROFILE=1 each whole-frame read is a 'fetch' span (cache hits included) with its rows and
+# in-memory size, and the database round trip inside it a 'sql' span.
+def read_sql(query, engine, params=None, **kwargs):
+    from analytics.profiling import frame_bytes, span
+    from analytics.query_cache import get_query_cache, normalize_sql
+
+    def fetch():
+        with span('sql'):
+            if params:
+                return pd.read_sql(text(query), engine, params=params, **kwargs)
+            return pd.read_sql(query, engine, **kwargs)
+
+    cache = get_query_cache()
+    if kwargs.get('chunksize'):
+        return fetch()
+    with span('fetch', query=normalize_sql(query)[:120]) as s:
+        df = fetch() if cache is None else cache.read_sql(query, fetch, params)
+        if s.enabled:
+            s.set(rows=len(df), bytes=frame_bytes(df))
+    return df
@@ -0,0 +1,188 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from analytics.db import get_engine, read_sql, use_snapshot
+from analytics.dictionary import decode
+from analytics.eps_cube import CUBE_DIMENSIONS, get_cube
+from analytics.metrics import SEAT_METRICS, as_float, group_codes, group_sum, per_seat
+from analytics.yoy import route_year_totals_query
+
+# EPS change between two years split into mix and rate effects down a dimension hierarchy.
+# Within a parent segment p, a child i has seat share w_i = seats_i / seats_p and rate r_i (its EPS),
+# so EPS_p = sum(w_i * r_i). The change of EPS_p splits exactly (midpoint method) into
+#   mix_i  = (w_i,target - w_i,base) * (r_i,base + r_i,target) / 2     seats moving between children
+#   rate_i = (r_i,target - r_i,base) * (w_i,base + w_i,target) / 2     EPS moving within a child
+# A child's rate effect is the change of its own EPS weighted by its average share, so it is in turn
+# decomposed over the next level; scaled by the average shares of all its ancestors, every
+# contribution is in units of the top-level EPS and the contributions of the children of a node add
+# up to that node's rate effect. Segments sold in only one year have no rate effect (their EPS counts
+# from the year they were sold in) and are not drilled into.
+# Drill-down is lazy: only nodes whose rate effect is at least `threshold` of the gross top-level
+# movement (sum of |mix| + |rate| over the first level) are expanded, and each level only groups the
+# rows under expanded nodes, so a few hot branches are followed down to route level without
+# decomposing hundreds of thousands of other routes.
+HIERARCHY = [['from_country_id'], ['vehclass_id'], ['class_name'], ['from_station_name', 'to_station_name']]
+HIERARCHY_COLUMNS = [c for level in HIERARCHY for c in level]
+DEFAULT_THRESHOLD = 0.05
+
+
+# Per-row numerator of a per-seat metric (see analytics.metrics.SEAT_METRICS)
+def metric_numerator(df, metric):
+    plus, minus = SEAT_METRICS[metric]
+    return sum(as_float(df[c]) for c in plus) - sum((as_float(df[c]) for c in minus), np.zeros(len(df)))
+
+
+# Mix and rate effects of children against their parents; arrays are per child, parents by index
+def split_effects(seats, numerator, parent_seats, parent):
+    shares = [per_seat(seats[y], parent_seats[y][parent]) for y in (0, 1)]
+    rates = [per_seat(numerator[y], seats[y]) for y in (0, 1)]
+    # A child missing from one year takes its EPS from the other year, so it only has a mix effect
+    base_rate = np.where(np.isnan(rates[0]), rates[1], rates[0])
+    target_rate = np.where(np.isnan(rates[1]), rates[0], rates[1])
+    base_rate, target_rate = np.nan_to_num(base_rate), np.nan_to_num(target_rate)
+    base_share, target_share = np.nan_to_num(shares[0]), np.nan_to_num(shares[1])
+    mix = (target_share - base_share) * (base_rate + target_rate) / 2
+    rate = (target_rate - base_rate) * (base_share + target_share) / 2
+    return mix, rate, (base_share + target_share) / 2, shares, rates
+
+
+# Decompose the change of a per-seat metric between base and target.
+# df holds a year column, every column of the hierarchy and the additive sums of the metric
+# (cube cells, EpsCube.rollup output or route totals), per row or pre-aggregated.
+# Returns one row per node in tree order: level 0 is the total, whose contribution is the actual change.
+def decompose_eps(df, base=2019, target=2023, hierarchy=None, metric='eps',
+                  threshold=DEFAULT_THRESHOLD, max_depth=None, year_column='year'):
+    hierarchy = hierarchy or HIERARCHY
+    max_depth = min(max_depth or len(hierarchy), len(hierarchy))
+    columns = [c for level in hierarchy for c in level]
+    df = df[df[year_column].isin([base, target])].reset_index(drop=True)
+
+    years = df[year_column].to_numpy()
+    row_seats = as_float(df['seats'])
+    row_numerator = metric_numerator(df, metric)
+    masks = [years == base, years == target]
+
+    # Level 0: the total, one node that is always expanded
+    seats = [np.array([np.nansum(row_seats[m])]) for m in masks]
+    numerator = [np.array([np.nan_to_num(row_numerator[m]).sum()]) for m in masks]
+    total_eps = [per_seat(numerator[y], seats[y])[0] for y in (0, 1)]
+    total = {'level': 0, 'node': 0, 'parent': -1, f"seats_{base}": seats[0][0], f"seats_{target}": seats[1][0],
+             f"EPS_{base}": total_eps[0], f"EPS_{target}": total_eps[1], f"share_{base}": 1.0,
+             f"share_{target}": 1.0, 'expanded': True}
+    total['contribution'] = total_eps[1] - total_eps[0]
+
+    node_of_row = np.zeros(len(df), dtype=np.intp)
+    parent_ids = np.array([0])
+    expanded = np.array([True])
+    scale = np.array([1.0])
+    ranks = pd.DataFrame(index=range(1))
+    cutoff = None
+    levels = []
+    next_node = 1
+
+    for depth, level in enumerate(hierarchy[:max_depth], start=1):
+        active = np.flatnonzero(expanded[node_of_row])
+        if not len(active):
+            break
+        rows = df.iloc[active][level].reset_index(drop=True)
+        rows.insert(0, '_parent', node_of_row[active])
+        codes, keys = group_codes(rows, ['_parent'] + level)
+        children = len(keys)
+        parent = keys['_parent'].to_numpy()
+
+        child_seats = [group_sum(codes, row_seats[active] * masks[y][active], children) for y in (0, 1)]
+        child_numerator = [group_sum(codes, row_numerator[active] * masks[y][active], children) for y in (0, 1)]
+        mix, rate, weight, shares, rates = split_effects(child_seats, child_numerator, seats, parent)
+        mix, rate = mix * scale[parent], rate * scale[parent]
+
+        if cutoff is None:
+            cutoff = threshold * (np.abs(mix).sum() + np.abs(rate).sum())
+        expand = (child_seats[0] > 0) & (child_seats[1] > 0) & (np.abs(rate) >= cutoff) & (depth < max_depth)
+
+        # Order siblings by the size of their contribution; the rank path puts every node after its parent
+        order = np.lexsort((-np.abs(mix + rate), parent))
+        rank = np.empty(children, dtype=np.intp)
+        rank[order] = np.arange(children) - np.searchsorted(parent[order], parent[order])
+        node_ranks = ranks.iloc[parent].reset_index(drop=True)
+        node_ranks[f"_rank{depth}"] = rank
+
+        nodes = keys.drop(columns='_parent')
+        nodes.insert(0, 'level', depth)
+        nodes.insert(1, 'node', np.arange(next_node, next_node + children))
+        nodes.insert(2, 'parent', parent_ids[parent])
+        nodes[f"seats_{base}"], nodes[f"seats_{target}"] = child_seats
+        nodes[f"EPS_{base}"], nodes[f"EPS_{target}"] = rates
+        nodes[f"share_{base}"], nodes[f"share_{target}"] = shares
+        nodes['mix'] = mix
+        nodes['rate'] = rate
+        nodes['contribution'] = mix + rate
+        nodes['expanded'] = expand
+        levels.append(pd.concat([nodes, node_ranks], axis=1))
+
+        parent_ids = nodes['node'].to_numpy()
+        next_node += children
+        node_of_row = np.full(len(df), -1, dtype=np.intp)
+        node_of_row[active] = codes
+        node_of_row = np.where(node_of_row >= 0, node_of_row, children)
+        expanded = np.append(expand, False)
+        scale = scale[parent] * weight
+        seats, ranks = child_seats, node_ranks
+
+    total['mix'] = levels[0]['mix'].sum() if levels else 0.0
+    total['rate'] = levels[0]['rate'].sum() if levels else 0.0
+    result = pd.concat([pd.DataFrame([total])] + levels, ignore_index=True)
+    rank_columns = [c for c in result.columns if c.startswith('_rank')]
+    result = result.sort_values(rank_columns, na_position='first', kind='stable', ignore_index=True)
+    ordered = ['level', 'node', 'parent'] + [c for c in columns if c in result.columns] + [
+        f"seats_{base}", f"seats_{target}", f"share_{base}", f"share_{target}",
+        f"EPS_{base}", f"EPS_{target}", 'mix', 'rate', 'contribution', 'expanded']
+    return result[ordered]
+
+
+# Decomposition from the EPS cube: one roll-up to year x hierarchy, then lazy drill-down over it
+def cube_decomposition(cube, base=2019, target=2023, hierarchy=None, **kwargs):
+    columns = [c for level in (hierarchy or HIERARCHY) for c in level]
+    dimensions = ['year'] + [d for d in CUBE_DIMENSIONS if d in columns]
+    return decompose_eps(cube.rollup(dimensions, years=[base, target]), base, target, hierarchy, **kwargs)
+
+
+def fetch_decomposition(engine, base=2019, target=2023, quarters=None, **kwargs):
+    totals = read_sql(route_year_totals_query([base, target], quarters, dimensions=HIERARCHY_COLUMNS), engine)
+    return decompose_eps(totals, base, target, **kwargs)
+
+
+# Readable tree: one label per node from its own level's columns, indented by level
+def decomposition_labels(result, hierarchy=None):
+    hierarchy = hierarchy or HIERARCHY
+    decoded = decode(result)
+    labels = pd.Series('Total', index=result.index, dtype=object)
+    for depth, level in enumerate(hierarchy, start=1):
+        at_level = (result['level'] == depth).to_numpy()
+        if at_level.any() and set(level) <= set(decoded.columns):
+            text = decoded.loc[at_level, level].astype(str).agg(' -> '.join, axis=1)
+            labels[at_level] = '  ' * depth + text
+    return labels
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Split the EPS change between two years into mix and rate effects.')
+    parser.add_argument('--base', type=int, default=2019)
+    parser.add_argument('--target', type=int, default=2023)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='expand nodes whose rate effect is at least this share of the gross movement')
+    parser.add_argument('--depth', type=int, help=f"levels to drill into, at most {len(HIERARCHY)}")
+    parser.add_argument('--metric', default='eps', choices=sorted(SEAT_METRICS),
+                        help='per-seat metric (the SQL route totals only carry eps and netprice_per_seat)')
+    args = parser.parse_args()
+
+    options = dict(metric=args.metric, threshold=args.threshold, max_depth=args.depth)
+    if use_snapshot():
+        result = cube_decomposition(get_cube(), args.base, args.target, **options)
+    else:
+        result = fetch_decomposition(get_engine(), args.base, args.target, **options)
+    result.insert(0, 'segment', decomposition_labels(result))
+    pd.set_option('display.width', 200)
+    print(result[['segment', f"EPS_{args.base}", f"EPS_{args.target}", f"share_{args.base}", f"share_{args.target}",
+                  'mix', 'rate', 'contribution', 'expanded']].to_string(index=False))
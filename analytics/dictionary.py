@@ -0,0 +1,131 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from analytics.snapshot import snapshot_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, each process still keeps its own dictionaries consistent
+    fcntl = None
+
+# Integer dictionary encoding for high-cardinality string dimensions.
+# Each column gets an append-only dictionary stored next to the snapshot, where a label's code is its
+# position, so codes stay stable across refreshes and runs:
+#   <SNAPSHOT_DIR>/dictionaries/from_station_name.parquet
+# Encoded columns are pandas Categoricals over the full dictionary (int8/int16/int32 codes), which makes
+# groupby and isin work on integers; labels are only decoded when a chart or table needs them.
+# Several runs can extend the dictionaries of one snapshot: the load, extend and save of encode_frame
+# happen under an exclusive lock on dictionaries/dictionaries.lock, so no run drops another's labels.
+# Frames read from the live database are encoded in memory (persist=False) and never touch the snapshot.
+ENCODED_COLUMNS = [
+    'class_name', 'website_language', 'user_agent', 'from_station_name', 'to_station_name',
+    'channel', 'payment_currency',
+]
+
+_dictionary_lock = threading.Lock()
+
+
+def dictionary_path(column, path=None):
+    return os.path.join(snapshot_dir(path), 'dictionaries', f"{column}.parquet")
+
+
+# Held by one thread of one process at a time while the dictionaries are read and extended
+@contextmanager
+def _locked_dictionaries(path=None):
+    lock_dir = os.path.join(snapshot_dir(path), 'dictionaries')
+    os.makedirs(lock_dir, exist_ok=True)
+    with _dictionary_lock, open(os.path.join(lock_dir, 'dictionaries.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_dictionary(column, path=None):
+    file_path = dictionary_path(column, path)
+    if not os.path.exists(file_path):
+        return pd.Index([], dtype=object)
+    return pd.Index(pd.read_parquet(file_path)['label'].astype(object))
+
+
+def save_dictionary(column, labels, path=None):
+    file_path = dictionary_path(column, path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pd.DataFrame({'label': labels.astype(object)}).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, file_path)
+
+
+# Append labels not seen before; existing codes never change. NULL is not a label (code -1).
+def extend_dictionary(labels, values):
+    seen = pd.unique(values.categories if isinstance(values, pd.Categorical) else np.asarray(values, dtype=object))
+    new = pd.Index(seen).dropna().difference(labels, sort=False)
+    if new.empty:
+        return labels
+    return labels.append(new.astype(object))
+
+
+# Encode values (or a Categorical with any categories) against a dictionary
+def encode_values(values, labels):
+    if isinstance(values, pd.Categorical):
+        codes = np.append(labels.get_indexer(values.categories), -1)[values.codes]
+    else:
+        codes = labels.get_indexer(np.asarray(values, dtype=object))
+    return pd.Categorical.from_codes(codes, categories=labels)
+
+
+# Replace the dictionary columns of df by Categoricals, extending and persisting the dictionaries as needed.
+# With persist=False each column is encoded against its own labels only, without reading or writing files.
+def encode_frame(df, columns=None, path=None, persist=True):
+    columns = [c for c in (columns or ENCODED_COLUMNS) if c in df.columns]
+    if not persist:
+        for column in columns:
+            values = df[column].array if isinstance(df[column].dtype, pd.CategoricalDtype) else df[column]
+            df[column] = encode_values(values, extend_dictionary(pd.Index([], dtype=object), values))
+        return df
+    with _locked_dictionaries(path):
+        for column in columns:
+            values = df[column].array if isinstance(df[column].dtype, pd.CategoricalDtype) else df[column]
+            labels = load_dictionary(column, path)
+            extended = extend_dictionary(labels, values)
+            if len(extended) != len(labels):
+                save_dictionary(column, extended, path)
+            df[column] = encode_values(values, extended)
+    return df
+
+
+# Give every frame's encoded columns the same categories, the union of the frames' own in order of
+# appearance, so concat keeps them categorical and no label of any frame is lost.
+# Frames encoded against one dictionary share a prefix of it, so this never remaps existing codes.
+def align_categories(frames, columns=None):
+    columns = columns or ENCODED_COLUMNS
+    for column in columns:
+        encoded = [f for f in frames if column in f.columns and isinstance(f[column].dtype, pd.CategoricalDtype)]
+        if not encoded:
+            continue
+        labels = pd.Index([], dtype=object)
+        for f in encoded:
+            labels = extend_dictionary(labels, f[column].array)
+        for f in encoded:
+            f[column] = f[column].cat.set_categories(labels)
+    return frames
+
+
+# Back to plain labels for charts and text: a decoded copy of a frame, or labels of a Series/Index
+def decode(values):
+    if isinstance(values, pd.DataFrame):
+        values = values.copy()
+        for column in values.columns:
+            if isinstance(values[column].dtype, pd.CategoricalDtype):
+                values[column] = values[column].astype(object)
+        return values
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.astype(object)
+    return values
@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+
+import pandas as pd
+
+from analytics.db import BOOKING_TABLE, get_engine, read_sql
+from analytics.dictionary import encode_frame
+from analytics.metrics import per_seat
+from analytics.query_cache import snapshot_watermark
+from analytics.snapshot import load_snapshot, refresh_snapshot, snapshot_dir
+
+# Pre-aggregated EPS cube over the bookings, by year of paidon like hypothesis_2.sql / hypothesis_3.sql.
+# Only additive measures are stored, at the finest grain of the dimensions below, so any roll-up
+# (e.g. vehclass_id x class_name x year, or a route) is answered by summing cells instead of
+# rescanning bookings, and EPS = (SUM(total_usd) - SUM(netprice_usd)) / SUM(seats) is derived afterwards.
+#   <SNAPSHOT_DIR>/eps_cube.parquet   (finest-grain cells)
+#   <SNAPSHOT_DIR>/eps_cube.json      (snapshot watermark the cells were built at)
+CUBE_DIMENSIONS = ['year', 'from_country_id', 'vehclass_id', 'class_name', 'from_station_name', 'to_station_name']
+CUBE_MEASURES = ['bookings', 'seats', 'netprice_usd', 'total_usd', 'sysfee_usd', 'agfee_usd', 'refund_usd']
+
+ROUTE_DIMENSIONS = ['from_station_name', 'to_station_name', 'vehclass_id', 'class_name']
+
+CUBE_QUERY = f"""
+SELECT
+    YEAR(paidon) AS year,
+    from_country_id,
+    vehclass_id,
+    class_name,
+    from_station_name,
+    to_station_name,
+    COUNT(*) AS bookings,
+    SUM(seats) AS seats,
+    SUM(netprice_usd) AS netprice_usd,
+    SUM(total_usd) AS total_usd,
+    SUM(sysfee_usd) AS sysfee_usd,
+    SUM(agfee_usd) AS agfee_usd,
+    SUM(refund_usd) AS refund_usd
+FROM
+    {BOOKING_TABLE}
+GROUP BY
+    YEAR(paidon), from_country_id, vehclass_id, class_name, from_station_name, to_station_name
+"""
+
+
+def cube_paths(path=None):
+    path = snapshot_dir(path)
+    return os.path.join(path, 'eps_cube.parquet'), os.path.join(path, 'eps_cube.json')
+
+
+# Sum measures per group; NULL keys are kept as their own group like SQL GROUP BY does
+def sum_cells(df, dimensions):
+    if not dimensions:
+        return df[CUBE_MEASURES].sum().to_frame().T
+    return df.groupby(dimensions, dropna=False, observed=True, sort=False)[CUBE_MEASURES].sum().reset_index()
+
+
+# Finest-grain cells from row-level bookings (the snapshot or a fetched chunk)
+def booking_cells(bookings):
+    df = pd.DataFrame({d: bookings[d] for d in CUBE_DIMENSIONS if d != 'year'})
+    df['year'] = pd.to_datetime(bookings['paidon'], errors='coerce').dt.year
+    df['bookings'] = 1
+    for measure in CUBE_MEASURES[1:]:
+        df[measure] = bookings[measure].fillna(0)
+    return sum_cells(df, CUBE_DIMENSIONS)
+
+
+# EPS from additive sums; NULL (NaN) where a group has no seats, as MySQL returns for x / 0
+def with_eps(df):
+    margin = df['total_usd'].to_numpy(dtype='float64') - df['netprice_usd'].to_numpy(dtype='float64')
+    df['EPS'] = per_seat(margin, df['seats'])
+    return df
+
+
+class EpsCube:
+    def __init__(self, cells=None, watermark=None, path=None):
+        self.cells = cells if cells is not None else pd.DataFrame(columns=CUBE_DIMENSIONS + CUBE_MEASURES)
+        self.watermark = watermark
+        self.path = path
+        self.log = []
+        self._levels = {}
+
+    @classmethod
+    def from_bookings(cls, bookings, watermark=None):
+        return cls(booking_cells(bookings), watermark)
+
+    # Build the cube from the local snapshot, reading only the columns the cells need;
+    # string dimensions stay dictionary-encoded, so cells and roll-ups group on integer codes
+    @classmethod
+    def from_snapshot(cls, path=None):
+        columns = ['paidon'] + CUBE_DIMENSIONS[1:] + CUBE_MEASURES[1:]
+        bookings = load_snapshot(columns=columns, path=path, encode=True)
+        return cls(booking_cells(bookings), snapshot_watermark(path), path)
+
+    # Build the cube with a single GROUP BY on the database
+    @classmethod
+    def from_sql(cls, engine=None):
+        return cls(read_sql(CUBE_QUERY, engine or get_engine()))
+
+    @classmethod
+    def load(cls, path=None):
+        cells_path, meta_path = cube_paths(path)
+        if not os.path.exists(cells_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        return cls(pd.read_parquet(cells_path), meta.get('watermark'), path)
+
+    def save(self, path=None):
+        cells_path, meta_path = cube_paths(path)
+        os.makedirs(os.path.dirname(cells_path), exist_ok=True)
+        self.cells.to_parquet(f"{cells_path}.{os.getpid()}.tmp", index=False)
+        os.replace(f"{cells_path}.{os.getpid()}.tmp", cells_path)
+        with open(f"{meta_path}.{os.getpid()}.tmp", 'w') as f:
+            json.dump({'watermark': self.watermark, 'cells': len(self.cells)}, f, indent=2)
+        os.replace(f"{meta_path}.{os.getpid()}.tmp", meta_path)
+
+    # Incremental maintenance: add the cells of new bookings and subtract the rows they superseded.
+    # Matches the on_change(added, removed) hook of refresh_snapshot.
+    def apply(self, added, removed=None):
+        deltas = [self.cells, booking_cells(added)]
+        if removed is not None and not removed.empty:
+            stale = booking_cells(removed)
+            stale[CUBE_MEASURES] = -stale[CUBE_MEASURES]
+            deltas.append(stale)
+        cells = encode_frame(pd.concat([d for d in deltas if not d.empty], ignore_index=True), path=self.path)
+        cells = sum_cells(cells, CUBE_DIMENSIONS)
+        self.cells = cells[cells['bookings'] != 0].reset_index(drop=True)
+        self._levels = {}
+
+    # Smallest level (fewest cells) whose dimensions cover the requested ones
+    def level_for(self, dimensions):
+        candidates = [(len(cells), level) for level, cells in self._levels.items() if set(dimensions) <= set(level)]
+        if not candidates:
+            return tuple(CUBE_DIMENSIONS)
+        return min(candidates)[1]
+
+    def level_cells(self, level):
+        return self.cells if level == tuple(CUBE_DIMENSIONS) else self._levels[level]
+
+    # Roll the cube up to the given dimensions (optionally only some years) and derive EPS.
+    # Each roll-up is kept as a level for later, coarser queries and logged with the level that served it.
+    def rollup(self, dimensions, years=None):
+        dimensions = list(dimensions)
+        level = [d for d in CUBE_DIMENSIONS if d in dimensions or (d == 'year' and years is not None)]
+        source = self.level_for(level)
+        source_cells = self.level_cells(source)
+
+        if tuple(level) == source:
+            cells = source_cells
+        else:
+            cells = sum_cells(source_cells, level)
+            self._levels[tuple(level)] = cells
+
+        if years is not None:
+            cells = cells[cells['year'].isin(list(years))]
+            if 'year' not in dimensions:
+                cells = sum_cells(cells, dimensions)
+
+        self.log.append({
+            'dimensions': ', '.join(dimensions) or '(total)',
+            'years': ', '.join(str(y) for y in years) if years is not None else 'all',
+            'served_by': 'finest' if source == tuple(CUBE_DIMENSIONS) else ', '.join(source),
+            'cells_scanned': len(source_cells),
+            'rows': len(cells),
+        })
+        return with_eps(cells[dimensions + CUBE_MEASURES].reset_index(drop=True))
+
+    def query_log(self):
+        return pd.DataFrame(self.log, columns=['dimensions', 'years', 'served_by', 'cells_scanned', 'rows'])
+
+
+# Load the stored cube and bring it up to date with the snapshot.
+# A cube built at the current snapshot watermark is updated from the refresh delta only;
+# a missing or out-of-sync cube is rebuilt from the snapshot after refreshing it.
+def refresh_cube(engine=None, path=None):
+    cube = EpsCube.load(path)
+    if cube is not None and cube.watermark is not None and cube.watermark == snapshot_watermark(path):
+        refresh_snapshot(engine, path, on_change=cube.apply)
+        cube.watermark = snapshot_watermark(path)
+    else:
+        refresh_snapshot(engine, path)
+        cube = EpsCube.from_snapshot(path)
+    cube.save(path)
+    return cube
+
+
+# Load the stored cube, building it from the snapshot when there is none yet
+def get_cube(path=None):
+    cube = EpsCube.load(path)
+    if cube is None or cube.watermark != snapshot_watermark(path):
+        cube = EpsCube.from_snapshot(path)
+        cube.save(path)
+    return cube
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refresh the EPS cube and print roll-ups from it.')
+    parser.add_argument('dimensions', nargs='*', help=f"dimensions to roll up to, from {', '.join(CUBE_DIMENSIONS)}")
+    parser.add_argument('--years', type=int, nargs='+')
+    parser.add_argument('--no-refresh', action='store_true', help='use the stored cube without refreshing the snapshot')
+    args = parser.parse_args()
+
+    cube = get_cube() if args.no_refresh else refresh_cube()
+    print(f"EPS cube: {len(cube.cells):,} cells at watermark {cube.watermark}")
+    if args.dimensions or args.years:
+        result = cube.rollup(args.dimensions, years=args.years)
+        print(result.sort_values('EPS', ascending=False).to_string(index=False))
+        print(cube.query_log().to_string(index=False))
@@ -0,0 +1,48 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from analytics.db import get_engine
+
+DEFAULT_MAX_CONCURRENT_QUERIES = 4
+
+
+# Concurrency limit for report queries, from MAX_CONCURRENT_QUERIES in .env
+def max_concurrent_queries():
+    return int(os.getenv('MAX_CONCURRENT_QUERIES') or DEFAULT_MAX_CONCURRENT_QUERIES)
+
+
+# Engine whose connection pool is capped at the concurrency limit, so parallel
+# report queries never open more than max_workers connections to the replica
+def get_pooled_engine(max_workers=None):
+    max_workers = max_workers or max_concurrent_queries()
+    return get_engine(pool_size=max_workers, max_overflow=0, pool_pre_ping=True)
+
+
+def timed_fetch(fetch, query):
+    start = time.perf_counter()
+    df = fetch(query)
+    return df, time.perf_counter() - start
+
+
+# Run independent queries concurrently and collect the DataFrames as they finish.
+# queries maps a name to SQL, fetch(query) returns a DataFrame (e.g. read_sql bound to a pooled engine).
+# Results come back in the order the queries were given, with per-query wall time and row counts.
+def run_queries(queries, fetch, max_workers=None):
+    max_workers = max_workers or max_concurrent_queries()
+    frames = {}
+    timings = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(timed_fetch, fetch, query): name for name, query in queries.items()}
+        for finished, future in enumerate(as_completed(futures), 1):
+            name = futures[future]
+            df, seconds = future.result()
+            frames[name] = df
+            timings.append({'query': name, 'seconds': round(seconds, 3), 'rows': len(df), 'finished': finished})
+
+    frames = {name: frames[name] for name in queries}
+    timings = pd.DataFrame(timings, columns=['query', 'seconds', 'rows', 'finished'])
+    return frames, timings.set_index('query').loc[list(queries)].reset_index()
@@ -0,0 +1,170 @@
+import argparse
+import glob
+import hashlib
+import os
+import re
+
+import pandas as pd
+
+from analytics.db import BOOKING_COLUMNS, get_engine, read_sql
+from analytics.query_builder import period_predicate
+
+# Inspects the hypothesis SQL files, rewrites YEAR(col) filters into sargable ranges
+# and proposes covering composite indexes for analytic_test_booking.
+#   python -m analytics.index_advisor [--explain] [--create-indexes] [files ...]
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_SQL_FILES = os.path.join(REPO_ROOT, 'Hypothese_*', '*.sql')
+
+# MySQL allows at most 16 columns per index
+MAX_INDEX_COLUMNS = 16
+
+YEAR_FILTER = re.compile(r"YEAR\s*\(\s*(\w+)\s*\)\s*(?:=\s*(\d{4})|IN\s*\(([\d\s,]+)\))", re.IGNORECASE)
+WHERE_CLAUSE = re.compile(r"\bWHERE\b(.*?)(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|$)", re.IGNORECASE | re.DOTALL)
+GROUP_BY_CLAUSE = re.compile(r"\bGROUP\s+BY\b(.*?)(?=\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|\)|$)", re.IGNORECASE | re.DOTALL)
+IDENTIFIER = re.compile(r"\b[a-z_][a-z0-9_]*\b")
+
+
+# Split a .sql file into statements, dropping -- comments
+def split_statements(sql_text):
+    without_comments = re.sub(r"--[^\n]*", '', sql_text)
+    return [s.strip() for s in without_comments.split(';') if s.strip()]
+
+
+def booking_columns_in(text):
+    seen = []
+    for name in IDENTIFIER.findall(text):
+        if name in BOOKING_COLUMNS and name not in seen:
+            seen.append(name)
+    return seen
+
+
+# Replace YEAR(col) = N / YEAR(col) IN (...) with half-open range predicates
+def rewrite_sargable(statement):
+    def replace(match):
+        column = match.group(1)
+        years = [int(match.group(2))] if match.group(2) else [int(y) for y in match.group(3).split(',')]
+        return period_predicate(column, years)
+    return YEAR_FILTER.sub(replace, statement)
+
+
+# Work out the filter, grouping and remaining columns a statement reads
+def analyze_statement(statement):
+    where = ' '.join(WHERE_CLAUSE.findall(statement))
+    group_by = ' '.join(GROUP_BY_CLAUSE.findall(statement))
+    filter_columns = booking_columns_in(where)
+    group_columns = [c for c in booking_columns_in(group_by) if c not in filter_columns]
+    other_columns = [c for c in booking_columns_in(statement) if c not in filter_columns + group_columns]
+    return {
+        'filter_columns': filter_columns,
+        'group_columns': group_columns,
+        'other_columns': other_columns,
+        'non_sargable': [m.group(0) for m in YEAR_FILTER.finditer(where)],
+    }
+
+
+# Covering index: range-filter columns lead, then grouping columns, then everything else the query reads.
+# Returns (columns, key_length, covering); the trailing covering columns are sorted since their order does not matter.
+def propose_index(analysis):
+    key = analysis['filter_columns'] + analysis['group_columns']
+    if not key:
+        # A plain full-table read (no WHERE / GROUP BY) gains nothing from an index
+        return (), 0, True
+    columns = key + sorted(analysis['other_columns'])
+    return tuple(columns[:MAX_INDEX_COLUMNS]), len(key), len(columns) <= MAX_INDEX_COLUMNS
+
+
+# Drop proposals served by a wider one: same leading key columns and a subset of its columns
+def deduplicate_indexes(proposals):
+    unique = sorted(set(proposals), key=lambda p: len(p[0]), reverse=True)
+    kept = []
+    for columns, key_length in unique:
+        served = any(other[:key_length] == columns[:key_length] and set(columns) <= set(other) for other, _ in kept)
+        if not served:
+            kept.append((columns, key_length))
+    return [columns for columns, _ in kept]
+
+
+def create_index_sql(columns):
+    name = 'idx_booking_' + '_'.join(columns)
+    if len(name) > 64:
+        # MySQL identifiers are limited to 64 characters
+        name = f"{name[:55]}_{hashlib.md5(name.encode()).hexdigest()[:8]}"
+    return f"CREATE INDEX {name} ON `12go`.analytic_test_booking ({', '.join(columns)});"
+
+
+def explain(engine, statement):
+    try:
+        return read_sql(f"EXPLAIN {statement}", engine)
+    except Exception as error:
+        return pd.DataFrame({'error': [str(error)]})
+
+
+def advise(paths, engine=None, create_indexes=False):
+    findings = []
+    for path in paths:
+        with open(path) as f:
+            statements = split_statements(f.read())
+        for number, statement in enumerate(statements, 1):
+            analysis = analyze_statement(statement)
+            index, key_length, covering = propose_index(analysis)
+            findings.append({
+                'file': os.path.relpath(path, REPO_ROOT),
+                'statement': number,
+                'sql': statement,
+                'rewritten': rewrite_sargable(statement),
+                'index': index,
+                'key_length': key_length,
+                'covering': covering,
+                **analysis,
+            })
+
+    indexes = deduplicate_indexes((f['index'], f['key_length']) for f in findings if f['index'])
+
+    if engine is not None:
+        for finding in findings:
+            finding['explain_before'] = explain(engine, finding['sql'])
+        if create_indexes:
+            with engine.begin() as conn:
+                for index in indexes:
+                    conn.exec_driver_sql(create_index_sql(index))
+        for finding in findings:
+            finding['explain_after'] = explain(engine, finding['rewritten'])
+
+    return findings, indexes
+
+
+def print_report(findings, indexes):
+    for finding in findings:
+        print(f"== {finding['file']} #{finding['statement']}")
+        for predicate in finding['non_sargable']:
+            print(f"   non-sargable filter: {predicate}")
+        if not finding['index']:
+            print('   no index proposed: full-table read')
+        else:
+            print(f"   proposed index: ({', '.join(finding['index'])})"
+                  f"{'' if finding['covering'] else ' [not covering: more than 16 columns]'}")
+        if finding['rewritten'] != finding['sql']:
+            print('   rewritten query:')
+            print('      ' + finding['rewritten'].replace('\n', '\n      '))
+        for label in ('explain_before', 'explain_after'):
+            if label in finding:
+                print(f"   {label.replace('_', ' ').upper()}:")
+                print('      ' + finding[label].to_string(index=False).replace('\n', '\n      '))
+        print()
+
+    print('Proposed indexes:')
+    for index in indexes:
+        print(f"   {create_index_sql(index)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Propose sargable rewrites and covering indexes for the hypothesis SQL files.')
+    parser.add_argument('files', nargs='*', help='SQL files to inspect (default: Hypothese_*/*.sql)')
+    parser.add_argument('--explain', action='store_true', help='run EXPLAIN before and after the rewrite')
+    parser.add_argument('--create-indexes', action='store_true', help='create the proposed indexes before the "after" EXPLAIN')
+    args = parser.parse_args()
+
+    paths = args.files or sorted(glob.glob(DEFAULT_SQL_FILES))
+    engine = get_engine() if args.explain or args.create_indexes else None
+    print_report(*advise(paths, engine, create_indexes=args.create_indexes))
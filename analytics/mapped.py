@@ -0,0 +1,152 @@
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Booking columns as fixed-width arrays that worker processes memory-map read-only.
+# A frame passed to a process pool is pickled into every worker; a MappedFrame pickles as its
+# directory only, and each worker maps the same .npy files, so the pages are shared through the
+# OS page cache instead of copied per worker:
+#   <dir>/manifest.json            rows and one entry per column
+#   <dir>/seats.npy                integers and booleans as is, other numbers as float64 (NULL as NaN)
+#   <dir>/godate.npy               dates as datetime64[ns] (NaT for NULL)
+#   <dir>/class_name.npy           dictionary codes (int8/int16/int32, -1 for NULL) ...
+#   <dir>/class_name.labels.parquet  ... and the labels they index
+# Pandas views are built lazily per column on top of the maps: frame(columns) wraps the arrays
+# without copying them, and the arrays are read-only, so an in-place write fails instead of
+# silently diverging between workers.
+
+
+def mapped_dir():
+    return os.getenv('MAPPED_DIR') or None
+
+
+def analysis_workers():
+    return int(os.getenv('ANALYSIS_WORKERS') or 1)
+
+
+def column_file(directory, column, suffix='.npy'):
+    return os.path.join(directory, f"{column}{suffix}")
+
+
+# Fixed-width array for one column, plus its labels when it is dictionary-encoded
+def column_array(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return 'category', values.cat.codes.to_numpy(), values.cat.categories
+    if values.dtype.kind == 'M':
+        return 'datetime', values.to_numpy(dtype='datetime64[ns]'), None
+    if values.dtype.kind in 'iub' and not values.hasnans:
+        return 'numeric', values.to_numpy(dtype='int64' if values.dtype.kind in 'iu' else bool), None
+    if values.dtype.kind in 'iufb':
+        return 'numeric', values.to_numpy(dtype='float64', na_value=np.nan), None
+    # Plain strings are dictionary-encoded on the way in
+    categorical = values.astype('category')
+    return 'category', categorical.cat.codes.to_numpy(), categorical.cat.categories
+
+
+# Write the columns of df as a new mapped store; the directory appears complete or not at all
+def write_mapped(df, directory, columns=None):
+    columns = [c for c in (columns or df.columns) if c in df.columns]
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.mapped-', dir=parent)
+    try:
+        manifest = {'rows': len(df), 'columns': {}}
+        for column in columns:
+            kind, array, labels = column_array(df[column])
+            np.save(column_file(tmp_dir, column), np.ascontiguousarray(array))
+            if labels is not None:
+                pd.DataFrame({'label': labels.astype(object)}).to_parquet(
+                    column_file(tmp_dir, column, '.labels.parquet'), index=False)
+            manifest['columns'][column] = {'kind': kind, 'dtype': str(array.dtype)}
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(tmp_dir, directory)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return MappedFrame(directory)
+
+
+class MappedFrame:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.rows = manifest['rows']
+        self.kinds = {column: entry['kind'] for column, entry in manifest['columns'].items()}
+        self._arrays = {}
+        self._labels = {}
+
+    # Only the directory crosses the process boundary; workers map the files themselves
+    def __getstate__(self):
+        return {'directory': self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'])
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def columns(self):
+        return list(self.kinds)
+
+    def array(self, column):
+        if column not in self._arrays:
+            self._arrays[column] = np.load(column_file(self.directory, column), mmap_mode='r')
+        return self._arrays[column]
+
+    def labels(self, column):
+        if column not in self._labels:
+            labels = pd.read_parquet(column_file(self.directory, column, '.labels.parquet'))['label']
+            self._labels[column] = pd.Index(labels.astype(object))
+        return self._labels[column]
+
+    def series(self, column):
+        array = self.array(column)
+        if self.kinds[column] == 'category':
+            array = pd.Categorical.from_codes(array, categories=self.labels(column), validate=False)
+        return pd.Series(array, name=column, copy=False)
+
+    # Zero-copy DataFrame over the requested columns
+    def frame(self, columns=None):
+        columns = [c for c in (columns or self.columns) if c in self.kinds]
+        return pd.DataFrame({c: self.series(c) for c in columns}, index=pd.RangeIndex(self.rows), copy=False)
+
+
+# Map df for the duration of a block, in MAPPED_DIR (e.g. /dev/shm) or the system temp directory
+@contextmanager
+def temporary_mapped(df, columns=None):
+    if mapped_dir():
+        os.makedirs(mapped_dir(), exist_ok=True)
+    directory = tempfile.mkdtemp(prefix='mapped-', dir=mapped_dir())
+    try:
+        yield write_mapped(df, os.path.join(directory, 'frame'), columns)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _call(args):
+    func, mapped, item = args
+    return func(mapped, item)
+
+
+# func(mapped, item) for every item in a process pool (in order); serial with one worker
+def map_workers(func, mapped, items, max_workers=None):
+    from analytics.rendering import pool_context
+
+    items = list(items)
+    max_workers = min(max_workers or analysis_workers(), len(items)) if items else 1
+    context = pool_context()
+    if max_workers <= 1 or context is None:
+        return [func(mapped, item) for item in items]
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        return list(pool.map(_call, [(func, mapped, item) for item in items]))
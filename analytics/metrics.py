@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+# One definition of the per-seat metrics for every report, computed from additive sums:
+#   eps                  (SUM(total_usd) - SUM(netprice_usd)) / SUM(seats)   Earn Per Seat, as in hypothesis_2.sql
+#   netprice_per_seat    SUM(netprice_usd) / SUM(seats)              net price paid to the operator per seat
+#   sysfee_per_seat      SUM(sysfee_usd) / SUM(seats)
+#   agfee_per_seat       SUM(agfee_usd) / SUM(seats)
+#   refund_adjusted_eps  (SUM(total_usd) - SUM(netprice_usd) - SUM(refund_usd)) / SUM(seats)
+# Every chart labelled "EPS" uses eps; the per-booking value behind EPS distributions is booking_eps.
+# A per-booking mean such as AVG(netprice_usd / seats) gives a one-seat booking the same weight as
+# a ten-seat one; ratios of sums do not, and they stay correct when partial sums are merged.
+# Groups with no seats get NaN (NULL in SQL) instead of a division error or inf.
+# The kernels work on integer group codes: sums are one np.bincount per column, with no Python loop
+# over groups, and np.add.reduceat serves data that is already sorted by group.
+SEAT_METRICS = {
+    'eps': (['total_usd'], ['netprice_usd']),
+    'netprice_per_seat': (['netprice_usd'], []),
+    'sysfee_per_seat': (['sysfee_usd'], []),
+    'agfee_per_seat': (['agfee_usd'], []),
+    'refund_adjusted_eps': (['total_usd'], ['netprice_usd', 'refund_usd']),
+}
+SEAT_SUM_COLUMNS = ['netprice_usd', 'total_usd', 'sysfee_usd', 'agfee_usd', 'refund_usd', 'seats']
+
+
+def as_float(values):
+    return np.asarray(values, dtype='float64')
+
+
+# numerator / seats with NaN where seats is 0 or missing
+def per_seat(numerator, seats):
+    numerator, seats = as_float(numerator), as_float(seats)
+    result = np.full(np.broadcast(numerator, seats).shape, np.nan)
+    np.divide(numerator, seats, out=result, where=(seats != 0) & ~np.isnan(seats))
+    return result
+
+
+# EPS of every booking, (total_usd - netprice_usd) / seats; for distributions, group EPS comes from the sums
+def booking_eps(df):
+    return per_seat(as_float(df['total_usd']) - as_float(df['netprice_usd']), df['seats'])
+
+
+# Row-level margin column for aggregations that take SUM(margin_usd) / SUM(seats) as EPS
+def with_margin(df):
+    df['margin_usd'] = as_float(df['total_usd']) - as_float(df['netprice_usd'])
+    return df
+
+
+# Plain Python scalar for a key value (None for NULL), e.g. for hashable or JSON group keys
+def python_value(value):
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+# Integer code per row for the groups of keys (NULL keys form their own group, like SQL GROUP BY)
+# and one row of key values per code. With dropna=True rows with a NULL key get code -1 instead.
+def group_codes(df, keys, dropna=False):
+    if not keys:
+        return np.zeros(len(df), dtype=np.intp), pd.DataFrame(index=range(1 if len(df) else 0))
+    codes = df.groupby(keys, dropna=dropna, observed=True, sort=False).ngroup().fillna(-1).to_numpy(dtype=np.intp)
+    valid = np.flatnonzero(codes >= 0)
+    _, first = np.unique(codes[valid], return_index=True)
+    return codes, df[keys].iloc[valid[first]].reset_index(drop=True)
+
+
+# SUM() per group; NULLs add nothing
+def group_sum(codes, values, groups):
+    values = as_float(values)
+    return np.bincount(codes, weights=np.where(np.isnan(values), 0.0, values), minlength=groups)
+
+
+# COUNT(column) per group
+def group_count(codes, values, groups):
+    return np.bincount(codes[pd.notna(values)], minlength=groups)
+
+
+# SUM() over runs of rows already sorted by group; starts are the first row of every run
+def segment_sums(values, starts):
+    values = as_float(values)
+    return np.add.reduceat(np.where(np.isnan(values), 0.0, values), starts) if len(values) else np.zeros(0)
+
+
+# Add every per-seat metric whose sums are present in df (row-level or aggregated)
+def with_seat_metrics(df, metrics=None):
+    for name in metrics or SEAT_METRICS:
+        plus, minus = SEAT_METRICS[name]
+        if 'seats' not in df.columns or not set(plus + minus) <= set(df.columns):
+            continue
+        numerator = sum(as_float(df[c]) for c in plus) - sum((as_float(df[c]) for c in minus), np.zeros(len(df)))
+        df[name] = per_seat(numerator, df['seats'])
+    return df
+
+
+# Sums of the seat columns per group plus the per-seat metrics, e.g. seat_metrics(df, ['vehclass_id', 'year'])
+def seat_metrics(df, keys, metrics=None):
+    codes, groups = group_codes(df, keys)
+    result = groups.copy()
+    result['bookings'] = np.bincount(codes, minlength=len(groups))
+    for column in SEAT_SUM_COLUMNS:
+        if column in df.columns:
+            result[column] = group_sum(codes, df[column], len(groups))
+    return with_seat_metrics(result, metrics)
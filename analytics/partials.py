@@ -0,0 +1,340 @@
+import argparse
+import json
+import os
+
+import pandas as pd
+from sqlalchemy import text
+
+from analytics.aggregation import aggregate_dimensions
+from analytics.db import BOOKING_TABLE, env_flag, get_engine, use_snapshot
+from analytics.metrics import booking_eps, per_seat, python_value
+from analytics.query_builder import partition_predicate
+from analytics.sketches import KllSketch
+from analytics.snapshot import normalize_dates, partition_files, read_manifest
+from analytics.streaming import stream_sql
+
+# Incremental report regeneration (INCREMENTAL=1 in .env).
+# Every measure the reports use is kept as additive partial aggregates per (year, month) of godate,
+# one table per breakdown, under PARTIALS_DIR (default .partials/):
+#   orders, refunds, seats, netprice_usd, total_usd, refund_usd and sum + count of trip duration,
+#   plus a KLL sketch of per-booking EPS per partition for the histograms. Merged sketches are
+#   approximate (a rank error of a percent or two), so EPS histograms drawn from them are close to, but not
+#   bin-for-bin identical with, a full recompute; every other rolled-up number is exact.
+# A refresh asks the source which partitions have rows with a stamp newer than the stored watermark,
+# re-aggregates only those partitions from scratch and swaps them into the stored partials, so the
+# rolled-up numbers are the same as a full recompute. Bookings are assumed never to be deleted or to
+# move to another month; `python -m analytics.partials --full` rebuilds everything.
+DEFAULT_PARTIALS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.partials')
+
+PARTITION_KEYS = ['year', 'month']
+# Bumped whenever a stored column changes meaning, so the partials are rebuilt (2: eps sketches hold the margin per seat)
+PARTIALS_VERSION = 2
+
+BOOKING_DIMENSIONS = [
+    'vehclass_id', 'class_name', 'website_language', 'user_agent', 'from_country_id', 'from_station_name',
+    'to_station_name', 'createdby_role_id', 'channel', 'user_origin_country_id',
+]
+
+# Breakdown name -> dimension columns (besides year and month)
+PARTIAL_TABLES = {'total': [], 'refunds': ['paidon_year', 'refund_year']}
+PARTIAL_TABLES.update({dimension: [dimension] for dimension in BOOKING_DIMENSIONS})
+# Route totals by year of paidon for hypothesis_2 (analytics.yoy.route_year_totals_query)
+ROUTE_COLUMNS = ['from_country_id', 'vehclass_id', 'class_name', 'from_station_name', 'to_station_name']
+PARTIAL_TABLES['route'] = ['paidon_year'] + ROUTE_COLUMNS
+
+PARTIAL_MEASURES = {
+    'orders': ('netprice_usd', 'size'),
+    'refunds': ('is_refund', 'sum'),
+    'seats': ('seats', 'sum'),
+    'netprice_usd': ('netprice_usd', 'sum'),
+    'total_usd': ('total_usd', 'sum'),
+    'refund_usd': ('refund_usd', 'sum'),
+    'trip_duration_sum': ('trip_duration_minutes', 'sum'),
+    'trip_duration_count': ('trip_duration_minutes', 'count'),
+}
+
+SOURCE_COLUMNS = ['godate', 'paidon', 'refund_date', 'seats', 'netprice_usd', 'total_usd', 'refund_usd',
+                  'trip_duration_minutes'] + BOOKING_DIMENSIONS
+
+
+def incremental():
+    return env_flag('INCREMENTAL')
+
+
+def partials_dir(path=None):
+    return path or os.getenv('PARTIALS_DIR') or DEFAULT_PARTIALS_DIR
+
+
+# Integer year or month keys as plain Python ints, None where the date is NULL
+def int_keys(values):
+    return [python_value(v) for v in values.astype('Int64').to_numpy(dtype=object)]
+
+
+# Year/month keys and the derived columns the measures are computed from
+def partition_rows(df):
+    df = normalize_dates(df)
+    return df.assign(
+        year=df['godate'].dt.year.astype('Int64'),
+        month=df['godate'].dt.month.astype('Int64'),
+        paidon_year=df['paidon'].dt.year.astype('Int64'),
+        refund_year=df['refund_date'].dt.year.astype('Int64'),
+        is_refund=df['refund_date'].notna().astype('int64'),
+        eps=booking_eps(df),
+    )
+
+
+# Partial aggregates of one chunk for every breakdown
+def aggregate_partials(df):
+    grouping_sets = {name: PARTITION_KEYS + dimensions for name, dimensions in PARTIAL_TABLES.items()}
+    return aggregate_dimensions(df, grouping_sets, PARTIAL_MEASURES)
+
+
+# Partials are additive, so chunks (and stored partitions) combine with a plain grouped sum
+def combine_partials(frames, keys):
+    frames = [f for f in frames if f is not None and not f.empty]
+    if not frames:
+        return None
+    if len(frames) == 1:
+        return frames[0]
+    df = pd.concat(frames, ignore_index=True)
+    return df.groupby(keys, dropna=False, observed=True, sort=False)[list(PARTIAL_MEASURES)].sum().reset_index()
+
+
+# (year, month) partition of every row, with None for a NULL godate
+def partition_keys(df):
+    return pd.Series(list(zip(int_keys(df['year']), int_keys(df['month']))), index=df.index, dtype=object)
+
+
+def godate_partitions(df):
+    godate = normalize_dates(df)['godate']
+    return partition_keys(pd.DataFrame({'year': godate.dt.year, 'month': godate.dt.month}))
+
+
+# Per-partition EPS sketches, stored as (year, month, payload) rows
+def sketch_partitions(df, sketches):
+    for (year, month), eps in df.groupby(partition_keys(df), sort=False)['eps']:
+        sketches.setdefault((year, month), KllSketch()).add(eps.to_numpy())
+    return sketches
+
+
+# Partials and watermark read from the booking table; the watermark and touched-partition
+# queries go straight to the database, never through the result cache
+class SqlPartialSource:
+    name = 'sql'
+
+    def __init__(self, engine=None, chunksize=100_000):
+        self.engine = engine or get_engine()
+        self.chunksize = chunksize
+
+    def _read(self, query, params=None):
+        with self.engine.connect() as conn:
+            return pd.read_sql(text(query), conn, params=params)
+
+    def watermark(self):
+        stamp = self._read(f"SELECT MAX(stamp) AS stamp FROM {BOOKING_TABLE}")['stamp'].iloc[0]
+        return None if pd.isna(stamp) else str(stamp)
+
+    def touched(self, stamp):
+        df = self._read(f"""
+SELECT DISTINCT YEAR(godate) AS year, MONTH(godate) AS month
+FROM {BOOKING_TABLE}
+WHERE stamp > :stamp
+""", {'stamp': stamp})
+        return sorted(set(zip(int_keys(df['year']), int_keys(df['month']))), key=str)
+
+    def rows(self, partitions=None):
+        query = f"SELECT {', '.join(SOURCE_COLUMNS)} FROM {BOOKING_TABLE}"
+        if partitions is not None:
+            query += f" WHERE {partition_predicate('godate', partitions)}"
+        yield from stream_sql(query, self.engine, self.chunksize)
+
+
+# Same partials from the local snapshot, reading only the year partitions that were touched
+class SnapshotPartialSource:
+    name = 'snapshot'
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def watermark(self):
+        manifest = read_manifest(self.path)
+        return manifest.get('stamp') if manifest else None
+
+    def touched(self, stamp):
+        touched = set()
+        for f in partition_files(self.path):
+            df = pd.read_parquet(f, columns=['godate', 'stamp'])
+            touched.update(godate_partitions(df[pd.to_datetime(df['stamp']) > pd.Timestamp(stamp)]))
+        return sorted(touched, key=str)
+
+    def rows(self, partitions=None):
+        years = None if partitions is None else sorted({y for y, _ in partitions}, key=str)
+        for f in partition_files(self.path, years):
+            df = pd.read_parquet(f, columns=SOURCE_COLUMNS)
+            if partitions is not None:
+                df = df[godate_partitions(df).isin(partitions).to_numpy()]
+            yield df
+
+
+class PartialStore:
+    def __init__(self, path=None):
+        self.path = partials_dir(path)
+        self._tables = {}
+
+    def _file(self, name):
+        return os.path.join(self.path, f"{name}.parquet")
+
+    def read_manifest(self):
+        manifest_path = os.path.join(self.path, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    def write_manifest(self, manifest):
+        manifest_path = os.path.join(self.path, 'manifest.json')
+        tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+    def table(self, name):
+        if name not in self._tables:
+            self._tables[name] = pd.read_parquet(self._file(name))
+        return self._tables[name]
+
+    def eps_sketch(self, years=None):
+        merged = KllSketch()
+        for row in self.table('eps_sketch').itertuples(index=False):
+            if years is None or row.year in years:
+                merged.merge(KllSketch.from_bytes(row.payload))
+        return merged
+
+    def _write(self, name, df):
+        tmp_path = f"{self._file(name)}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self._file(name))
+        self._tables[name] = df
+
+    # Re-aggregate the partitions touched since the stored watermark (all of them on the first run)
+    # and swap them into the stored partials. Returns the refreshed partitions, or None for a full build.
+    def refresh(self, source, full=False):
+        from analytics.profiling import span
+
+        os.makedirs(self.path, exist_ok=True)
+        manifest = self.read_manifest()
+        watermark = source.watermark()
+        complete = all(os.path.exists(self._file(name)) for name in list(PARTIAL_TABLES) + ['eps_sketch'])
+        current = manifest is not None and manifest.get('version') == PARTIALS_VERSION and manifest.get('source') == source.name
+        if full or not complete or not current or manifest.get('stamp') is None:
+            partitions = None
+        else:
+            partitions = source.touched(manifest['stamp'])
+            if not partitions:
+                return []
+
+        with span('partials', partitions='all' if partitions is None else len(partitions)) as s:
+            partials = {name: None for name in PARTIAL_TABLES}
+            sketches = {}
+            rows = 0
+            for chunk in source.rows(partitions):
+                chunk = partition_rows(chunk)
+                for name, df in aggregate_partials(chunk).items():
+                    partials[name] = combine_partials([partials[name], df], PARTITION_KEYS + PARTIAL_TABLES[name])
+                sketch_partitions(chunk, sketches)
+                rows += len(chunk)
+            s.set(rows=rows)
+
+            sketch_rows = pd.DataFrame(
+                [{'year': y, 'month': m, 'payload': sketch.to_bytes()} for (y, m), sketch in sketches.items()],
+                columns=['year', 'month', 'payload'],
+            ).astype({'year': 'Int64', 'month': 'Int64'})
+            for name, df in list(partials.items()) + [('eps_sketch', sketch_rows)]:
+                if df is None:
+                    df = pd.DataFrame(columns=PARTITION_KEYS + PARTIAL_TABLES[name] + list(PARTIAL_MEASURES))
+                if partitions is not None:
+                    stored = self.table(name)
+                    stored = stored[~partition_keys(stored).isin(partitions).to_numpy()]
+                    df = pd.concat([stored, df], ignore_index=True)
+                self._write(name, df.sort_values(PARTITION_KEYS, ignore_index=True))
+
+        self.write_manifest({
+            'version': PARTIALS_VERSION,
+            'source': source.name,
+            'stamp': watermark,
+            'refreshed_at': pd.Timestamp.now().isoformat(),
+            'last_refresh': 'all' if partitions is None else [list(p) for p in partitions],
+        })
+        return partitions
+
+
+def with_means(df):
+    df['avg_eps'] = per_seat(df['total_usd'] - df['netprice_usd'], df['seats'])
+    df['avg_duration'] = df['trip_duration_sum'] / df['trip_duration_count'].where(df['trip_duration_count'] > 0)
+    return df
+
+
+# Sum stored partials up to the given keys (e.g. ['vehclass_id', 'year']) and add the means
+def rollup(partials, keys, years=None):
+    if years is not None:
+        partials = partials[partials['year'].isin(years)]
+    df = partials.groupby(keys, dropna=False, observed=True, sort=True)[list(PARTIAL_MEASURES)].sum().reset_index()
+    for key in PARTITION_KEYS:
+        if key in keys and df[key].notna().all():
+            df[key] = df[key].astype('int64')
+    return with_means(df)
+
+
+# Orders per YEAR(paidon) and refunds per YEAR(refund_date), like fetch_yearly_refunds
+def yearly_refunds(store):
+    from analytics.refunds import yearly_refund_totals
+
+    return yearly_refund_totals(store.table('refunds'))
+
+
+# Route totals per year of paidon, like route_year_totals_query(years, dimensions=ROUTE_COLUMNS)
+def route_year_totals(store, years=None):
+    df = rollup(store.table('route'), ['paidon_year'] + ROUTE_COLUMNS)
+    df = df[df['paidon_year'].notna()].astype({'paidon_year': 'int64'}).rename(columns={'paidon_year': 'year'})
+    if years is not None:
+        df = df[df['year'].isin(years)]
+    return df[['year'] + ROUTE_COLUMNS + ['seats', 'netprice_usd', 'total_usd']].reset_index(drop=True)
+
+
+# Same output as aggregate_dimensions(df, grouping_sets) with DEFAULT_MEASURES, from the partials of each
+# set's dimension ('total' for year / month only sets); 'user_agent_family' is rolled up from user_agent
+def partial_aggregates(store, grouping_sets, years=None):
+    from analytics.user_agents import with_user_agent_family
+
+    results = {}
+    for name, keys in grouping_sets.items():
+        dimensions = [k for k in keys if k not in PARTITION_KEYS]
+        if dimensions == ['user_agent_family']:
+            partials = with_user_agent_family(store.table('user_agent').copy())
+        else:
+            partials = store.table(dimensions[0] if dimensions else 'total')
+        df = rollup(partials, keys, years)
+        results[name] = df.rename(columns={'orders': 'num_bookings', 'netprice_usd': 'total_revenue'})[
+            keys + ['num_bookings', 'total_revenue', 'avg_eps', 'avg_duration']]
+    return results
+
+
+# Bring the partials up to date from the snapshot (USE_SNAPSHOT=1) or the database
+def refresh_partials(engine=None, path=None, full=False):
+    source = SnapshotPartialSource() if use_snapshot() else SqlPartialSource(engine)
+    store = PartialStore(path)
+    partitions = store.refresh(source, full=full)
+    if partitions is None:
+        print("Partials rebuilt for all partitions")
+    else:
+        print(f"Partials refreshed for {len(partitions)} partition(s) touched since the last run")
+    return store
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refresh the per-(year, month) partial aggregates.')
+    parser.add_argument('--full', action='store_true', help='rebuild every partition')
+    args = parser.parse_args()
+
+    store = refresh_partials(full=args.full)
+    print(rollup(store.table('total'), ['year']).to_string(index=False))
@@ -0,0 +1,237 @@
+import contextvars
+import cProfile
+import datetime
+import functools
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import psutil
+
+# Per-stage instrumentation for report runs, switched on with PROFILE=1 in .env.
+#   with span('fetch', query=...) as s:
+#       df = ...
+#       s.set(rows=len(df), bytes=frame_bytes(df))
+#   @profiled('chart')
+#   def create_comparison_chart(...): ...
+# Every span records wall time, rows, bytes, the RSS at its end and the peak RSS while it was open
+# (sampled in the background), and its parent span. At the end of a run report_profile() prints a
+# summary table and writes a JSON trace (Chrome trace-event format, viewable in chrome://tracing or
+# Perfetto) to PROFILE_DIR. With PROFILE_CPROFILE=1 top-level spans on the main thread also dump a
+# cProfile .prof file each.
+SAMPLE_INTERVAL = 0.005
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def rss():
+    return psutil.Process().memory_info().rss
+
+
+class NullSpan:
+    enabled = False
+
+    def set(self, **attrs):
+        pass
+
+
+class Span:
+    enabled = True
+
+    def __init__(self, span_id, name, parent, attrs):
+        self.id = span_id
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.rows = None
+        self.bytes = None
+        self.start = time.perf_counter()
+        self.start_rss = rss()
+        self.peak_rss = self.start_rss
+        self.thread = threading.get_ident()
+
+    def set(self, rows=None, bytes=None, **attrs):
+        if rows is not None:
+            self.rows = rows
+        if bytes is not None:
+            self.bytes = bytes
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    def __init__(self, enabled=False, directory=None, cprofile=False):
+        self.enabled = enabled
+        self.directory = directory or os.getcwd()
+        self.cprofile = cprofile
+        self.records = []
+        self.origin = time.perf_counter()
+        self._ids = itertools.count(1)
+        self._current = contextvars.ContextVar('span', default=None)
+        self._active = set()
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    # Background thread raising the peak RSS of every open span
+    def _sample(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                active = list(self._active)
+            current = rss()
+            for s in active:
+                if current > s.peak_rss:
+                    s.peak_rss = current
+            time.sleep(SAMPLE_INTERVAL)
+
+    def _open(self, s):
+        with self._lock:
+            self._active.add(s)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+
+    def _close(self, s):
+        end_rss = rss()
+        with self._lock:
+            self._active.discard(s)
+            self.records.append({
+                'id': s.id,
+                'parent': s.parent.id if s.parent else None,
+                'name': s.name,
+                'start': round(s.start - self.origin, 6),
+                'seconds': round(time.perf_counter() - s.start, 6),
+                'rows': s.rows,
+                'bytes': s.bytes,
+                'rss_mb': round(end_rss / 1024 / 1024, 1),
+                'peak_rss_mb': round(max(s.peak_rss, end_rss) / 1024 / 1024, 1),
+                'thread': s.thread,
+                'pid': os.getpid(),
+                'attrs': {k: str(v) for k, v in s.attrs.items()},
+            })
+
+    @contextmanager
+    def span(self, name, **attrs):
+        if not self.enabled:
+            yield NullSpan()
+            return
+
+        parent = self._current.get()
+        s = Span(next(self._ids), name, parent, attrs)
+        token = self._current.set(s)
+        profiler = self._start_profiler(s)
+        self._open(s)
+        try:
+            yield s
+        finally:
+            self._close(s)
+            self._current.reset(token)
+            if profiler is not None:
+                self._dump_profile(profiler, s)
+
+    def _start_profiler(self, s):
+        if not self.cprofile or s.parent is not None or threading.current_thread() is not threading.main_thread():
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return None
+        return profiler
+
+    def _dump_profile(self, profiler, s):
+        profiler.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        label = re.sub(r'[^\w.-]+', '_', s.name)
+        profiler.dump_stats(os.path.join(self.directory, f"profile-{os.getpid()}-{s.id:04d}-{label}.prof"))
+
+    # Totals per span name: calls, wall time, rows, bytes and the highest peak RSS
+    def summary(self):
+        df = pd.DataFrame(self.records, columns=['name', 'seconds', 'rows', 'bytes', 'peak_rss_mb'])
+        if df.empty:
+            return df
+        summary = df.groupby('name', sort=False).agg(
+            calls=('seconds', 'size'),
+            seconds=('seconds', 'sum'),
+            rows=('rows', 'sum'),
+            mb=('bytes', 'sum'),
+            peak_rss_mb=('peak_rss_mb', 'max'),
+        )
+        summary['mb'] = (summary['mb'] / 1024 / 1024).round(2)
+        summary['seconds'] = summary['seconds'].round(3)
+        return summary.sort_values('seconds', ascending=False).reset_index()
+
+    # Chrome trace-event JSON with one complete ('X') event per span, plus the raw span records
+    def write_trace(self, path=None):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        path = path or os.path.join(self.directory, f"trace-{stamp}-{os.getpid()}.json")
+        events = [{
+            'name': r['name'],
+            'ph': 'X',
+            'ts': r['start'] * 1e6,
+            'dur': r['seconds'] * 1e6,
+            'pid': r['pid'],
+            'tid': r['thread'],
+            'args': dict(r['attrs'], rows=r['rows'], bytes=r['bytes'], peak_rss_mb=r['peak_rss_mb']),
+        } for r in self.records]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'spans': self.records}, f, indent=1, default=str)
+        return path
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+# Process-wide tracer configured from PROFILE, PROFILE_DIR and PROFILE_CPROFILE in .env
+def get_tracer():
+    global _tracer
+    from analytics.db import env_flag
+
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer(
+                enabled=env_flag('PROFILE'),
+                directory=os.getenv('PROFILE_DIR') or None,
+                cprofile=env_flag('PROFILE_CPROFILE'),
+            )
+    return _tracer
+
+
+def span(name, **attrs):
+    return get_tracer().span(name, **attrs)
+
+
+# Decorator form of span(); rows are taken from the return value when it has a length
+def profiled(name=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__) as s:
+                result = func(*args, **kwargs)
+                if s.enabled and hasattr(result, '__len__'):
+                    s.set(rows=len(result))
+                return result
+        return wrapper
+    return decorator
+
+
+# Print the per-stage summary and write the trace at the end of a run (no-op unless PROFILE=1)
+def report_profile():
+    tracer = get_tracer()
+    if not tracer.enabled:
+        return None
+    print(tracer.summary().to_string(index=False))
+    path = tracer.write_trace()
+    print(f"Profile trace written to {path}")
+    return path
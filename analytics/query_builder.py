@@ -0,0 +1,60 @@
+import datetime
+
+# Half-open date ranges for WHERE clauses.
+# `paidon >= '2019-01-01' AND paidon < '2020-01-01'` can use an index on paidon,
+# `YEAR(paidon) = 2019` cannot, because the column is wrapped in a function.
+
+QUARTER_START_MONTHS = {1: 1, 2: 4, 3: 7, 4: 10}
+
+
+def quarter_bounds(year, quarter):
+    start = datetime.date(year, QUARTER_START_MONTHS[quarter], 1)
+    end = datetime.date(year + 1, 1, 1) if quarter == 4 else datetime.date(year, QUARTER_START_MONTHS[quarter + 1], 1)
+    return start, end
+
+
+# Turn a year/quarter spec into sorted (start, end) ranges, merging adjacent ones,
+# e.g. years=[2019, 2023], quarters=[1, 2, 3] -> [(2019-01-01, 2019-10-01), (2023-01-01, 2023-10-01)]
+def period_ranges(years, quarters=None):
+    quarters = sorted(quarters or [1, 2, 3, 4])
+    return merge_ranges(quarter_bounds(year, quarter) for year in years for quarter in quarters)
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and merged[-1][1] >= start:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def month_bounds(year, month):
+    start = datetime.date(year, month, 1)
+    end = datetime.date(year + 1, 1, 1) if month == 12 else datetime.date(year, month + 1, 1)
+    return start, end
+
+
+def range_predicate(column, start, end):
+    return f"{column} >= '{start.isoformat()}' AND {column} < '{end.isoformat()}'"
+
+
+# Sargable replacement for YEAR(column) IN (...) / QUARTER(column) IN (...) filters
+def period_predicate(column, years, quarters=None):
+    ranges = [range_predicate(column, start, end) for start, end in period_ranges(years, quarters)]
+    if len(ranges) == 1:
+        return ranges[0]
+    return '(' + ' OR '.join(f"({r})" for r in ranges) + ')'
+
+
+# Rows of the given (year, month) partitions; a (None, None) partition stands for rows where column IS NULL
+def partition_predicate(column, partitions):
+    partitions = list(partitions)
+    ranges = merge_ranges(month_bounds(int(y), int(m)) for y, m in partitions if y is not None)
+    clauses = [f"({range_predicate(column, start, end)})" for start, end in ranges]
+    if any(y is None for y, _ in partitions):
+        clauses.append(f"{column} IS NULL")
+    if not clauses:
+        return '1 = 0'
+    return '(' + ' OR '.join(clauses) + ')'
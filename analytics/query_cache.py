@@ -0,0 +1,280 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, each process still keeps its own index consistent
+    fcntl = None
+
+# Disk-backed cache of query results, keyed by a hash of the normalised SQL text plus its parameters.
+# Frames are stored as Parquet next to an index.json holding sizes and access times:
+#   <QUERY_CACHE_DIR>/<key>.parquet
+#   <QUERY_CACHE_DIR>/index.json
+# Keys also cover the data source (backend, host and database name), so one directory can serve several.
+# Entries expire after QUERY_CACHE_TTL seconds, the least recently used ones are evicted once the
+# cache grows past QUERY_CACHE_MAX_BYTES, and everything is dropped when the data watermark moves:
+# MAX(bid)/MAX(stamp) of the live booking table on MySQL, the snapshot manifest on the embedded backends.
+# Several report runs can share one cache directory: every change to the index re-reads index.json
+# under an exclusive lock on index.lock and writes it back before releasing the lock, so concurrent
+# runs merge their entries instead of overwriting each other's. Parquet files missing from the index
+# (e.g. left by an interrupted run) are adopted when evicting, so they still count toward the byte cap.
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.query_cache')
+DEFAULT_TTL = 3600
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+# Same query, same key: drop comments, collapse whitespace and any trailing semicolon
+def normalize_sql(query):
+    query = re.sub(r"/\*.*?\*/", ' ', str(query), flags=re.DOTALL)
+    query = re.sub(r"--[^\n]*", ' ', query)
+    return re.sub(r"\s+", ' ', query).strip().rstrip(';').strip()
+
+
+def cache_key(query, params=None, source=None):
+    payload = normalize_sql(query) + '\n' + json.dumps(params or {}, sort_keys=True, default=str)
+    if source:
+        payload = f"{source}\n{payload}"
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# Where query results come from, e.g. "mysql:db.example.com:3306/12go" or "duckdb:/data/snapshot"
+def cache_source():
+    from analytics.backends import db_backend
+    from analytics.snapshot import snapshot_dir
+
+    backend = db_backend()
+    if backend == 'mysql':
+        return f"mysql:{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+    if backend == 'sqlite' and os.getenv('SQLITE_PATH'):
+        return f"sqlite:{os.path.abspath(os.getenv('SQLITE_PATH'))}"
+    return f"{backend}:{os.path.abspath(snapshot_dir())}"
+
+
+# Current high-water mark of the local snapshot, or None when there is no snapshot
+def snapshot_watermark(path=None):
+    from analytics.snapshot import read_manifest
+
+    manifest = read_manifest(path)
+    if manifest is None:
+        return None
+    # next_part moves with every stored chunk, even when an interrupted refresh left the high-water marks
+    return f"{manifest.get('bid')}:{manifest.get('stamp')}:{manifest.get('next_part')}"
+
+
+# High-water mark of the booking table itself: new bookings raise MAX(bid), updates raise MAX(stamp).
+# Read directly, not through the cache it validates.
+def table_watermark(engine):
+    from analytics.db import BOOKING_TABLE
+
+    row = pd.read_sql(f"SELECT MAX(bid) AS bid, MAX(stamp) AS stamp FROM {BOOKING_TABLE}", engine).iloc[0]
+    return f"{row['bid']}:{row['stamp']}"
+
+
+# Entries are only valid for the data state they were fetched from: the live table on MySQL,
+# the snapshot behind the embedded backends
+def cache_watermark():
+    from analytics.backends import db_backend
+    from analytics.db import get_engine
+
+    backend = db_backend()
+    if backend == 'mysql':
+        return f"{cache_source()}:{table_watermark(get_engine())}"
+    return f"{cache_source()}:{snapshot_watermark()}"
+
+
+class QueryCache:
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES, watermark=None, source=None):
+        self.path = path or DEFAULT_CACHE_DIR
+        self.source = source
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self._index = self._read_index()
+        self.check_watermark(watermark)
+
+    def _index_path(self):
+        return os.path.join(self.path, 'index.json')
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, f"{key}.parquet")
+
+    def _read_index(self):
+        try:
+            with open(self._index_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'watermark': None, 'entries': {}}
+
+    def _write_index(self):
+        tmp_path = f"{self._index_path()}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path())
+
+    # The index as currently on disk, held under the thread lock and the cross-process file lock;
+    # with write=True it is written back before the locks are released
+    @contextmanager
+    def _locked(self, write=True):
+        with self._lock, open(os.path.join(self.path, 'index.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._index = self._read_index()
+                yield self._index
+                if write:
+                    self._write_index()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _remove(self, key):
+        self._index['entries'].pop(key, None)
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    # Drop every entry, e.g. after the snapshot was refreshed
+    def invalidate(self):
+        with self._locked() as index:
+            for key in list(index['entries']) + self._unindexed():
+                self._remove(key)
+
+    # Invalidate when the snapshot watermark differs from the one the entries were cached under
+    def check_watermark(self, watermark):
+        if watermark is None:
+            return
+        with self._locked() as index:
+            if watermark != index.get('watermark'):
+                for key in list(index['entries']) + self._unindexed():
+                    self._remove(key)
+                index['watermark'] = watermark
+
+    def get(self, query, params=None):
+        key = cache_key(query, params, self.source)
+        with self._locked(write=False) as index:
+            entry = index['entries'].get(key)
+            if entry is not None and self.ttl and time.time() - entry['created'] > self.ttl:
+                self._remove(key)
+                self._write_index()
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+        try:
+            df = pd.read_parquet(self._entry_path(key))
+        except OSError:
+            with self._locked():
+                self._remove(key)
+                self.misses += 1
+            return None
+
+        with self._locked() as index:
+            if key in index['entries']:
+                index['entries'][key]['last_access'] = time.time()
+            self.hits += 1
+        return df
+
+    def put(self, query, params, df):
+        key = cache_key(query, params, self.source)
+        tmp_path = f"{self._entry_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            df.to_parquet(tmp_path, index=False)
+        except (ValueError, TypeError, ImportError):
+            # Frames Parquet cannot represent are simply not cached
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._locked() as index:
+            os.replace(tmp_path, self._entry_path(key))
+            now = time.time()
+            index['entries'][key] = {
+                'bytes': os.path.getsize(self._entry_path(key)),
+                'created': now,
+                'last_access': now,
+            }
+            self._evict()
+
+    # Keys of Parquet files in the directory that the index does not list
+    def _unindexed(self):
+        files = glob.glob(os.path.join(self.path, '*.parquet'))
+        keys = (os.path.basename(f)[:-len('.parquet')] for f in files)
+        return [k for k in keys if k not in self._index['entries']]
+
+    # Evict least recently used entries until the cache fits in max_bytes
+    def _evict(self):
+        entries = self._index['entries']
+        for key in self._unindexed():
+            try:
+                stat = os.stat(self._entry_path(key))
+            except FileNotFoundError:
+                continue
+            entries[key] = {'bytes': stat.st_size, 'created': stat.st_mtime, 'last_access': stat.st_mtime}
+        total = sum(e['bytes'] for e in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['last_access']):
+            if not self.max_bytes or total <= self.max_bytes:
+                break
+            total -= entries[key]['bytes']
+            self._remove(key)
+
+    def read_sql(self, query, fetch, params=None):
+        df = self.get(query, params)
+        if df is None:
+            df = fetch()
+            self.put(query, params, df)
+        return df
+
+    def report(self):
+        lookups = self.hits + self.misses
+        ratio = self.hits / lookups if lookups else 0
+        size = sum(e['bytes'] for e in self._index['entries'].values())
+        return (f"Query cache: {self.hits} hits, {self.misses} misses ({ratio:.0%} hit rate), "
+                f"{len(self._index['entries'])} entries, {size / 1024 / 1024:.1f} MB")
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+# Process-wide cache configured from QUERY_CACHE* settings in .env; None when QUERY_CACHE=0
+def get_query_cache():
+    global _query_cache
+    from analytics.db import env_flag
+
+    if not env_flag('QUERY_CACHE', default=True):
+        return None
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryCache(
+                path=os.getenv('QUERY_CACHE_DIR') or None,
+                ttl=int(os.getenv('QUERY_CACHE_TTL') or DEFAULT_TTL),
+                max_bytes=int(os.getenv('QUERY_CACHE_MAX_BYTES') or DEFAULT_MAX_BYTES),
+                watermark=cache_watermark(),
+                source=cache_source(),
+            )
+    return _query_cache
+
+
+# One line with the hit/miss counters, printed at the end of each report run.
+# A run that never queried the database does not open the cache (or read the live watermark) just to report.
+def query_cache_report():
+    from analytics.db import env_flag
+
+    if not env_flag('QUERY_CACHE', default=True):
+        return 'Query cache: disabled'
+    if _query_cache is None:
+        return 'Query cache: not used'
+    return _query_cache.report()
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+from analytics.aggregation import aggregate_dimensions
+from analytics.db import BOOKING_TABLE, get_engine, read_sql
+
+# Dimensions broken down in Hypothese_1/hypothesis_1.sql
+REFUND_DIMENSIONS = ['from_id', 'to_id', 'operator_id', 'class_name', 'from_country_id', 'to_country_id']
+
+# Orders and refunds per (YEAR(paidon), YEAR(refund_date)) pair in a single GROUP BY scan.
+# A booking is an order in its paidon year and a refund in its refund_date year; the few pairs are
+# rolled up per year client-side (yearly_refund_totals), so years with orders but no refunds (or the
+# reverse) are all kept, like a FULL OUTER JOIN of the two yearly counts.
+YEARLY_REFUND_QUERY = f"""
+SELECT
+    YEAR(paidon) AS paidon_year,
+    YEAR(refund_date) AS refund_year,
+    COUNT(*) AS orders,
+    COUNT(refund_date) AS refunds
+FROM
+    {BOOKING_TABLE}
+GROUP BY
+    YEAR(paidon), YEAR(refund_date)
+"""
+
+
+# Orders and refunds per combination of all the dimensions in a single GROUP BY scan.
+# The combinations are far fewer than the bookings and roll up to every single dimension
+# client-side (refund_rates_by_dimension), instead of scanning the table once per dimension.
+def dimension_refund_query(dimensions=None):
+    columns = ', '.join(dimensions or REFUND_DIMENSIONS)
+    return f"""
+SELECT
+    {columns},
+    COUNT(*) AS total_orders,
+    COUNT(refund_date) AS refund_count
+FROM
+    {BOOKING_TABLE}
+GROUP BY
+    {columns}
+"""
+
+
+# Refund rate as in the SQL: refunds / orders, 0 when a year has no orders
+def with_refund_rate(df):
+    orders = df['total_orders'].where(df['total_orders'] != 0)
+    df['refund_rate'] = (df['refund_count'] / orders).fillna(0)
+    return df
+
+
+REFUND_STATUSES = ['ok', 'anomaly', 'no orders']
+
+
+# Vectorised refund-rate classification for any number of groups.
+# refund_rate becomes a numeric column rounded to 4 places (NaN where it is meaningless) and
+# refund_status a categorical: 'no orders' when a group has no orders, 'anomaly' when refunds
+# exceed orders, 'ok' otherwise.
+# Differences from the original row-wise version (see benchmarks/bench_refund_rate.py):
+# - a group with neither orders nor refunds keeps rate 0 but is labelled 'no orders'; the original
+#   showed it as an ordinary "0.0000" rate in the table and as "N/A (No Orders)" in the summary
+# - rates are rounded with np.round, so a rate half-way between two 4th decimals (e.g. 7/160) can
+#   round up where round() on the float rounded down
+def classify_refund_rates(df):
+    orders = df['total_orders'].to_numpy(dtype='float64')
+    refunds = df['refund_count'].to_numpy(dtype='float64')
+    no_orders = orders == 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = refunds / orders
+    status = np.select([no_orders, rate > 1], ['no orders', 'anomaly'], default='ok')
+
+    # Anomalies and refunds without orders have no meaningful rate; a group with neither reads as 0
+    rate = np.where(status == 'ok', rate, np.nan)
+    rate = np.where(no_orders & (refunds == 0), 0.0, rate)
+
+    df['refund_rate'] = np.round(rate, 4)
+    df['refund_status'] = pd.Categorical(status, categories=REFUND_STATUSES)
+    return df
+
+
+# One readable line per group, e.g. "2019: 1 of every 25 orders refunded (0.04 refund rate)",
+# built with column-wise string operations instead of iterrows()
+def refund_summary_lines(df, label_column='year'):
+    labels = df[label_column].astype(str)
+    orders = df['total_orders'].astype('float64')
+    refunds = df['refund_count'].astype('float64')
+    every = (orders / refunds.where(refunds > 0)).round().fillna(0).astype('int64').astype(str)
+
+    lines = labels + ': 1 of every ' + every + ' orders refunded (' + df['refund_rate'].astype(str) + ' refund rate)'
+    lines = lines.mask(refunds == 0, labels + ': no refunds')
+    lines = lines.mask(df['refund_status'] == 'anomaly', labels + ': anomaly (more refunds than orders)')
+    lines = lines.mask(df['refund_status'] == 'no orders', labels + ': N/A (No Orders)')
+    return lines
+
+
+# Overall totals for the report text: orders, refunds and the refund percentage
+def refund_totals(df):
+    total_orders = int(df['total_orders'].sum())
+    total_refunds = int(df['refund_count'].sum())
+    refund_percentage = round(total_refunds / total_orders * 100, 2) if total_orders > 0 else 0
+    return {'total_orders': total_orders, 'total_refunds': total_refunds, 'refund_percentage': refund_percentage}
+
+
+# Yearly orders and refunds computed from a frame with paidon and refund_date (e.g. the snapshot)
+def refund_rates_by_year(bookings):
+    orders = bookings['paidon'].dt.year.value_counts().rename('total_orders')
+    refunds = bookings['refund_date'].dt.year.value_counts().rename('refund_count')
+    df = pd.concat([orders, refunds], axis=1).fillna(0).astype('int64')
+    df = df.rename_axis('year').reset_index().sort_values('year', ignore_index=True)
+    df['year'] = df['year'].astype('int64')
+    return with_refund_rate(df)
+
+
+# Yearly orders and refunds from (paidon_year, refund_year, orders, refunds) pairs:
+# the output of YEARLY_REFUND_QUERY or the refunds partials
+def yearly_refund_totals(pairs):
+    orders = pairs.groupby('paidon_year')['orders'].sum().rename('total_orders')
+    refunds = pairs[pairs['refunds'] > 0].groupby('refund_year')['refunds'].sum().rename('refund_count')
+    df = pd.concat([orders, refunds], axis=1).fillna(0).astype('int64')
+    df = df.rename_axis('year').reset_index().sort_values('year', ignore_index=True)
+    df['year'] = df['year'].astype('int64')
+    return with_refund_rate(df)
+
+
+# Rounded refund rate, highest first, like the queries in hypothesis_1.sql
+def ranked_refund_rates(df):
+    df = with_refund_rate(df)
+    df['refund_rate'] = df['refund_rate'].round(4)
+    return df.sort_values('refund_rate', ascending=False, ignore_index=True)
+
+
+# Orders, refunds and refund rate for every dimension from one frame: row-level with an is_refund
+# column, or already grouped with total_orders and refund_count (the output of dimension_refund_query)
+def refund_rates_by_dimension(bookings, dimensions=None):
+    dimensions = dimensions or REFUND_DIMENSIONS
+    if 'total_orders' in bookings.columns:
+        measures = {
+            'total_orders': ('total_orders', 'sum'),
+            'refund_count': ('refund_count', 'sum'),
+        }
+    else:
+        measures = {
+            'total_orders': ('is_refund', 'size'),
+            'refund_count': ('is_refund', 'sum'),
+        }
+    results = aggregate_dimensions(bookings, {d: [d] for d in dimensions}, measures)
+    return {dimension: ranked_refund_rates(df) for dimension, df in results.items()}
+
+
+def fetch_yearly_refunds(engine):
+    return yearly_refund_totals(read_sql(YEARLY_REFUND_QUERY, engine))
+
+
+# One scan of the booking table for all dimensions; only the grouped combinations are transferred
+def fetch_dimension_refunds(engine, dimensions=None):
+    dimensions = dimensions or REFUND_DIMENSIONS
+    return refund_rates_by_dimension(read_sql(dimension_refund_query(dimensions), engine), dimensions)
+
+
+if __name__ == '__main__':
+    engine = get_engine()
+    print(fetch_yearly_refunds(engine).to_string(index=False))
+    for dimension, df in fetch_dimension_refunds(engine).items():
+        print(f"\nRefund rates by {dimension}:")
+        print(df.head(20).to_string(index=False))
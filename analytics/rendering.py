@@ -0,0 +1,121 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Off-screen chart rendering from plain figure specs.
+# A spec is a picklable dict built from the aggregated frames, e.g.
+#   {
+#       'figsize': (14, 8),
+#       'title': 'EPS by Vehicle Class', 'xlabel': 'Vehicle Class ID', 'ylabel': 'EPS (USD per Seat)',
+#       'series': [{'kind': 'line', 'x': [...], 'y': [...], 'label': 'EPS 2019', 'marker': 'o'}],
+#       'legend': True, 'grid': True,
+#   }
+# Series kinds are 'line', 'bar' and 'hist'; any other series keys are passed to matplotlib.
+# 'grouped_bars': {'categories': [...], 'groups': {label: values}} draws side-by-side bars,
+# 'annotations': [(text, (x, y))] adds labels above points.
+# Figures are drawn with the Agg canvas directly, so workers never touch pyplot or a GUI backend.
+
+DEFAULT_FIGSIZE = (10, 6)
+DEFAULT_DPI = 100
+
+
+def draw_series(ax, series):
+    series = dict(series)
+    kind = series.pop('kind', 'line')
+    x = series.pop('x', None)
+    y = series.pop('y', None)
+    if kind == 'bar':
+        ax.bar(x, y, **series)
+    elif kind == 'hist':
+        ax.hist(x, **series)
+    else:
+        ax.plot(x, y, **series)
+
+
+def draw_grouped_bars(ax, grouped, width=0.8):
+    categories = list(grouped['categories'])
+    groups = grouped['groups']
+    bar_width = width / max(len(groups), 1)
+    positions = range(len(categories))
+    for i, (label, values) in enumerate(groups.items()):
+        offset = (i - (len(groups) - 1) / 2) * bar_width
+        ax.bar([p + offset for p in positions], values, bar_width, label=str(label))
+    ax.set_xticks(list(positions))
+    ax.set_xticklabels([str(c) for c in categories])
+
+
+def draw(ax, spec):
+    for series in spec.get('series', []):
+        draw_series(ax, series)
+    if 'grouped_bars' in spec:
+        draw_grouped_bars(ax, spec['grouped_bars'])
+    for text, xy in spec.get('annotations', []):
+        ax.annotate(text, xy, textcoords='offset points', xytext=(0, 10), ha='center')
+
+    ax.set_title(spec.get('title', ''))
+    ax.set_xlabel(spec.get('xlabel', ''))
+    ax.set_ylabel(spec.get('ylabel', ''))
+    if 'xticks' in spec:
+        ax.set_xticks(list(spec['xticks']))
+    if 'xticks_rotation' in spec:
+        for label in ax.get_xticklabels():
+            label.set_rotation(spec['xticks_rotation'])
+            label.set_horizontalalignment('right')
+    if 'ylim' in spec:
+        ax.set_ylim(*spec['ylim'])
+    if spec.get('legend'):
+        ax.legend()
+    if spec.get('grid'):
+        ax.grid(True)
+
+
+# Render one spec to image bytes (PNG by default, 'svg' or 'pdf' for vector output)
+def render_figure(spec, fmt='png'):
+    fig = Figure(figsize=spec.get('figsize', DEFAULT_FIGSIZE))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    draw(ax, spec)
+    if spec.get('tight_layout'):
+        fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=spec.get('dpi', DEFAULT_DPI))
+    return buffer.getvalue()
+
+
+def _render_with_format(args):
+    spec, fmt = args
+    return render_figure(spec, fmt)
+
+
+# Worker count for chart rendering, from RENDER_WORKERS in .env (defaults to the CPU count)
+def render_workers():
+    return int(os.getenv('RENDER_WORKERS') or os.cpu_count() or 1)
+
+
+# The report scripts run their code at module level, so workers are forked rather than
+# spawned: a spawned worker would re-import the script and run the whole report again
+def pool_context():
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+# Render many specs in a process pool; results come back in the order of the specs
+def render_figures(specs, fmt='png', max_workers=None):
+    from analytics.profiling import span
+
+    specs = list(specs)
+    max_workers = min(max_workers or render_workers(), len(specs)) if specs else 1
+    context = pool_context()
+    with span('render', charts=len(specs), workers=max_workers) as s:
+        if max_workers <= 1 or context is None:
+            images = [render_figure(spec, fmt) for spec in specs]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+                images = list(pool.map(_render_with_format, [(spec, fmt) for spec in specs]))
+        s.set(rows=len(images), bytes=sum(len(image) for image in images))
+    return images
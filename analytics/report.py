@@ -0,0 +1,61 @@
+import io
+import os
+import tempfile
+
+from fpdf import FPDF
+
+from analytics.db import env_flag
+from analytics.profiling import span
+from analytics.rendering import render_figure
+
+# PDF report assembled entirely in memory.
+# Charts go in as image bytes, BytesIO buffers, figure specs or matplotlib Figures and are never
+# written to the working directory; the finished PDF is produced as one buffer and written once.
+# With REPORT_VECTOR=1 in .env charts are embedded as SVG (vector) instead of PNG (raster).
+
+
+# Image format the report scripts should render their charts in
+def chart_format():
+    return 'svg' if env_flag('REPORT_VECTOR') else 'png'
+
+
+def figure_bytes(figure, fmt):
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+class ReportBuilder(FPDF):
+    def __init__(self, *args, vector=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.vector = env_flag('REPORT_VECTOR') if vector is None else vector
+
+    # Place a chart on the current page; image may be bytes, a BytesIO, a figure spec dict or a Figure
+    def add_chart(self, image, x=None, y=None, w=0, h=0):
+        if isinstance(image, dict):
+            image = render_figure(image, 'svg' if self.vector else 'png')
+        elif hasattr(image, 'savefig'):
+            image = figure_bytes(image, 'svg' if self.vector else 'png')
+        if isinstance(image, (bytes, bytearray)):
+            image = io.BytesIO(image)
+        self.image(image, x=x, y=y, w=w, h=h)
+
+    # Write the finished PDF in one go: a uniquely named temp file next to the target, then an atomic
+    # rename, so parallel runs never share a temp path and readers never see a half-written report
+    def save(self, path):
+        with span('pdf.output', path=path) as s:
+            data = self.output()
+            s.set(bytes=len(data))
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.report-', suffix='.pdf.tmp', delete=False) as f:
+            f.write(data)
+        try:
+            # NamedTemporaryFile is private (0600); give the report the usual umask-based mode
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(f.name, 0o666 & ~umask)
+            os.replace(f.name, path)
+        except OSError:
+            os.remove(f.name)
+            raise
+        return path
@@ -0,0 +1,261 @@
+import argparse
+import glob
+import importlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from graphlib import TopologicalSorter
+
+import pandas as pd
+
+from analytics.db import read_sql
+from analytics.executor import get_pooled_engine, max_concurrent_queries
+from analytics.index_advisor import split_statements
+from analytics.query_cache import cache_key, query_cache_report
+from analytics.rendering import pool_context, render_figure, render_workers
+from analytics.report import ReportBuilder, chart_format
+
+# Declarative reports and one runner for all of them.
+# A report spec is a JSON file (see reports/) with four parts:
+#   "queries":  name -> SQL text, {"sql": ...}, {"ref": "module:CONSTANT"}, {"ref": "module:builder", "kwargs": {...}}
+#               or {"file": "x.sql", "statement": n}
+#   "metrics":  name -> {"function": "module:function", "inputs": [names], "kwargs": {...}}
+#               or {"input": name, "where": {column: [values]}} to select rows
+#   "charts":   name -> figure spec for analytics.rendering whose x/y/xticks name columns of "input"
+#   "sections": one PDF page each, with optional "title", "subtitle", "text" and "chart";
+#               text is str.format'ed with the query and metric results ({summary}, {totals[total_orders]:,})
+#   "output":   file name of the PDF, written under the output directory (default reports/output/)
+#               so it never overwrites the PDF the hypothesis script of the same report writes
+# All specs are planned together as one DAG: identical queries (same normalised SQL) are fetched once
+# and shared between reports, and queries, metrics, charts and PDFs run as soon as their inputs are ready.
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_SPECS = os.path.join(REPO_ROOT, 'reports', '*.json')
+DEFAULT_OUTPUT_DIR = os.path.join(REPO_ROOT, 'reports', 'output')
+
+
+def resolve(reference):
+    module, _, attribute = reference.partition(':')
+    return getattr(importlib.import_module(module), attribute)
+
+
+def load_spec(path):
+    with open(path) as f:
+        spec = json.load(f)
+    spec.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    spec['path'] = path
+    return spec
+
+
+def query_sql(query, spec):
+    if isinstance(query, str):
+        return query
+    if 'sql' in query:
+        return query['sql']
+    if 'ref' in query:
+        reference = resolve(query['ref'])
+        return reference(**query['kwargs']) if 'kwargs' in query else reference
+    path = os.path.join(os.path.dirname(os.path.abspath(spec['path'])), query['file'])
+    with open(path) as f:
+        return split_statements(f.read())[query.get('statement', 0)]
+
+
+# Nodes are ('query', sql_hash), ('metric', report, name), ('chart', report, name) or ('report', name)
+def node_label(node):
+    if node[0] == 'query':
+        return f"query:{node[1][:12]}"
+    return ':'.join(node)
+
+
+# Build the DAG: node -> set of nodes it depends on, plus what each node does
+def plan(specs):
+    graph = {}
+    tasks = {}
+    queries = {}
+
+    for spec in specs:
+        name = spec['name']
+        local = {}
+        for query_name, query in spec.get('queries', {}).items():
+            sql = query_sql(query, spec)
+            node = ('query', cache_key(sql))
+            queries.setdefault(node, sql)
+            graph.setdefault(node, set())
+            tasks[node] = ('query', sql)
+            local[query_name] = node
+
+        for metric_name, metric in spec.get('metrics', {}).items():
+            local[metric_name] = ('metric', name, metric_name)
+
+        for metric_name, metric in spec.get('metrics', {}).items():
+            inputs = metric.get('inputs', [metric['input']] if 'input' in metric else [])
+            node = local[metric_name]
+            graph[node] = {local[i] for i in inputs}
+            tasks[node] = ('metric', metric, [local[i] for i in inputs])
+
+        charts = {}
+        for chart_name, chart in spec.get('charts', {}).items():
+            node = ('chart', name, chart_name)
+            graph[node] = {local[chart['input']]}
+            tasks[node] = ('chart', chart, local[chart['input']])
+            charts[chart_name] = node
+
+        report = ('report', name)
+        graph[report] = set(local.values()) | set(charts.values())
+        tasks[report] = ('report', spec, local, charts)
+
+    return graph, tasks, queries
+
+
+# Results are shared between metrics and reports running in parallel, and functions such as
+# classify_refund_rates add columns in place, so every metric works on its own copy of a frame
+def run_metric(metric, inputs):
+    inputs = [i.copy() if isinstance(i, pd.DataFrame) else i for i in inputs]
+    if 'where' in metric:
+        df = inputs[0]
+        for column, values in metric['where'].items():
+            df = df[df[column].isin(values)]
+        return df.reset_index(drop=True)
+    return resolve(metric['function'])(*inputs, **metric.get('kwargs', {}))
+
+
+def column_values(df, value):
+    return df[value].tolist() if isinstance(value, str) and value in df.columns else value
+
+
+# Turn a declarative chart (columns by name) into a rendering spec (plain lists)
+def figure_spec(chart, df):
+    spec = {k: v for k, v in chart.items() if k not in ('input', 'series', 'annotate')}
+    spec['series'] = []
+    for series in chart.get('series', []):
+        series = dict(series)
+        offset = series.pop('offset', 0)
+        series['x'] = column_values(df, series.get('x'))
+        series['y'] = column_values(df, series.get('y'))
+        if offset:
+            series['x'] = [x + offset for x in series['x']]
+        spec['series'].append(series)
+    if 'xticks' in spec:
+        spec['xticks'] = column_values(df, spec['xticks'])
+    if 'annotate' in chart:
+        annotate = chart['annotate']
+        points = df[[annotate['x'], annotate['y']]].dropna()
+        spec['annotations'] = [(annotate.get('format', '{}').format(y), (x, y)) for x, y in points.itertuples(index=False)]
+    return spec
+
+
+class TextValues(dict):
+    # Frames and lists are shown one item per line in text sections
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, (pd.Series, pd.Index, list)):
+            return '\n'.join(str(v) for v in value)
+        if isinstance(value, pd.DataFrame):
+            return value.to_string(index=False)
+        return value
+
+
+def build_report(spec, values, images):
+    pdf = ReportBuilder()
+    for section in spec.get('sections', []):
+        pdf.add_page()
+        if 'title' in section:
+            pdf.set_font("Helvetica", 'B', section.get('size', 16))
+            pdf.cell(200, 10, section['title'], new_x="LMARGIN", new_y="NEXT", align='C')
+        if 'subtitle' in section:
+            pdf.set_font("Helvetica", size=12)
+            pdf.cell(200, 10, section['subtitle'], new_x="LMARGIN", new_y="NEXT", align='C')
+        if 'text' in section:
+            pdf.ln(10)
+            pdf.set_font("Helvetica", size=12)
+            pdf.multi_cell(0, 10, section['text'].format_map(values))
+        if 'chart' in section:
+            pdf.add_chart(images[section['chart']], x=10, y=section.get('y', 10), w=180)
+    return pdf.save(spec['output'])
+
+
+# Execute the planned DAG. Queries, metrics and PDF assembly run in a thread pool,
+# charts are rendered off-screen in a process pool.
+def execute(graph, tasks, fetch=None, max_workers=None, chart_workers=None):
+    if fetch is None:
+        engine = get_pooled_engine(max_workers)
+        fetch = lambda sql: read_sql(sql, engine)
+    fmt = chart_format()
+    results = {}
+    timings = []
+
+    sorter = TopologicalSorter(graph)
+    sorter.prepare()
+    context = pool_context()
+    processes = None
+    if context is not None:
+        # Fork the chart workers up front, before any query thread holds a lock or connection
+        processes = ProcessPoolExecutor(max_workers=chart_workers or render_workers(), mp_context=context)
+        processes.submit(int).result()
+    threads = ThreadPoolExecutor(max_workers=max_workers or max_concurrent_queries())
+    processes = processes or threads
+    running = {}
+    try:
+        while sorter.is_active():
+            for node in sorter.get_ready():
+                task = tasks[node]
+                kind = task[0]
+                if kind == 'query':
+                    future = threads.submit(fetch, task[1])
+                elif kind == 'metric':
+                    future = threads.submit(run_metric, task[1], [results[i] for i in task[2]])
+                elif kind == 'chart':
+                    future = processes.submit(render_figure, figure_spec(task[1], results[task[2]]), fmt)
+                else:
+                    spec, local, charts = task[1], task[2], task[3]
+                    values = TextValues({n: results[dependency] for n, dependency in local.items()})
+                    images = {n: results[dependency] for n, dependency in charts.items()}
+                    future = threads.submit(build_report, spec, values, images)
+                running[future] = (node, time.perf_counter())
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node, start = running.pop(future)
+                results[node] = future.result()
+                timings.append({'node': node_label(node), 'kind': node[0], 'seconds': round(time.perf_counter() - start, 3)})
+                sorter.done(node)
+    finally:
+        threads.shutdown(cancel_futures=True)
+        if processes is not threads:
+            processes.shutdown(cancel_futures=True)
+
+    return results, pd.DataFrame(timings, columns=['node', 'kind', 'seconds'])
+
+
+def run(paths, fetch=None, max_workers=None, output_dir=None):
+    output_dir = output_dir or DEFAULT_OUTPUT_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    specs = [load_spec(p) for p in paths]
+    for spec in specs:
+        spec['output'] = os.path.join(output_dir, spec['output'])
+    graph, tasks, queries = plan(specs)
+    results, timings = execute(graph, tasks, fetch, max_workers)
+    return {spec['name']: results[('report', spec['name'])] for spec in specs}, timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run declarative report specs as one DAG.')
+    parser.add_argument('specs', nargs='*', help='report spec files (default: reports/*.json)')
+    parser.add_argument('--plan', action='store_true', help='print the execution plan without running it')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help='directory the report PDFs are written to')
+    args = parser.parse_args()
+
+    paths = args.specs or sorted(glob.glob(DEFAULT_SPECS))
+    if args.plan:
+        specs = [load_spec(p) for p in paths]
+        graph, tasks, queries = plan(specs)
+        declared = sum(len(s.get('queries', {})) for s in specs)
+        print(f"{len(specs)} reports, {declared} queries declared, {len(queries)} distinct queries to fetch")
+        for node in TopologicalSorter(graph).static_order():
+            print(node_label(node))
+    else:
+        outputs, timings = run(paths, output_dir=args.output_dir)
+        print(timings.to_string(index=False))
+        for name, output in outputs.items():
+            print(f"{name}: {output}")
+        print(query_cache_report())
@@ -0,0 +1,458 @@
+import argparse
+import json
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from analytics.metrics import booking_eps, group_codes, python_value
+from analytics.snapshot import partition_files, snapshot_dir
+
+# Mergeable sketches of the snapshot, kept per year partition:
+#   HyperLogLog for distinct customers (cust_id) and KLL for EPS / trip duration quantiles,
+#   each per dimension value (all bookings, vehicle class; routes with SKETCH_ROUTES=1).
+# They are built in one streaming pass over the part files and stored next to the snapshot:
+#   <SNAPSHOT_DIR>/sketches/year=2023.parquet   (dimension, key, column, kind, payload)
+#   <SNAPSHOT_DIR>/sketches/manifest.json      (part files and dimensions each partition's sketches cover)
+# A partition is a few KB per dimension value instead of millions of rows; partitions (and
+# new part files) merge without re-reading anything, so histograms, percentiles and distinct
+# counts for any set of years come straight from the stored sketches.
+# A HyperLogLog stays sparse (only the registers it has set) until it fills 1/8 of its registers,
+# so the many small groups of a fine dimension cost bytes rather than 2**precision registers each.
+# Route sketches are opt-in: there is one pair per route, which costs more than the columns it summarises
+# unless many routes are actually queried. KLL compaction is seeded, so a report draws the same histogram
+# from the same bookings on every run.
+HLL_PRECISION = 12
+KLL_K = 200
+KLL_SEED = 0
+
+SKETCH_DIMENSIONS = {
+    'all': [],
+    'vehclass_id': ['vehclass_id'],
+}
+OPTIONAL_DIMENSIONS = {
+    'route': ['from_station_name', 'to_station_name'],
+}
+DISTINCT_COLUMNS = ['cust_id']
+QUANTILE_COLUMNS = ['eps', 'trip_duration_minutes']
+SOURCE_COLUMNS = ['netprice_usd', 'total_usd', 'seats', 'trip_duration_minutes', 'cust_id']
+SPARSE_FLAG = 0x80
+# Bumped whenever a sketched column changes meaning, so stored sketches are rebuilt (2: eps is the margin per seat)
+SKETCH_VERSION = 2
+
+
+# Dimensions sketched by refresh_sketches: the defaults, plus routes with SKETCH_ROUTES=1
+def sketch_dimensions():
+    from analytics.db import env_flag
+
+    return dict(SKETCH_DIMENSIONS, **(OPTIONAL_DIMENSIONS if env_flag('SKETCH_ROUTES') else {}))
+
+
+# Number of significant bits of every uint64, by binary search on the bit position
+def bit_length(values):
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= (np.uint64(1) << np.uint64(shift))
+        values[high] >>= np.uint64(shift)
+        length[high] += shift
+    return length + (values > 0)
+
+
+# Register index and rank (position of the first 1 bit after the index bits) for each value
+def hll_updates(values, precision):
+    hashes = pd.util.hash_array(np.asarray(values))
+    index = (hashes >> np.uint64(64 - precision)).astype(np.intp)
+    rank = 64 - bit_length(hashes << np.uint64(precision)) + 1
+    return index, np.minimum(rank, 64 - precision + 1).astype(np.uint8)
+
+
+# Highest rank per register for a batch of (register, rank) updates, sorted by register
+def max_rank_per_register(index, rank):
+    order = np.lexsort((rank, index))
+    index, rank = index[order], rank[order]
+    last = np.r_[index[1:] != index[:-1], True] if len(index) else np.zeros(0, dtype=bool)
+    return index[last], rank[last]
+
+
+class HyperLogLog:
+    kind = 'hll'
+
+    def __init__(self, precision=HLL_PRECISION, registers=None, sparse=None):
+        self.precision = precision
+        self.registers = registers
+        if registers is None:
+            self.sparse = sparse if sparse is not None else (np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint8))
+
+    @property
+    def sparse_limit(self):
+        return (1 << self.precision) // 8
+
+    def dense(self):
+        if self.registers is not None:
+            return self.registers
+        registers = np.zeros(1 << self.precision, dtype=np.uint8)
+        registers[self.sparse[0]] = self.sparse[1]
+        return registers
+
+    def update(self, index, rank):
+        if self.registers is not None:
+            np.maximum.at(self.registers, index, rank)
+            return self
+        index, rank = max_rank_per_register(np.concatenate([self.sparse[0], np.asarray(index, dtype=np.uint32)]),
+                                            np.concatenate([self.sparse[1], np.asarray(rank, dtype=np.uint8)]))
+        self.sparse = (index, rank)
+        if len(index) > self.sparse_limit:
+            self.registers = self.dense()
+            del self.sparse
+        return self
+
+    def add(self, values):
+        values = pd.Series(values).dropna()
+        if len(values):
+            self.update(*hll_updates(values.to_numpy(), self.precision))
+        return self
+
+    def merge(self, other):
+        if other.registers is None:
+            return self.update(*other.sparse)
+        if self.registers is None:
+            self.registers = self.dense()
+            del self.sparse
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    # Standard estimate with linear counting while many registers are still empty (~1.6% error at p=12)
+    def count(self):
+        registers = self.dense()
+        m = len(registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    # Dense: precision byte + registers; sparse: precision byte with SPARSE_FLAG + register indexes + ranks
+    def to_bytes(self):
+        if self.registers is not None:
+            return bytes([self.precision]) + zlib.compress(self.registers.tobytes())
+        index, rank = self.sparse
+        return bytes([self.precision | SPARSE_FLAG]) + zlib.compress(index.astype('<u4').tobytes() + rank.tobytes())
+
+    @classmethod
+    def from_bytes(cls, payload):
+        data = zlib.decompress(payload[1:])
+        if not payload[0] & SPARSE_FLAG:
+            return cls(payload[0], np.frombuffer(data, dtype=np.uint8).copy())
+        entries = len(data) // 5
+        index = np.frombuffer(data[:4 * entries], dtype='<u4').astype(np.uint32)
+        rank = np.frombuffer(data[4 * entries:], dtype=np.uint8).copy()
+        return cls(payload[0] & ~SPARSE_FLAG, sparse=(index, rank))
+
+
+# KLL quantile sketch: level h holds items of weight 2**h. A level over its capacity is sorted and
+# every other item (random offset) is promoted, so the sketch keeps about 3k items whatever the input size.
+class KllSketch:
+    kind = 'kll'
+
+    def __init__(self, k=KLL_K):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(KLL_SEED)
+
+    def capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        while True:
+            level = next((h for h, items in enumerate(self.levels) if len(items) > self.capacity(h)), None)
+            if level is None:
+                return
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            # An odd item out stays behind so the promoted half carries exactly twice the weight
+            keep = len(items) % 2
+            self.levels[level] = items[:keep]
+            promoted = items[keep + self._rng.integers(2)::2]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+    def add(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.n += len(values)
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self._compress()
+        return self
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    # Retained items and their weights, e.g. for plt.hist(values, weights=weights)
+    def values_and_weights(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** h, dtype='int64') for h, items in enumerate(self.levels)])
+        return values, weights
+
+    def quantiles(self, qs):
+        qs = np.atleast_1d(np.asarray(qs, dtype='float64'))
+        if self.n == 0:
+            return np.full(len(qs), np.nan)
+        values, weights = self.values_and_weights()
+        order = np.argsort(values, kind='stable')
+        values, cumulative = values[order], np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, qs * cumulative[-1], side='left').clip(0, len(values) - 1)
+        result = values[positions]
+        result[qs <= 0] = self.min
+        result[qs >= 1] = self.max
+        return result
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def to_bytes(self):
+        header = [self.k, self.n, self.min, self.max, len(self.levels)] + [len(items) for items in self.levels]
+        return np.concatenate([np.asarray(header, dtype='float64')] + self.levels).tobytes()
+
+    @classmethod
+    def from_bytes(cls, payload):
+        data = np.frombuffer(payload, dtype='float64')
+        sketch = cls(int(data[0]))
+        sketch.n, sketch.min, sketch.max = int(data[1]), data[2], data[3]
+        sizes = data[5:5 + int(data[4])].astype(int)
+        bounds = np.cumsum(np.concatenate([[5 + len(sizes)], sizes]))
+        sketch.levels = [data[start:end].copy() for start, end in zip(bounds[:-1], bounds[1:])]
+        return sketch
+
+
+SKETCH_TYPES = {cls.kind: cls for cls in (HyperLogLog, KllSketch)}
+
+
+def with_sketch_columns(df):
+    if 'eps' not in df.columns and {'total_usd', 'netprice_usd'} <= set(df.columns):
+        df = df.assign(eps=booking_eps(df))
+    return df
+
+
+# All sketches of one partition (or of several merged), keyed by (dimension, key, column)
+class SketchSet:
+    def __init__(self, sketches=None, dimensions=None):
+        self.sketches = sketches or {}
+        self.dimensions = dimensions or sketch_dimensions()
+
+    def _sketch(self, dimension, key, column, cls):
+        sketch = self.sketches.get((dimension, key, column))
+        if sketch is None:
+            sketch = self.sketches[(dimension, key, column)] = cls()
+        return sketch
+
+    # Fold one chunk of bookings into every dimension's sketches
+    def add_frame(self, df):
+        df = with_sketch_columns(df)
+        for dimension, keys in self.dimensions.items():
+            if not set(keys) <= set(df.columns):
+                continue
+            # Rows with a missing key (code -1) are not sketched
+            codes, group_keys = group_codes(df, keys, dropna=True)
+            group_keys = [tuple(python_value(v) for v in row) for row in group_keys.to_numpy()]
+            valid = codes >= 0
+            for column in DISTINCT_COLUMNS:
+                if column not in df.columns:
+                    continue
+                values = df[column].notna().to_numpy() & valid
+                if not values.any():
+                    continue
+                # Highest rank per (group, register) for the whole chunk, then one sparse update per group
+                index, rank = hll_updates(df[column].to_numpy()[values], HLL_PRECISION)
+                group_registers = (codes[values].astype(np.uint64) << np.uint64(HLL_PRECISION)) + index.astype(np.uint64)
+                keys, rank = max_rank_per_register(group_registers, rank)
+                groups = (keys >> np.uint64(HLL_PRECISION)).astype(np.intp)
+                index = (keys & np.uint64((1 << HLL_PRECISION) - 1)).astype(np.uint32)
+                starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+                for start, end in zip(starts, np.r_[starts[1:], len(groups)]):
+                    self._sketch(dimension, group_keys[groups[start]], column, HyperLogLog).update(index[start:end], rank[start:end])
+            for column in QUANTILE_COLUMNS:
+                if column not in df.columns:
+                    continue
+                order = np.argsort(codes, kind='stable')
+                values = df[column].to_numpy(dtype='float64', na_value=np.nan)[order]
+                sorted_codes = codes[order]
+                starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+                for start, chunk in zip(starts, np.split(values, starts[1:])):
+                    if sorted_codes[start] >= 0:
+                        self._sketch(dimension, group_keys[sorted_codes[start]], column, KllSketch).add(chunk)
+        return self
+
+    def merge(self, other):
+        for (dimension, key, column), sketch in other.sketches.items():
+            mine = self.sketches.get((dimension, key, column))
+            if mine is None:
+                self.sketches[(dimension, key, column)] = type(sketch).from_bytes(sketch.to_bytes())
+            else:
+                mine.merge(sketch)
+        return self
+
+    # Only the sketches of the given dimensions (shared, not copied)
+    def select(self, dimensions):
+        return SketchSet({k: s for k, s in self.sketches.items() if k[0] in dimensions},
+                         {d: keys for d, keys in self.dimensions.items() if d in dimensions})
+
+    def get(self, dimension, column, key=()):
+        return self.sketches.get((dimension, tuple(key), column))
+
+    def items(self, dimension, column):
+        return [(key, sketch) for (d, key, c), sketch in self.sketches.items() if d == dimension and c == column]
+
+    def to_frame(self):
+        return pd.DataFrame([
+            {'dimension': d, 'key': json.dumps(list(key)), 'column': c, 'kind': s.kind, 'payload': s.to_bytes()}
+            for (d, key, c), s in self.sketches.items()
+        ], columns=['dimension', 'key', 'column', 'kind', 'payload'])
+
+    @classmethod
+    def from_frame(cls, df, dimensions=None):
+        return cls({
+            (row.dimension, tuple(json.loads(row.key)), row.column): SKETCH_TYPES[row.kind].from_bytes(row.payload)
+            for row in df.itertuples(index=False)
+        }, dimensions)
+
+
+def sketch_dir(path=None):
+    return os.path.join(snapshot_dir(path), 'sketches')
+
+
+def read_sketch_manifest(path=None):
+    manifest_path = os.path.join(sketch_dir(path), 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def write_sketch_manifest(manifest, path=None):
+    manifest_path = os.path.join(sketch_dir(path), 'manifest.json')
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+# Size and mtime of each part file, to tell new parts from rewritten ones
+def part_signatures(files):
+    signatures = {}
+    for f in files:
+        stat = os.stat(f)
+        signatures[os.path.basename(f)] = [stat.st_size, stat.st_mtime_ns]
+    return signatures
+
+
+# One streaming pass over part files: only one part is in memory at a time
+def sketch_files(files, sketches=None):
+    sketches = sketches or SketchSet()
+    columns = SOURCE_COLUMNS + sorted({k for keys in sketches.dimensions.values() for k in keys})
+    for f in files:
+        sketches.add_frame(pd.read_parquet(f, columns=columns))
+    return sketches
+
+
+# Bring the stored sketches of the given year partitions up to date and return them per partition,
+# restricted to `dimensions` when given (e.g. ['all']; up-to-date partitions then only read those rows).
+# New part files are sketched and merged in; if a covered part was rewritten or removed (updated
+# bookings), or the sketched dimensions (SKETCH_ROUTES) or SKETCH_VERSION changed, the partition is re-sketched from
+# scratch, since sketches cannot subtract.
+def refresh_sketches(years=None, path=None, dimensions=None):
+    from analytics.profiling import span
+
+    directory = sketch_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_sketch_manifest(path)
+    built = sketch_dimensions()
+    by_partition = {}
+    for f in partition_files(path, years):
+        by_partition.setdefault(os.path.basename(os.path.dirname(f)), []).append(f)
+
+    result = {}
+    changed = False
+    for partition, files in sorted(by_partition.items()):
+        current = part_signatures(files)
+        entry = manifest.get(partition, {})
+        covered = entry.get('parts', {})
+        sketch_path = os.path.join(directory, f"{partition}.parquet")
+        incremental = (os.path.exists(sketch_path) and entry.get('dimensions') == sorted(built)
+                       and entry.get('version') == SKETCH_VERSION
+                       and all(current.get(name) == sig for name, sig in covered.items()))
+        new_files = [f for f in files if os.path.basename(f) not in covered] if incremental else files
+        if incremental and not new_files:
+            filters = [('dimension', 'in', list(dimensions))] if dimensions is not None else None
+            result[partition] = SketchSet.from_frame(pd.read_parquet(sketch_path, filters=filters), built)
+            continue
+
+        sketches = SketchSet.from_frame(pd.read_parquet(sketch_path), built) if incremental else SketchSet(dimensions=built)
+        with span('sketch', partition=partition, parts=len(new_files)):
+            sketch_files(new_files, sketches)
+        tmp_path = f"{sketch_path}.{os.getpid()}.tmp"
+        sketches.to_frame().to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, sketch_path)
+        manifest[partition] = {'version': SKETCH_VERSION, 'dimensions': sorted(built), 'parts': current}
+        changed = True
+        result[partition] = sketches.select(dimensions) if dimensions is not None else sketches
+    if changed:
+        write_sketch_manifest(manifest, path)
+    return result
+
+
+# Sketches of the requested years merged into one set, only for `dimensions` when given
+def load_sketches(years=None, path=None, dimensions=None):
+    merged = SketchSet()
+    for sketches in refresh_sketches(years, path, dimensions).values():
+        merged.merge(sketches)
+    return merged
+
+
+def distinct_counts(sketches, dimension, column='cust_id'):
+    keys = {**SKETCH_DIMENSIONS, **OPTIONAL_DIMENSIONS}[dimension]
+    rows = [dict(zip(keys, key), **{f"distinct_{column}": s.count()}) for key, s in sketches.items(dimension, column)]
+    return pd.DataFrame(rows, columns=keys + [f"distinct_{column}"]).sort_values(f"distinct_{column}", ascending=False, ignore_index=True)
+
+
+def quantile_table(sketches, dimension, column, qs=(0.1, 0.25, 0.5, 0.75, 0.9)):
+    keys = {**SKETCH_DIMENSIONS, **OPTIONAL_DIMENSIONS}[dimension]
+    rows = []
+    for key, s in sketches.items(dimension, column):
+        row = dict(zip(keys, key), count=s.n)
+        row.update({f"p{int(q * 100)}": v for q, v in zip(qs, s.quantiles(qs))})
+        rows.append(row)
+    return pd.DataFrame(rows).sort_values('count', ascending=False, ignore_index=True) if rows else pd.DataFrame()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or refresh the per-partition snapshot sketches.')
+    parser.add_argument('--years', type=int, nargs='+')
+    parser.add_argument('--dimension', default='all', choices=sorted(sketch_dimensions()))
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    partitions = refresh_sketches(args.years)
+    for partition, sketches in partitions.items():
+        size = sum(len(s.to_bytes()) for s in sketches.sketches.values())
+        print(f"{partition}: {len(sketches.sketches)} sketches, {size / 1024:.1f} KB")
+    merged = load_sketches(args.years, dimensions=[args.dimension])
+    print(distinct_counts(merged, args.dimension).head(args.top).to_string(index=False))
+    for column in QUANTILE_COLUMNS:
+        print(quantile_table(merged, args.dimension, column).head(args.top).to_string(index=False))
@@ -0,0 +1,212 @@
+import glob
+import json
+import os
+import re
+
+import pandas as pd
+
+from analytics.db import BOOKING_TABLE, get_engine, read_sql
+
+# Local columnar copy of analytic_test_booking, partitioned by year of godate:
+#   <SNAPSHOT_DIR>/year=2019/part-00000.parquet
+#   <SNAPSHOT_DIR>/manifest.json   (high-water marks and part counter)
+# A refresh is crash-safe chunk by chunk: a chunk's part files are written under a .tmp name, renamed
+# once superseded rows are gone from the older parts, and next_part is advanced in the manifest right
+# after. The bid/stamp high-water marks only move once the whole refresh is done (chunks arrive in no
+# particular order), so a rerun fetches the same rows again and replaces them instead of duplicating them.
+# Temp files and parts numbered at or past next_part are leftovers of an interrupted refresh and are
+# deleted first; an interrupted first copy (no high-water marks yet) starts over from no parts.
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'snapshot')
+
+PARTITION_COLUMN = 'godate'
+DATE_COLUMNS = ['paidon', 'godate', 'createdon', 'createdon_date', 'refund_date']
+NULL_PARTITION = 'year=__null__'
+
+
+def snapshot_dir(path=None):
+    return path or os.getenv('SNAPSHOT_DIR') or DEFAULT_SNAPSHOT_DIR
+
+
+def read_manifest(path=None):
+    manifest_path = os.path.join(snapshot_dir(path), 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, path=None):
+    manifest_path = os.path.join(snapshot_dir(path), 'manifest.json')
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+# Normalise date columns so every partition stores them as datetime64
+def normalize_dates(df):
+    for column in DATE_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+    return df
+
+
+def partition_name(year):
+    return NULL_PARTITION if pd.isna(year) else f"year={int(year)}"
+
+
+PART_FILE = re.compile(r'part-(\d+)\.parquet$')
+
+
+# Write one fetched chunk as a new part file in each year partition it touches; returns the files written
+def write_chunk(df, path, part, suffix=''):
+    df = normalize_dates(df)
+    years = df[PARTITION_COLUMN].dt.year
+    written = []
+    for year, rows in df.groupby(years, dropna=False):
+        partition_dir = os.path.join(path, partition_name(year))
+        os.makedirs(partition_dir, exist_ok=True)
+        written.append(os.path.join(partition_dir, f"part-{part:05d}.parquet{suffix}"))
+        rows.to_parquet(written[-1], index=False)
+    return written
+
+
+# Delete what an interrupted refresh left behind: temp files and parts the manifest does not count yet
+def discard_unlisted_parts(path, manifest):
+    next_part = (manifest or {}).get('next_part', 0)
+    for leftover in glob.glob(os.path.join(path, 'year=*', '*.tmp')):
+        os.remove(leftover)
+    for part_file in glob.glob(os.path.join(path, 'year=*', 'part-*.parquet')):
+        match = PART_FILE.search(part_file)
+        if match and int(match.group(1)) >= next_part:
+            os.remove(part_file)
+
+
+# Part file of every stored bid, read once per refresh
+def bid_locations(path):
+    frames = [
+        pd.DataFrame({'bid': pd.read_parquet(part_file, columns=['bid'])['bid'], 'file': part_file})
+        for part_file in glob.glob(os.path.join(path, 'year=*', 'part-*.parquet'))
+    ]
+    if not frames:
+        return pd.Series(dtype=object, name='file')
+    return pd.concat(frames, ignore_index=True).set_index('bid')['file']
+
+
+# Drop rows of existing part files whose bid was re-fetched, so every bid lives in exactly one file.
+# locations (from bid_locations) says which files hold the bids, so only those are read and rewritten.
+# Returns the superseded rows so derived aggregates can subtract them, and the updated locations.
+def remove_bids(bids, locations):
+    stale_locations = locations[locations.index.isin(bids)]
+    removed = []
+    for part_file in stale_locations.unique():
+        rows = pd.read_parquet(part_file)
+        stale = rows['bid'].isin(bids).to_numpy()
+        removed.append(rows[stale])
+        rows = rows[~stale]
+        if rows.empty:
+            os.remove(part_file)
+        else:
+            tmp_path = f"{part_file}.{os.getpid()}.tmp"
+            rows.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, part_file)
+    locations = locations[~locations.index.isin(bids)]
+    return (pd.concat(removed, ignore_index=True) if removed else None), locations
+
+
+# Materialise or incrementally refresh the snapshot.
+# The first run copies the whole table; later runs only fetch rows whose bid or stamp
+# is newer than the stored high-water marks, so updated bookings (e.g. refunds) are picked up too.
+# on_change(added, removed) is called per chunk with the fetched rows and the rows they superseded.
+def refresh_snapshot(engine=None, path=None, chunksize=100_000, on_change=None):
+    engine = engine or get_engine()
+    path = snapshot_dir(path)
+    os.makedirs(path, exist_ok=True)
+    manifest = read_manifest(path)
+
+    if manifest is None or manifest['bid'] is None:
+        manifest = {'bid': None, 'stamp': None, 'next_part': (manifest or {}).get('next_part', 0)}
+        query = f"SELECT * FROM {BOOKING_TABLE}"
+        params = None
+    else:
+        query = f"SELECT * FROM {BOOKING_TABLE} WHERE bid > :bid OR stamp > :stamp"
+        params = {'bid': manifest['bid'], 'stamp': manifest['stamp']}
+
+    discard_unlisted_parts(path, manifest if params is not None else None)
+    locations = bid_locations(path) if params is not None else None
+
+    fetched = 0
+    max_bid, max_stamp = manifest['bid'], manifest['stamp']
+    for chunk in read_sql(query, engine, params=params, chunksize=chunksize):
+        if chunk.empty:
+            continue
+        part = manifest['next_part']
+        written = write_chunk(chunk, path, part, suffix='.tmp')
+        removed = None
+        if locations is not None:
+            removed, locations = remove_bids(chunk['bid'], locations)
+        for tmp_path in written:
+            part_file = tmp_path[:-len('.tmp')]
+            os.replace(tmp_path, part_file)
+            if locations is not None:
+                bids = pd.read_parquet(part_file, columns=['bid'])['bid']
+                locations = pd.concat([locations, pd.Series(part_file, index=bids, name='file')])
+        manifest['next_part'] = part + 1
+        write_manifest(manifest, path)
+        if on_change is not None:
+            on_change(chunk, removed)
+
+        chunk_bid = chunk['bid'].max()
+        chunk_stamp = chunk['stamp'].max()
+        if max_bid is None or chunk_bid > max_bid:
+            max_bid = int(chunk_bid)
+        if pd.notna(chunk_stamp) and (max_stamp is None or str(chunk_stamp) > max_stamp):
+            max_stamp = str(chunk_stamp)
+        fetched += len(chunk)
+
+    manifest['bid'], manifest['stamp'] = max_bid, max_stamp
+    manifest['refreshed_at'] = pd.Timestamp.now().isoformat()
+    write_manifest(manifest, path)
+    return fetched
+
+
+# Return the part files for the requested years (all partitions when years is None)
+def partition_files(path=None, years=None):
+    path = snapshot_dir(path)
+    if years is None:
+        pattern = [os.path.join(path, 'year=*', 'part-*.parquet')]
+    else:
+        pattern = [os.path.join(path, partition_name(year), 'part-*.parquet') for year in years]
+    return sorted(f for p in pattern for f in glob.glob(p))
+
+
+# Load the snapshot into a DataFrame, reading only the requested columns and year partitions.
+# With encode=True the string dimensions are dictionary-encoded part by part as they are read.
+def load_snapshot(columns=None, years=None, path=None, encode=False):
+    files = partition_files(path, years)
+    if not files:
+        raise FileNotFoundError(f"No snapshot found in {snapshot_dir(path)}; run `python -m analytics.snapshot` first")
+    from analytics.profiling import frame_bytes, span
+
+    with span('fetch', snapshot=snapshot_dir(path), partitions=len(files)) as s:
+        frames = [pd.read_parquet(f, columns=columns) for f in files]
+        if encode:
+            from analytics.dictionary import align_categories, encode_frame
+
+            frames = align_categories([encode_frame(f, path=path) for f in frames])
+        df = pd.concat(frames, ignore_index=True)
+        if s.enabled:
+            s.set(rows=len(df), bytes=frame_bytes(df))
+    return df
+
+
+# Add YEAR()/MONTH() style columns for a date column, mirroring the SQL the reports use
+def with_date_parts(df, column, prefix=''):
+    df[f"{prefix}year"] = df[column].dt.year
+    df[f"{prefix}month"] = df[column].dt.month
+    return df
+
+
+if __name__ == '__main__':
+    rows = refresh_snapshot()
+    print(f"Snapshot refreshed in {snapshot_dir()}: {rows} new or updated rows.")
@@ -0,0 +1,63 @@
+import pandas as pd
+
+
+# Yield the result of a query in fixed-size chunks through a server-side cursor,
+# so only one chunk is held in memory at a time
+def stream_sql(query, engine, chunksize=50_000):
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn:
+        for chunk in pd.read_sql(query, conn, chunksize=chunksize):
+            yield chunk
+
+
+# Running per-group aggregates that are folded chunk by chunk.
+# aggregations maps a column to 'sum' or 'mean' (like a DataFrame.agg dict); means are kept
+# as sum + non-null count, so memory only grows with the number of groups, not rows.
+class GroupAccumulator:
+    def __init__(self, keys, aggregations):
+        self.keys = list(keys)
+        self.aggregations = dict(aggregations)
+        self.rows = 0
+        self._state = None
+        self._dtypes = {}
+
+    def add(self, chunk):
+        columns = list(self.aggregations)
+        mean_columns = [c for c, how in self.aggregations.items() if how == 'mean']
+        if not self._dtypes:
+            self._dtypes = chunk[columns].dtypes.to_dict()
+
+        grouped = chunk[self.keys + columns].groupby(self.keys)
+        partial = grouped.sum()
+        if mean_columns:
+            counts = chunk[mean_columns].notna().groupby([chunk[k] for k in self.keys]).sum()
+            partial = partial.join(counts.add_suffix('__count'))
+
+        self._state = partial if self._state is None else self._state.add(partial, fill_value=0)
+        self.rows += len(chunk)
+
+    def result(self):
+        if self._state is None:
+            return pd.DataFrame(columns=self.keys + list(self.aggregations))
+
+        result = pd.DataFrame(index=self._state.index)
+        for column, how in self.aggregations.items():
+            if how == 'mean':
+                count = self._state[f"{column}__count"]
+                result[column] = self._state[column] / count.where(count > 0)
+            else:
+                result[column] = self._state[column]
+                if pd.api.types.is_integer_dtype(self._dtypes.get(column)):
+                    result[column] = result[column].astype('int64')
+        return result.sort_index().reset_index()
+
+
+# Running value -> frequency table, e.g. for histograms of a streamed column
+class ValueCounter:
+    def __init__(self):
+        self.counts = pd.Series(dtype='int64')
+
+    def add(self, values):
+        self.counts = self.counts.add(values.dropna().value_counts(), fill_value=0).astype('int64')
+
+    def values_and_weights(self):
+        return self.counts.index.to_numpy(), self.counts.to_numpy()
@@ -0,0 +1,36 @@
+import numpy as np
+
+# Top-N selection without sorting every candidate.
+# np.argpartition picks the k largest values in linear time and only those k are sorted,
+# so ranking the best routes out of hundreds of thousands costs one pass over the EPS column.
+
+
+# Positions of the k largest values, best first; NaN (e.g. EPS of a route without seats) never ranks
+def top_k_indices(values, k):
+    values = np.asarray(values, dtype='float64')
+    candidates = np.flatnonzero(~np.isnan(values))
+    if k <= 0 or len(candidates) == 0:
+        return candidates[:0]
+    if k < len(candidates):
+        candidates = candidates[np.argpartition(-values[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-values[candidates], kind='stable')]
+
+
+# The n rows with the largest `column`, overall or within each group of `by` (e.g. ['year', 'vehclass_id'])
+def top_n(df, column, n, by=None):
+    values = df[column].to_numpy(dtype='float64')
+    if not by:
+        return df.iloc[top_k_indices(values, n)].reset_index(drop=True)
+
+    # Row positions per group come from the groupby hash table, then each group is partitioned on its own;
+    # no step orders all the rows
+    groups = df.groupby(by, dropna=False, observed=True, sort=True).indices.values()
+    picks = [group[top_k_indices(values[group], n)] for group in groups if len(group)]
+    return df.iloc[np.concatenate(picks) if picks else []].reset_index(drop=True)
+
+
+# Top n routes by EPS per year, optionally per country or vehclass as well.
+# routes holds one row per year and route with an EPS column (EpsCube.rollup or route totals + with_eps).
+def top_routes(routes, n, per=None, year_column='year'):
+    by = [year_column] + ([per] if isinstance(per, str) else list(per or []))
+    return top_n(routes, 'EPS', n, by=by)
@@ -0,0 +1,99 @@
+import functools
+import re
+
+import numpy as np
+import pandas as pd
+
+# User-agent normalisation: raw user_agent strings are nearly unique per device and app version,
+# so they are reduced to a "device / OS / browser" family before aggregation.
+# Parsing is memoised with an LRU cache because the same strings repeat heavily, and encoded
+# (Categorical) columns are parsed once per distinct label rather than once per row.
+USER_AGENT_CACHE_SIZE = 65536
+UNKNOWN = 'Other'
+
+# First match wins, so more specific patterns come before the generic ones they contain
+# (Edge and Opera announce themselves as Chrome, Chrome announces itself as Safari)
+BOT_PATTERN = re.compile(r'bot|crawl|spider|slurp|curl|wget|python-requests|headless', re.IGNORECASE)
+
+OS_PATTERNS = [
+    ('iOS', re.compile(r'iPhone|iPad|iPod|\biOS\b', re.IGNORECASE)),
+    ('Android', re.compile(r'Android', re.IGNORECASE)),
+    ('Windows', re.compile(r'Windows', re.IGNORECASE)),
+    ('macOS', re.compile(r'Mac OS X|Macintosh', re.IGNORECASE)),
+    ('Chrome OS', re.compile(r'CrOS', re.IGNORECASE)),
+    ('Linux', re.compile(r'Linux|X11', re.IGNORECASE)),
+]
+
+BROWSER_PATTERNS = [
+    ('In-App', re.compile(r'FBAN|FBAV|Instagram|Line/|WebView|; wv\)|okhttp|Dalvik|CFNetwork', re.IGNORECASE)),
+    ('Edge', re.compile(r'Edg(e|A|iOS)?/', re.IGNORECASE)),
+    ('Opera', re.compile(r'OPR/|Opera', re.IGNORECASE)),
+    ('Samsung Internet', re.compile(r'SamsungBrowser', re.IGNORECASE)),
+    ('Yandex', re.compile(r'YaBrowser', re.IGNORECASE)),
+    ('Firefox', re.compile(r'Firefox|FxiOS', re.IGNORECASE)),
+    ('Chrome', re.compile(r'Chrome|CriOS', re.IGNORECASE)),
+    ('Safari', re.compile(r'Safari', re.IGNORECASE)),
+    ('Internet Explorer', re.compile(r'MSIE|Trident/', re.IGNORECASE)),
+]
+
+TABLET_PATTERN = re.compile(r'iPad|Tablet|Android(?!.*Mobile)', re.IGNORECASE)
+MOBILE_PATTERN = re.compile(r'Mobi|iPhone|iPod|Android|Windows Phone', re.IGNORECASE)
+
+
+def first_match(patterns, user_agent):
+    for name, pattern in patterns:
+        if pattern.search(user_agent):
+            return name
+    return UNKNOWN
+
+
+# (device, os, browser) for one user-agent string, e.g. ('Mobile', 'Android', 'Chrome')
+@functools.lru_cache(maxsize=USER_AGENT_CACHE_SIZE)
+def parse_user_agent(user_agent):
+    if not user_agent:
+        return (UNKNOWN, UNKNOWN, UNKNOWN)
+    if BOT_PATTERN.search(user_agent):
+        return ('Bot', UNKNOWN, UNKNOWN)
+    if TABLET_PATTERN.search(user_agent):
+        device = 'Tablet'
+    elif MOBILE_PATTERN.search(user_agent):
+        device = 'Mobile'
+    else:
+        device = 'Desktop'
+    return (device, first_match(OS_PATTERNS, user_agent), first_match(BROWSER_PATTERNS, user_agent))
+
+
+def user_agent_family(user_agent):
+    if user_agent is None or (isinstance(user_agent, float) and np.isnan(user_agent)):
+        return None
+    return ' / '.join(parse_user_agent(str(user_agent)))
+
+
+# Family label for every value of a user-agent column. Only distinct strings are parsed:
+# the categories of an encoded column, otherwise the uniques of the chunk.
+def normalize_user_agents(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # NULL codes are -1 and index the trailing None, which also covers a column with no categories
+        families = np.array([user_agent_family(ua) for ua in values.cat.categories] + [None], dtype=object)
+        mapped = families[values.cat.codes.to_numpy()]
+    else:
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        families = np.array([user_agent_family(ua) for ua in uniques] + [None], dtype=object)
+        mapped = families[codes]
+    return pd.Series(mapped, index=values.index, name=f"{values.name}_family").astype('category')
+
+
+# Streaming transform: add the low-cardinality family column to each fetched chunk or partition.
+# The parse cache is shared between chunks, so later chunks are mostly cache hits.
+def with_user_agent_family(df, column='user_agent', target='user_agent_family'):
+    df[target] = normalize_user_agents(df[column])
+    return df
+
+
+def iter_with_user_agent_family(chunks, column='user_agent', target='user_agent_family'):
+    for chunk in chunks:
+        yield with_user_agent_family(chunk, column, target)
+
+
+def parser_cache_info():
+    return parse_user_agent.cache_info()
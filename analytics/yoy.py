@@ -0,0 +1,100 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from analytics.db import BOOKING_TABLE, get_engine, read_sql, use_snapshot
+from analytics.eps_cube import ROUTE_DIMENSIONS, get_cube
+from analytics.metrics import group_codes, per_seat
+from analytics.query_builder import period_predicate
+
+# Year-over-year route comparison (queries 2-4 of hypothesis_2.sql in one result).
+# Every year is aggregated once, routes are joined on compact integer keys instead of
+# four string columns, and the output holds EPS_<base>, EPS_<target>, the change in percent
+# and the seats delta per route.
+YOY_MEASURES = ['seats', 'netprice_usd', 'total_usd']
+
+
+# One scan of the bookings: route totals per year of paidon (or date_column) for the requested years
+def route_year_totals_query(years, quarters=None, dimensions=None, date_column='paidon'):
+    dimensions = dimensions or ROUTE_DIMENSIONS
+    columns = ',\n    '.join(dimensions)
+    return f"""
+SELECT
+    YEAR({date_column}) AS year,
+    {columns},
+    SUM(seats) AS seats,
+    SUM(netprice_usd) AS netprice_usd,
+    SUM(total_usd) AS total_usd
+FROM
+    {BOOKING_TABLE}
+WHERE
+    {period_predicate(date_column, years, quarters)}
+GROUP BY
+    YEAR({date_column}), {', '.join(dimensions)}
+"""
+
+
+def eps_from_sums(total, netprice, seats):
+    return per_seat(np.asarray(total, dtype='float64') - np.asarray(netprice, dtype='float64'), seats)
+
+
+# Compare two years route by route.
+# df holds year, the route dimensions and per-row or pre-aggregated seats/netprice_usd/total_usd
+# (bookings, cube cells or the output of route_year_totals_query).
+# base_routes_only keeps the routes sold in the base year (the IN (...) filter of queries 2 and 4);
+# top keeps only the N best base-year routes by EPS (the LIMIT 10 of query 3).
+def compare_years(df, base=2019, target=2023, dimensions=None, year_column='year', base_routes_only=True, top=None):
+    dimensions = dimensions or ROUTE_DIMENSIONS
+    df = df[df[year_column].isin([base, target])]
+    # Integer route key per row (NULL keys form their own route, as in SQL GROUP BY) and the key table
+    codes, result = group_codes(df, dimensions)
+    routes = len(result)
+    years = df[year_column].to_numpy()
+
+    for year in (base, target):
+        mask = years == year
+        sums = {m: np.bincount(codes[mask], weights=df[m].to_numpy(dtype='float64')[mask], minlength=routes)
+                for m in YOY_MEASURES}
+        result[f"EPS_{year}"] = eps_from_sums(sums['total_usd'], sums['netprice_usd'], sums['seats'])
+        result[f"seats_{year}"] = sums['seats'].round().astype('int64')
+        result[f"sold_{year}"] = np.bincount(codes[mask], minlength=routes) > 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = (result[f"EPS_{target}"] - result[f"EPS_{base}"]) / result[f"EPS_{base}"] * 100
+    result['EPS_change_percentage'] = change.replace([np.inf, -np.inf], np.nan)
+    result['seats_change'] = result[f"seats_{target}"] - result[f"seats_{base}"]
+
+    if base_routes_only:
+        result = result[result[f"sold_{base}"]]
+    if top is not None:
+        result = result.nlargest(top, f"EPS_{base}")
+    result = result[dimensions + [f"EPS_{base}", f"EPS_{target}", 'EPS_change_percentage',
+                                  f"seats_{base}", f"seats_{target}", 'seats_change']]
+    return result.sort_values('EPS_change_percentage', na_position='last', ignore_index=True)
+
+
+def fetch_route_comparison(engine, base=2019, target=2023, quarters=None, **kwargs):
+    totals = read_sql(route_year_totals_query([base, target], quarters), engine)
+    return compare_years(totals, base, target, **kwargs)
+
+
+# Same comparison from the EPS cube, without touching the bookings
+def cube_route_comparison(cube, base=2019, target=2023, **kwargs):
+    cells = cube.rollup(['year'] + ROUTE_DIMENSIONS, years=[base, target])
+    return compare_years(cells, base, target, **kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare route EPS and seats between two years.')
+    parser.add_argument('--base', type=int, default=2019)
+    parser.add_argument('--target', type=int, default=2023)
+    parser.add_argument('--top', type=int, help='only the N best base-year routes by EPS')
+    args = parser.parse_args()
+
+    if use_snapshot():
+        comparison = cube_route_comparison(get_cube(), args.base, args.target, top=args.top)
+    else:
+        comparison = fetch_route_comparison(get_engine(), args.base, args.target, top=args.top)
+    pd.set_option('display.width', 200)
+    print(comparison.to_string(index=False))
@@ -0,0 +1,110 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from analytics.refunds import classify_refund_rates, refund_summary_lines, with_refund_rate
+
+# Compares the original row-wise refund-rate post-processing of hypothesis_1.py
+# (apply(axis=1) + apply + iterrows) with the vectorised classifier.
+#   python -m benchmarks.bench_refund_rate [--groups 100000]
+
+
+def make_groups(groups, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'year': np.arange(groups),
+        'total_orders': rng.integers(0, 5000, groups),
+    })
+    # At least one refund where there are orders: the legacy summary loop divides by refund_count
+    df['refund_count'] = np.maximum(rng.binomial(df['total_orders'], 0.05), np.minimum(df['total_orders'], 1))
+    # A few anomalies: more refunds than orders
+    anomalies = rng.random(groups) < 0.001
+    df.loc[anomalies, 'refund_count'] = df.loc[anomalies, 'total_orders'] + 1
+    return with_refund_rate(df)
+
+
+# The post-processing exactly as hypothesis_1.py did it before vectorisation (copied verbatim)
+def legacy_post_processing(df):
+    # Replace anomalies with descriptive text
+    def calculate_refund_rate(row):
+        if row['total_orders'] == 0:
+            if row['refund_count'] > 0:
+                return "N/A (No Orders)"
+            else:
+                return "0.0000"
+        elif row['refund_rate'] > 1:
+            return "Anomaly"
+        else:
+            return row['refund_rate']
+
+    df['refund_rate'] = df.apply(calculate_refund_rate, axis=1)
+
+    # Correct the refund_rate column for string cases before rounding
+    def safe_round(refund_rate):
+        try:
+            return round(float(refund_rate), 4)
+        except (ValueError, TypeError):
+            return refund_rate
+
+    # Apply the safe rounding function
+    df['refund_rate'] = df['refund_rate'].apply(safe_round)
+
+    # Convert refund_rate to float for visualization (ignore anomalies for plotting)
+    df['refund_rate_float'] = pd.to_numeric(df['refund_rate'], errors='coerce')
+
+    # Calculate yearly refund statistics
+    yearly_refund_stats = []
+    for _, row in df.iterrows():
+        year = int(row['year'])
+        total_orders_year = row['total_orders']
+        refund_count_year = row['refund_count']
+
+        if total_orders_year > 0:
+            refund_stat = f"{year}: 1 of every {round(total_orders_year / refund_count_year)} orders refunded ({row['refund_rate']} refund rate)"
+        else:
+            refund_stat = f"{year}: N/A (No Orders)"
+
+        yearly_refund_stats.append(refund_stat)
+    return df, yearly_refund_stats
+
+
+# Groups where the two versions are expected to differ by one unit in the 4th decimal:
+# round() rounds the binary value of the rate, np.round rounds rate * 10**4, so a rate whose
+# decimal expansion ends in 5 right after the 4th place (e.g. 7/160 = 0.04375) can go either way
+def halfway_rates(df):
+    scaled = df['refund_count'] / df['total_orders'].where(df['total_orders'] > 0) * 10**4
+    return (scaled - np.floor(scaled) - 0.5).abs() < 1e-6
+
+
+def vectorized_post_processing(df):
+    df = classify_refund_rates(df)
+    return df, refund_summary_lines(df).tolist()
+
+
+def time_it(func, df):
+    start = time.perf_counter()
+    result = func(df.copy())
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark refund-rate post-processing.')
+    parser.add_argument('--groups', type=int, default=100_000)
+    args = parser.parse_args()
+
+    df = make_groups(args.groups)
+    legacy_seconds, (legacy, _) = time_it(legacy_post_processing, df)
+    vector_seconds, (vector, _) = time_it(vectorized_post_processing, df)
+
+    # Both versions give the same numeric rate, including 0 for a group with neither orders nor refunds,
+    # except for the documented rounding of half-way rates
+    exact = ~halfway_rates(df)
+    pd.testing.assert_series_equal(legacy['refund_rate_float'][exact], vector['refund_rate'][exact], check_names=False)
+    assert ((legacy['refund_rate_float'] - vector['refund_rate'])[~exact].abs() <= 1.0001e-4).all()
+
+    print(f"groups:      {args.groups:,}")
+    print(f"row-wise:    {legacy_seconds:.3f}s")
+    print(f"vectorised:  {vector_seconds:.3f}s")
+    print(f"speedup:     {legacy_seconds / vector_seconds:.0f}x")
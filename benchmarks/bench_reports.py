@@ -0,0 +1,223 @@
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import tempfile
+import time
+from graphlib import TopologicalSorter
+
+import pandas as pd
+import psutil
+
+from analytics.aggregation import aggregate_dimensions, dimension_grouping_sets
+from analytics.db import read_sql
+from analytics.dictionary import align_categories, decode, encode_frame
+from analytics.eps_cube import ROUTE_DIMENSIONS, with_eps
+from analytics.executor import run_queries
+from analytics.metrics import with_margin
+from analytics.query_builder import period_predicate
+from analytics.rendering import render_figures
+from analytics.report import ReportBuilder
+from analytics.runner import REPO_ROOT, TextValues, build_report, figure_spec, load_spec, query_sql, run_metric
+from analytics.topn import top_routes
+from analytics.user_agents import with_user_agent_family
+from analytics.yoy import compare_years, route_year_totals_query
+from benchmarks.synthetic import ensure_dataset, sqlite_engine
+
+# Times every hypothesis pipeline stage by stage (fetch, aggregate, render, pdf) against synthetic
+# SQLite stand-ins of 10^5, 10^6 and 10^7 bookings, and saves the timings so runs can be compared.
+#   python -m benchmarks.bench_reports [--rows 100000 1000000] [--compare benchmarks/results/<run>.json]
+# Datasets are generated once per size under benchmarks/.data/; the query cache is disabled.
+DEFAULT_ROWS = [100_000, 1_000_000, 10_000_000]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+STAGES = ['fetch', 'aggregate', 'render', 'pdf']
+YEARS = [2019, 2023]
+
+HYPOTHESIS_4_DIMENSIONS = ['class_name', 'website_language', 'user_agent', 'from_country_id', 'from_station_name',
+                           'to_station_name', 'createdby_role_id', 'channel', 'user_origin_country_id']
+
+
+def top_bar_spec(df, x, y, title):
+    return {
+        'series': [{'kind': 'bar', 'x': [str(v) for v in df[x]], 'y': df[y].tolist()}],
+        'title': title,
+        'xticks_rotation': 45,
+        'tight_layout': True,
+    }
+
+
+def charts_pdf(images, path):
+    pdf = ReportBuilder()
+    for image in images:
+        pdf.add_page()
+        pdf.add_chart(image, x=10, y=10, w=180)
+    return pdf.save(path)
+
+
+# Pipeline for a declarative report spec (reports/*.json), split into the runner's stages
+def spec_pipeline(spec_path):
+    spec = load_spec(spec_path)
+    values = {}
+
+    def fetch(engine):
+        for name, query in spec.get('queries', {}).items():
+            values[name] = read_sql(query_sql(query, spec), engine)
+
+    def aggregate(engine):
+        metrics = spec.get('metrics', {})
+        graph = {name: set(m.get('inputs', [m.get('input')])) & set(metrics) for name, m in metrics.items()}
+        for name in TopologicalSorter(graph).static_order():
+            metric = metrics[name]
+            values[name] = run_metric(metric, [values[i] for i in metric.get('inputs', [metric.get('input')])])
+
+    def render(engine):
+        charts = spec.get('charts', {})
+        images = render_figures([figure_spec(chart, values[chart['input']]) for chart in charts.values()])
+        values['_images'] = dict(zip(charts, images))
+
+    def pdf(engine, output):
+        build_report(dict(spec, output=output), TextValues(values), values['_images'])
+
+    return {'fetch': fetch, 'aggregate': aggregate, 'render': render, 'pdf': pdf}
+
+
+# hypothesis_2: route totals per year, top routes by EPS and the year-over-year comparison
+def hypothesis_2_pipeline():
+    values = {}
+    route_columns = ['from_country_id'] + ROUTE_DIMENSIONS
+
+    def fetch(engine):
+        values['routes'] = read_sql(route_year_totals_query(YEARS, dimensions=route_columns), engine)
+
+    def aggregate(engine):
+        routes = with_eps(values['routes'])
+        values['top'] = decode(top_routes(routes, 10))
+        values['yoy'] = compare_years(routes)
+
+    def render(engine):
+        top, yoy = values['top'], values['yoy']
+        specs = [top_bar_spec(top[top['year'] == year], 'from_station_name', 'EPS', f"Top Routes by EPS in {year}") for year in YEARS]
+        specs.append(top_bar_spec(yoy.head(10), 'from_station_name', 'EPS_change_percentage', 'Largest EPS Declines'))
+        values['images'] = render_figures(specs)
+
+    def pdf(engine, output):
+        charts_pdf(values['images'], output)
+
+    return {'fetch': fetch, 'aggregate': aggregate, 'render': render, 'pdf': pdf}
+
+
+# hypothesis_4: row-level bookings per year partition, encoded and aggregated per dimension
+def hypothesis_4_pipeline(data_path):
+    values = {}
+
+    def bookings_query(year):
+        return f"""
+SELECT YEAR(godate) AS year, MONTH(godate) AS month, {', '.join(HYPOTHESIS_4_DIMENSIONS)},
+       netprice_usd, total_usd, seats, trip_duration_minutes
+FROM `12go`.analytic_test_booking
+WHERE {period_predicate('godate', [year])}
+"""
+
+    def fetch(engine):
+        frames, _ = run_queries({year: bookings_query(year) for year in YEARS}, lambda sql: read_sql(sql, engine))
+        values['frames'] = list(frames.values())
+
+    def aggregate(engine):
+        frames = align_categories([with_user_agent_family(encode_frame(f, persist=False)) for f in values['frames']])
+        bookings = with_margin(pd.concat(frames, ignore_index=True))
+        dimensions = ['user_agent_family' if d == 'user_agent' else d for d in HYPOTHESIS_4_DIMENSIONS]
+        values['aggregates'] = aggregate_dimensions(bookings, dimension_grouping_sets(dimensions))
+        values['dimensions'] = dimensions
+
+    def render(engine):
+        specs = []
+        for dimension in values['dimensions']:
+            df = decode(values['aggregates'][dimension]).nlargest(5, 'num_bookings')
+            specs.append(top_bar_spec(df, dimension, 'num_bookings', f"Top 5 {dimension}"))
+        values['images'] = render_figures(specs)
+
+    def pdf(engine, output):
+        charts_pdf(values['images'], output)
+
+    return {'fetch': fetch, 'aggregate': aggregate, 'render': render, 'pdf': pdf}
+
+
+def pipelines(data_path):
+    return {
+        'hypothesis_1': spec_pipeline(os.path.join(REPO_ROOT, 'reports', 'hypothesis_1.json')),
+        'hypothesis_2': hypothesis_2_pipeline(),
+        'hypothesis_3': spec_pipeline(os.path.join(REPO_ROOT, 'reports', 'hypothesis_3.json')),
+        'hypothesis_4': hypothesis_4_pipeline(data_path),
+    }
+
+
+def run_benchmark(rows_list, hypotheses=None, data_dir=None):
+    process = psutil.Process()
+    records = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for rows in rows_list:
+            data_path = ensure_dataset(rows, data_dir)
+            engine = sqlite_engine(data_path)
+            for name, stages in pipelines(data_path).items():
+                if hypotheses and name not in hypotheses:
+                    continue
+                for stage in STAGES:
+                    start = time.perf_counter()
+                    if stage == 'pdf':
+                        stages[stage](engine, os.path.join(output_dir, f"{name}_{rows}.pdf"))
+                    else:
+                        stages[stage](engine)
+                    records.append({
+                        'rows': rows,
+                        'hypothesis': name,
+                        'stage': stage,
+                        'seconds': round(time.perf_counter() - start, 4),
+                        'rss_mb': round(process.memory_info().rss / 1024 / 1024, 1),
+                    })
+                    print(f"{rows:>12,} {name:<14} {stage:<10} {records[-1]['seconds']:>9.3f}s {records[-1]['rss_mb']:>9.1f} MB")
+            engine.dispose()
+    return pd.DataFrame(records)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def save_results(results, path=None):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    run_at = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    revision = git_revision()
+    path = path or os.path.join(RESULTS_DIR, f"{run_at}-{revision or 'unknown'}.json")
+    with open(path, 'w') as f:
+        json.dump({'run_at': run_at, 'revision': revision, 'results': results.to_dict('records')}, f, indent=2)
+    return path
+
+
+# Stage timings side by side with a saved baseline run; ratio > 1 means slower than the baseline
+def compare_results(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = pd.DataFrame(json.load(f)['results'])
+    keys = ['rows', 'hypothesis', 'stage']
+    merged = results.merge(baseline[keys + ['seconds']], on=keys, how='left', suffixes=('', '_baseline'))
+    merged['ratio'] = (merged['seconds'] / merged['seconds_baseline']).round(2)
+    return merged
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the hypothesis pipelines on synthetic data.')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--hypotheses', nargs='+', help='only these pipelines, e.g. hypothesis_1 hypothesis_4')
+    parser.add_argument('--data-dir', help='where generated datasets are kept (default: benchmarks/.data)')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<time>-<revision>.json)')
+    parser.add_argument('--compare', help='baseline results file to compare against')
+    args = parser.parse_args()
+
+    os.environ['QUERY_CACHE'] = '0'
+    results = run_benchmark(args.rows, args.hypotheses, args.data_dir)
+    print(f"Results saved to {save_results(results, args.output)}")
+    if args.compare:
+        print(compare_results(results, args.compare).to_string(index=False))
@@ -0,0 +1,213 @@
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from analytics.backends import sqlite_paths
+from analytics.db import BOOKING_COLUMNS
+
+# Synthetic analytic_test_booking with the column list of Hypothese_4/hypothesis_4.sql and
+# realistic skew: Zipf-distributed stations, routes, customers and user agents, per-vehclass
+# prices and durations, Q1-Q3 bookings for 2019 and 2023 and a few percent of refunds.
+# The rows are stored in a local SQLite stand-in for the MySQL replica, so the report SQL runs
+# unchanged: the table lives in a database attached as `12go` and YEAR()/MONTH()/QUARTER() are
+# registered as functions.
+#   python -m benchmarks.synthetic --rows 1000000 --path benchmarks/.data/bookings_1000000
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+TABLE = 'analytic_test_booking'
+
+YEAR_SHARES = {2019: 0.45, 2023: 0.55}
+STATIONS = 2000
+CUSTOMERS = 200_000
+
+VEHCLASSES = {
+    # vehclass_id: (share, class names, median net price per seat, median trip minutes)
+    'bus': (0.42, ['Standard', 'VIP', 'VIP24', 'Express', 'Economy'], 18.0, 360),
+    'avia': (0.18, ['Economy', 'Business'], 120.0, 150),
+    'ferry': (0.14, ['Standard', 'Express', 'Speedboat'], 25.0, 120),
+    'train': (0.14, ['2nd Class Seat', '2nd Class Sleeper', '1st Class Sleeper'], 30.0, 600),
+    'van': (0.08, ['Minivan', 'Shared Van'], 15.0, 240),
+    'taxi': (0.04, ['Private Car', 'SUV'], 45.0, 90),
+}
+
+LANGUAGES = ['en', 'th', 'ru', 'de', 'fr', 'zh', 'ko', 'ja', 'es', 'it', 'vi', 'id']
+CURRENCIES = ['USD', 'THB', 'EUR', 'RUB', 'GBP', 'AUD', 'KRW', 'JPY']
+CHANNELS = ['web', 'mobile_web', 'app_ios', 'app_android', 'affiliate', 'api']
+REFERERS = ['google.com', 'direct', 'facebook.com', 'bing.com', 'tripadvisor.com', 'instagram.com', 'yandex.ru']
+LANDINGS = ['/', '/en/travel/bangkok/chiang-mai', '/en/travel/phuket/koh-phi-phi', '/en/ferry', '/en/bus', '/en/flights']
+
+UA_TEMPLATES = [
+    'Mozilla/5.0 (iPhone; CPU iPhone OS {v}_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/{v}.0 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android {a}; SM-G{n}B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{c}.0.0.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{c}.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/{v}.1 Safari/605.1.15',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:{c}.0) Gecko/20100101 Firefox/{c}.0',
+    'Mozilla/5.0 (Linux; Android {a}; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/{c}.0 Mobile Safari/537.36 Instagram {n}.0',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{c}.0.0.0 Safari/537.36 Edg/{c}.0',
+]
+
+
+def zipf_choice(rng, n, size, a=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** a
+    return rng.choice(n, size=size, p=weights / weights.sum())
+
+
+def user_agent_pool(rng, size=5000):
+    templates = rng.integers(0, len(UA_TEMPLATES), size)
+    return np.array([
+        UA_TEMPLATES[t].format(v=rng.integers(11, 17), a=rng.integers(8, 14), c=rng.integers(70, 120), n=rng.integers(100, 999))
+        for t in templates
+    ], dtype=object)
+
+
+def random_times(rng, years, size):
+    starts = pd.to_datetime([f"{y}-01-01" for y in years]).to_numpy()
+    # Q1-Q3 only, like the case-study data: 273 days from January 1st
+    offsets = rng.integers(0, 273 * 24 * 3600, size).astype('timedelta64[s]')
+    return (starts + offsets).astype('datetime64[s]')
+
+
+# One chunk of synthetic bookings; bids start at first_bid so chunks can be appended
+def generate_bookings(rows, seed=0, first_bid=1, ua_pool=None):
+    rng = np.random.default_rng(seed)
+    ua_pool = ua_pool if ua_pool is not None else user_agent_pool(np.random.default_rng(0))
+
+    years = rng.choice(list(YEAR_SHARES), size=rows, p=list(YEAR_SHARES.values()))
+    paidon = random_times(rng, years, rows)
+    godate = (paidon + (rng.exponential(14, rows) * 86400).astype('timedelta64[s]')).astype('datetime64[D]')
+    createdon = paidon - rng.integers(60, 3600, rows).astype('timedelta64[s]')
+
+    names = list(VEHCLASSES)
+    vehclass = rng.choice(len(names), size=rows, p=[VEHCLASSES[v][0] for v in names])
+    vehclass_id = np.array(names, dtype=object)[vehclass]
+    class_name = np.empty(rows, dtype=object)
+    median_price = np.empty(rows)
+    median_minutes = np.empty(rows)
+    class_id = np.empty(rows, dtype='int64')
+    for i, name in enumerate(names):
+        mask = vehclass == i
+        classes = VEHCLASSES[name][1]
+        picked = zipf_choice(rng, len(classes), mask.sum(), a=1.0)
+        class_name[mask] = np.array(classes, dtype=object)[picked]
+        class_id[mask] = i * 10 + picked
+        median_price[mask] = VEHCLASSES[name][2]
+        median_minutes[mask] = VEHCLASSES[name][3]
+
+    from_id = zipf_choice(rng, STATIONS, rows)
+    to_id = (from_id + 1 + zipf_choice(rng, STATIONS - 1, rows, a=1.3)) % STATIONS
+    seats = 1 + rng.poisson(0.6, rows)
+    seats[rng.random(rows) < 0.01] = 0
+
+    # Prices drift between the two years, and differ by route
+    year_factor = np.where(years == 2023, 0.92, 1.0)
+    route_factor = 0.7 + ((from_id * 31 + to_id * 17) % 60) / 100
+    netprice_seat = median_price * route_factor * year_factor * rng.lognormal(0, 0.35, rows)
+    netprice_usd = np.round(netprice_seat * seats, 2)
+    sysfee_usd = np.round(netprice_usd * rng.uniform(0.06, 0.14, rows), 2)
+    agfee_usd = np.round(np.where(rng.random(rows) < 0.3, netprice_usd * 0.05, 0.0), 2)
+    total_usd = netprice_usd + sysfee_usd + agfee_usd
+
+    refunded = rng.random(rows) < np.where(years == 2023, 0.06, 0.04)
+    refund_date = np.where(refunded, paidon + (rng.integers(1, 30, rows) * 86400).astype('timedelta64[s]'),
+                           np.datetime64('NaT', 's'))
+    refund_usd = np.where(refunded, np.round(total_usd * rng.uniform(0.5, 1.0, rows), 2), 0.0)
+    stamp = np.where(refunded, refund_date, paidon)
+
+    ua = ua_pool[zipf_choice(rng, len(ua_pool), rows, a=1.05)]
+    df = pd.DataFrame({
+        'bid': np.arange(first_bid, first_bid + rows),
+        'paidon': paidon,
+        'paygate_code': rng.choice(['card', 'paypal', 'alipay', 'bank'], rows, p=[0.6, 0.2, 0.1, 0.1]),
+        'status_id': rng.choice([1, 2, 3], rows, p=[0.9, 0.07, 0.03]),
+        'seller_id': (from_id * 7 + to_id) % 500,
+        'operator_id': (from_id * 13 + to_id * 3 + vehclass) % 3000,
+        'class_id': class_id,
+        'class_name': class_name,
+        'from_id': from_id,
+        'from_province_id': from_id // 10,
+        'from_country_id': from_id // 100,
+        'from_station_name': np.char.add('Station ', from_id.astype(str)).astype(object),
+        'to_id': to_id,
+        'to_province_id': to_id // 10,
+        'to_country_id': to_id // 100,
+        'to_station_name': np.char.add('Station ', to_id.astype(str)).astype(object),
+        'seats': seats,
+        'vehclass_id': vehclass_id,
+        'godate': godate,
+        'trip_duration_minutes': np.round(median_minutes * rng.lognormal(0, 0.3, rows)).astype('int64'),
+        'payment_currency': np.array(CURRENCIES, dtype=object)[zipf_choice(rng, len(CURRENCIES), rows)],
+        'cust_id': zipf_choice(rng, CUSTOMERS, rows, a=0.8),
+        'website_language': np.array(LANGUAGES, dtype=object)[zipf_choice(rng, len(LANGUAGES), rows)],
+        'stamp': stamp,
+        'createdby': rng.integers(0, 50, rows),
+        'createdby_role_id': rng.choice([0, 1, 2, 5], rows, p=[0.85, 0.08, 0.05, 0.02]),
+        'createdon': createdon,
+        'createdon_date': createdon.astype('datetime64[D]'),
+        'refund_date': refund_date,
+        'refund_usd': refund_usd,
+        'netprice_usd': netprice_usd,
+        'sysfee_usd': sysfee_usd,
+        'agfee_usd': agfee_usd,
+        'total_usd': total_usd,
+        'sysfee_total_usd': sysfee_usd,
+        'agfee_total_usd': agfee_usd,
+        'netprice_total_usd': netprice_usd,
+        'channel': np.array(CHANNELS, dtype=object)[zipf_choice(rng, len(CHANNELS), rows)],
+        'user_agent': ua,
+        'useragent': ua,
+        'referer': np.array(REFERERS, dtype=object)[zipf_choice(rng, len(REFERERS), rows)],
+        'landing': np.array(LANDINGS, dtype=object)[zipf_choice(rng, len(LANDINGS), rows)],
+        'user_origin_country_id': zipf_choice(rng, 200, rows),
+    })
+    return df[BOOKING_COLUMNS]
+
+
+# Write `rows` synthetic bookings to a SQLite stand-in in chunks, with the indexes the advisor proposes
+# for the date filters; returns the directory holding the databases
+def write_sqlite(path, rows, chunksize=500_000, seed=0):
+    os.makedirs(path, exist_ok=True)
+    main_path, table_path = sqlite_paths(path)
+    for file_path in (main_path, table_path):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    connection = sqlite3.connect(table_path)
+    ua_pool = user_agent_pool(np.random.default_rng(seed))
+    try:
+        for start in range(0, rows, chunksize):
+            chunk = generate_bookings(min(chunksize, rows - start), seed=seed + start, first_bid=start + 1, ua_pool=ua_pool)
+            for column in chunk.select_dtypes('datetime').columns:
+                chunk[column] = chunk[column].dt.strftime('%Y-%m-%d %H:%M:%S')
+            chunk.to_sql(TABLE, connection, if_exists='append', index=False)
+        for column in ('paidon', 'godate', 'refund_date'):
+            connection.execute(f"CREATE INDEX idx_{column} ON {TABLE} ({column})")
+        connection.commit()
+    finally:
+        connection.close()
+    sqlite3.connect(main_path).close()
+    return path
+
+
+def dataset_path(rows, data_dir=None):
+    return os.path.join(data_dir or DEFAULT_DATA_DIR, f"bookings_{rows}")
+
+
+# Reuse a generated dataset of the same size if there is one
+def ensure_dataset(rows, data_dir=None, seed=0):
+    path = dataset_path(rows, data_dir)
+    if not os.path.exists(sqlite_paths(path)[1]):
+        write_sqlite(path, rows, seed=seed)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic analytic_test_booking in SQLite.')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--path', help=f"output directory (default: {DEFAULT_DATA_DIR}/bookings_<rows>)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = write_sqlite(args.path or dataset_path(args.rows), args.rows, seed=args.seed)
+    print(f"{args.rows:,} synthetic bookings written to {path}")
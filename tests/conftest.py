@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+# Make the analytics and benchmarks packages importable however pytest is started
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from analytics.snapshot import write_chunk, write_manifest
+from benchmarks.synthetic import generate_bookings
+
+
+@pytest.fixture(autouse=True)
+def isolated_env(tmp_path, monkeypatch):
+    monkeypatch.setenv('QUERY_CACHE', '0')
+    monkeypatch.setenv('QUERY_CACHE_DIR', str(tmp_path / 'query_cache'))
+    monkeypatch.setenv('PARTIALS_DIR', str(tmp_path / 'partials'))
+    for name in ('USE_SNAPSHOT', 'INCREMENTAL', 'DB_BACKEND', 'SQLITE_PATH', 'PROFILE', 'SKETCH_ROUTES'):
+        monkeypatch.delenv(name, raising=False)
+
+
+# A few thousand synthetic bookings with the column list of analytic_test_booking
+@pytest.fixture(scope='session')
+def bookings():
+    return generate_bookings(3000, seed=7)
+
+
+# Local snapshot of `bookings` in one part file, with SNAPSHOT_DIR pointing at it
+@pytest.fixture
+def snapshot(bookings, tmp_path, monkeypatch):
+    path = str(tmp_path / 'snapshot')
+    os.makedirs(path)
+    write_chunk(bookings.copy(), path, 0)
+    write_manifest({'bid': int(bookings['bid'].max()), 'stamp': str(bookings['stamp'].max()), 'next_part': 1}, path)
+    monkeypatch.setenv('SNAPSHOT_DIR', path)
+    return path
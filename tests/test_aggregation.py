@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics.aggregation import aggregate_dimensions, aggregate_dimensions_parallel
+from analytics.mapped import temporary_mapped
+from analytics.metrics import with_margin
+
+GROUPING_SETS = {
+    'class_name': ['class_name', 'year'],
+    'channel': ['channel', 'year'],
+    'route': ['from_station_name', 'to_station_name'],
+    'total': [],
+}
+
+
+@pytest.fixture
+def frame(bookings):
+    df = bookings[['class_name', 'channel', 'from_station_name', 'to_station_name', 'netprice_usd', 'total_usd',
+                   'seats', 'trip_duration_minutes']].copy()
+    df['year'] = bookings['paidon'].dt.year
+    # NULL keys and measures, like the replica returns them
+    df.loc[df.index[::17], 'class_name'] = None
+    df.loc[df.index[::23], 'channel'] = None
+    df.loc[df.index[::29], 'netprice_usd'] = np.nan
+    df = with_margin(df)
+    df['trip_duration_minutes'] = df['trip_duration_minutes'].astype('float64')
+    df.loc[df.index[::31], 'trip_duration_minutes'] = np.nan
+    return df
+
+
+# The same aggregates with a pandas groupby, NULL keys kept as their own group
+def reference(df, keys):
+    grouped = df.groupby(keys, dropna=False) if keys else df.groupby(np.zeros(len(df)))
+    result = grouped.agg(
+        num_bookings=('netprice_usd', 'size'),
+        total_revenue=('netprice_usd', 'sum'),
+        margin=('margin_usd', 'sum'),
+        seats=('seats', 'sum'),
+        avg_duration=('trip_duration_minutes', 'mean'),
+    )
+    result['avg_eps'] = result['margin'] / result['seats'].where(result['seats'] != 0)
+    result = result.drop(columns=['margin', 'seats'])
+    return result.reset_index(drop=not keys)
+
+
+def check(results, df):
+    for name, keys in GROUPING_SETS.items():
+        expected = reference(df, keys)
+        actual = results[name]
+        if keys:
+            expected = expected.sort_values(keys, na_position='last', ignore_index=True)
+            actual = actual.sort_values(keys, na_position='last', ignore_index=True)
+        columns = keys + ['num_bookings', 'total_revenue', 'avg_eps', 'avg_duration']
+        pd.testing.assert_frame_equal(actual[columns].reset_index(drop=True), expected[columns],
+                                      check_dtype=False, check_exact=False, rtol=1e-9)
+
+
+def test_aggregate_dimensions_matches_groupby(frame):
+    results = aggregate_dimensions(frame, GROUPING_SETS)
+    assert results['class_name']['class_name'].isna().any()
+    check(results, frame)
+
+
+def test_parallel_aggregation_over_mapped_columns_matches_groupby(frame, tmp_path, monkeypatch):
+    monkeypatch.setenv('MAPPED_DIR', str(tmp_path / 'missing' / 'mapped'))
+    with temporary_mapped(frame) as mapped:
+        view = mapped.frame(['seats'])
+        assert np.shares_memory(view['seats'].to_numpy(), mapped.array('seats'))
+        results = aggregate_dimensions_parallel(mapped, GROUPING_SETS, max_workers=2)
+    decoded = {name: result.astype({c: object for c in result.select_dtypes('category')}) for name, result in results.items()}
+    check(decoded, frame)
@@ -0,0 +1,37 @@
+import glob
+import os
+
+import pytest
+
+from analytics.backends import duckdb_engine, sqlite_engine, sqlite_from_snapshot, translate_sql
+from analytics.db import read_sql
+from analytics.index_advisor import split_statements
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SQL_FILES = sorted(glob.glob(os.path.join(REPO_ROOT, 'Hypothese_*', '*.sql')))
+STATEMENTS = [
+    pytest.param(path, i, id=f"{os.path.basename(path)}:{i + 1}")
+    for path in SQL_FILES
+    for i in range(len(split_statements(open(path).read())))
+]
+
+
+def test_translate_sql_rewrites_identifiers_and_ifnull_outside_literals():
+    query = "SELECT IFNULL(`x`, 0), 'IFNULL(`y`)' FROM `12go`.analytic_test_booking"
+    assert translate_sql(query, 'duckdb') == 'SELECT COALESCE("x", 0), \'IFNULL(`y`)\' FROM "12go".analytic_test_booking'
+    assert translate_sql(query, 'mysql') == query
+
+
+@pytest.fixture
+def engines(snapshot):
+    return {'duckdb': duckdb_engine(snapshot), 'sqlite': sqlite_engine(sqlite_from_snapshot(snapshot))}
+
+
+# Every statement of the shipped report SQL runs on both embedded backends
+@pytest.mark.parametrize('path, statement', STATEMENTS)
+def test_report_sql_runs_on_embedded_backends(engines, path, statement):
+    with open(path) as f:
+        sql = split_statements(f.read())[statement]
+    for backend, engine in engines.items():
+        result = read_sql(sql, engine)
+        assert len(result.columns), backend
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from analytics.decomposition import HIERARCHY_COLUMNS, decompose_eps
+from analytics.eps_cube import EpsCube
+
+
+@pytest.fixture
+def rows(bookings):
+    return bookings.assign(year=bookings['paidon'].dt.year)
+
+
+def eps(df, year):
+    df = df[df['year'] == year]
+    return (df['total_usd'].sum() - df['netprice_usd'].sum()) / df['seats'].sum()
+
+
+def test_total_is_the_eps_change(rows):
+    result = decompose_eps(rows, threshold=0)
+    total = result.iloc[0]
+    assert total['level'] == 0
+    assert np.isclose(total['EPS_2019'], eps(rows, 2019)) and np.isclose(total['EPS_2023'], eps(rows, 2023))
+    assert np.isclose(total['mix'] + total['rate'], total['EPS_2023'] - total['EPS_2019'])
+    assert np.isclose(result.loc[result['level'] == 1, 'contribution'].sum(), total['contribution'])
+
+
+def test_children_add_up_to_parent_rate(rows):
+    result = decompose_eps(rows, threshold=0)
+    expanded = result[result['expanded'] & (result['level'] > 0)]
+    assert len(expanded) and (result['level'] == 4).any()
+    children = result.groupby('parent')['contribution'].sum()
+    for node, rate in zip(expanded['node'], expanded['rate']):
+        assert np.isclose(children[node], rate)
+
+
+def test_threshold_limits_drill_down(rows):
+    lazy = decompose_eps(rows, threshold=0.2)
+    full = decompose_eps(rows, threshold=0)
+    assert len(lazy) < len(full)
+    # Only expanded nodes have children, and every node comes after its parent
+    parents = set(lazy.loc[lazy['level'] > 1, 'parent'])
+    assert parents <= set(lazy.loc[lazy['expanded'], 'node'])
+    position = {node: i for i, node in enumerate(lazy['node'])}
+    assert all(position[p] < position[n] for n, p in zip(lazy['node'], lazy['parent']) if p >= 0)
+
+
+def test_cube_cells_give_the_same_tree(rows):
+    cube = EpsCube.from_bookings(rows)
+    cells = cube.rollup(['year'] + HIERARCHY_COLUMNS, years=[2019, 2023])
+    from_rows = decompose_eps(rows, threshold=0.05)
+    from_cells = decompose_eps(cells, threshold=0.05)
+    assert len(from_rows) == len(from_cells)
+    np.testing.assert_allclose(from_cells['contribution'], from_rows['contribution'])
@@ -0,0 +1,39 @@
+import multiprocessing
+import os
+
+import pandas as pd
+
+from analytics.dictionary import align_categories, decode, encode_frame, load_dictionary
+
+
+def encode_labels(path, worker, count):
+    for i in range(count):
+        encode_frame(pd.DataFrame({'channel': [f"w{worker}-{i}"]}), path=path)
+
+
+# Two processes extending the same dictionary at once keep each other's labels
+def test_concurrent_encoders_keep_every_label(tmp_path):
+    path = str(tmp_path)
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=encode_labels, args=(path, w, 20)) for w in range(2)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    labels = set(load_dictionary('channel', path))
+    assert labels == {f"w{w}-{i}" for w in range(2) for i in range(20)}
+
+
+# Frames encoded in memory against different labels concatenate without losing any of them
+def test_align_categories_keeps_labels_of_every_frame(tmp_path, monkeypatch):
+    monkeypatch.setenv('SNAPSHOT_DIR', str(tmp_path))
+    frames = [
+        encode_frame(pd.DataFrame({'channel': ['web', 'app', None]}), persist=False),
+        encode_frame(pd.DataFrame({'channel': ['partner', 'web']}), persist=False),
+    ]
+    combined = pd.concat(align_categories(frames), ignore_index=True)
+    assert isinstance(combined['channel'].dtype, pd.CategoricalDtype)
+    labels = decode(combined['channel'])
+    assert labels.isna().tolist() == [False, False, True, False, False]
+    assert labels.dropna().tolist() == ['web', 'app', 'partner', 'web']
+    assert not os.path.exists(tmp_path / 'dictionaries')
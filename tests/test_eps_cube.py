@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from analytics.dictionary import decode
+from analytics.eps_cube import CUBE_MEASURES, EpsCube
+from benchmarks.synthetic import generate_bookings
+
+ROLLUPS = [['year'], ['year', 'vehclass_id'], ['vehclass_id', 'class_name'], ['year', 'from_station_name', 'to_station_name']]
+
+
+def normalized(df, dimensions):
+    df = decode(df).astype({d: str for d in dimensions})
+    return df.sort_values(dimensions, ignore_index=True)[dimensions + CUBE_MEASURES + ['EPS']]
+
+
+# Reprice and re-date some bookings (superseding their old rows) and add new ones
+def updated_bookings(bookings):
+    changed = bookings.iloc[::25].copy()
+    changed['netprice_usd'] = changed['netprice_usd'] * 0.8
+    changed.loc[changed.index[::2], 'paidon'] = changed['paidon'] + pd.DateOffset(years=4)
+    added = generate_bookings(300, seed=3, first_bid=int(bookings['bid'].max()) + 1)
+    current = pd.concat([bookings.drop(index=changed.index), changed, added], ignore_index=True)
+    return current, pd.concat([changed, added], ignore_index=True), bookings.loc[changed.index]
+
+
+def test_rollup_matches_groupby(bookings):
+    cube = EpsCube.from_bookings(bookings)
+    rows = bookings.assign(year=bookings['paidon'].dt.year, bookings=1)
+    for dimensions in ROLLUPS:
+        expected = rows.groupby(dimensions, dropna=False)[CUBE_MEASURES].sum().reset_index()
+        expected['EPS'] = (expected['total_usd'] - expected['netprice_usd']) / expected['seats'].where(expected['seats'] != 0)
+        pd.testing.assert_frame_equal(normalized(cube.rollup(dimensions), dimensions), normalized(expected, dimensions),
+                                      check_dtype=False)
+
+
+def test_apply_matches_rebuild(bookings, snapshot):
+    current, added, removed = updated_bookings(bookings)
+    cube = EpsCube.from_bookings(bookings)
+    cube.rollup(['year', 'vehclass_id'])
+    cube.apply(added, removed)
+    rebuilt = EpsCube.from_bookings(current)
+    for dimensions in ROLLUPS:
+        pd.testing.assert_frame_equal(normalized(cube.rollup(dimensions), dimensions),
+                                      normalized(rebuilt.rollup(dimensions), dimensions), check_dtype=False)
+    # Cells emptied by the update are dropped rather than kept with zero bookings
+    assert (cube.cells['bookings'] > 0).all()
+    assert np.isclose(cube.rollup([])['seats'].iloc[0], current['seats'].sum())
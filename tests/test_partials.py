@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from analytics.partials import (
+    ROUTE_COLUMNS, PartialStore, SnapshotPartialSource, refresh_partials, rollup, route_year_totals,
+)
+from analytics.snapshot import write_chunk, write_manifest
+from benchmarks.synthetic import generate_bookings
+
+MEASURES = ['orders', 'refunds', 'seats', 'netprice_usd', 'total_usd', 'refund_usd', 'avg_eps', 'avg_duration']
+
+
+# Reprice some 2023 bookings in place and add new ones, all stamped after the stored watermark
+def update_snapshot(path, bookings):
+    later = bookings['stamp'].max() + pd.Timedelta(days=1)
+    updated = bookings.copy()
+    repriced = updated.index[updated['godate'].dt.year == 2023][:40]
+    updated.loc[repriced, 'netprice_usd'] = updated.loc[repriced, 'netprice_usd'] * 0.5
+    updated.loc[repriced, 'stamp'] = later
+    added = generate_bookings(200, seed=11, first_bid=int(bookings['bid'].max()) + 1)
+    added['stamp'] = later
+    write_chunk(updated, path, 0)
+    write_chunk(added, path, 1)
+    write_manifest({'bid': int(added['bid'].max()), 'stamp': str(later), 'next_part': 2}, path)
+    return pd.concat([updated, added], ignore_index=True)
+
+
+@pytest.fixture
+def updated(snapshot, bookings, tmp_path, monkeypatch):
+    monkeypatch.setenv('USE_SNAPSHOT', '1')
+    store = refresh_partials(path=str(tmp_path / 'incremental'))
+    rows = update_snapshot(snapshot, bookings)
+    return store, rows
+
+
+def test_incremental_refresh_matches_full_rebuild(updated, tmp_path):
+    store, _ = updated
+    store = PartialStore(store.path)
+    # Only the touched partitions are re-aggregated (None would mean a full rebuild)
+    refreshed = store.refresh(SnapshotPartialSource())
+    assert refreshed is not None and 0 < len(refreshed) < len(store.table('total'))
+    full = refresh_partials(path=str(tmp_path / 'full'), full=True)
+    for table, keys in [('total', ['year']), ('vehclass_id', ['vehclass_id', 'year']), ('channel', ['channel', 'month'])]:
+        actual = rollup(store.table(table), keys)
+        expected = rollup(full.table(table), keys)
+        pd.testing.assert_frame_equal(actual[keys + MEASURES], expected[keys + MEASURES], check_dtype=False)
+
+
+def test_rollup_matches_recompute_from_rows(updated):
+    store, rows = updated
+    store = refresh_partials(path=store.path)
+    rows = rows[rows['godate'].dt.year.isin([2019, 2023])]
+    expected = rows.groupby([rows['vehclass_id'], rows['godate'].dt.year.rename('year')]).agg(
+        orders=('bid', 'size'), seats=('seats', 'sum'), netprice_usd=('netprice_usd', 'sum'),
+        total_usd=('total_usd', 'sum'), avg_duration=('trip_duration_minutes', 'mean')).reset_index()
+    actual = rollup(store.table('vehclass_id'), ['vehclass_id', 'year'], years=[2019, 2023])
+    pd.testing.assert_frame_equal(actual[expected.columns.tolist()], expected, check_dtype=False)
+
+
+def test_route_year_totals_match_paidon_groupby(updated):
+    store, rows = updated
+    store = refresh_partials(path=store.path)
+    expected = rows.assign(year=rows['paidon'].dt.year).groupby(['year'] + ROUTE_COLUMNS, dropna=False)[
+        ['seats', 'netprice_usd', 'total_usd']].sum().reset_index()
+    expected = expected[expected['year'].isin([2019, 2023])]
+    actual = route_year_totals(store, [2019, 2023])
+    keys = ['year'] + ROUTE_COLUMNS
+    pd.testing.assert_frame_equal(actual.sort_values(keys, ignore_index=True),
+                                  expected.sort_values(keys, ignore_index=True), check_dtype=False)
+
@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+
+import pandas as pd
+
+from analytics.backends import duckdb_engine
+from analytics.query_cache import QueryCache, table_watermark
+from analytics.snapshot import write_chunk
+from benchmarks.synthetic import generate_bookings
+
+
+def fill(path, worker, count):
+    cache = QueryCache(path)
+    for i in range(count):
+        cache.put(f"SELECT {worker} AS worker, {i} AS i", None, pd.DataFrame({'i': [i]}))
+
+
+def test_round_trip_and_counters(tmp_path):
+    cache = QueryCache(str(tmp_path))
+    frame = pd.DataFrame({'a': [1, 2]})
+    assert cache.read_sql('SELECT 1', lambda: frame).equals(frame)
+    assert cache.read_sql('SELECT  1 ;', lambda: None).equals(frame)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+# Two processes writing at once keep each other's entries, and every cached file stays indexed
+def test_concurrent_writers_merge_the_index(tmp_path):
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=fill, args=(str(tmp_path), w, 20)) for w in range(2)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    cache = QueryCache(str(tmp_path))
+    files = {f[:-len('.parquet')] for f in os.listdir(tmp_path) if f.endswith('.parquet')}
+    assert len(cache._read_index()['entries']) == 40
+    assert files == set(cache._read_index()['entries'])
+
+
+def test_unindexed_files_count_toward_the_byte_cap(tmp_path):
+    pd.DataFrame({'a': range(1000)}).to_parquet(tmp_path / ('0' * 64 + '.parquet'))
+    cache = QueryCache(str(tmp_path), max_bytes=1)
+    cache.put('SELECT 2', None, pd.DataFrame({'b': [1]}))
+    assert not (tmp_path / ('0' * 64 + '.parquet')).exists()
+
+
+# The same query against another database is a different entry
+def test_key_covers_the_data_source(tmp_path):
+    first = QueryCache(str(tmp_path), source='mysql:db-a:3306/12go')
+    first.put('SELECT 1', None, pd.DataFrame({'a': [1]}))
+    assert first.get('SELECT 1') is not None
+    assert QueryCache(str(tmp_path), source='mysql:db-b:3306/12go').get('SELECT 1') is None
+
+
+# New or updated bookings in the table itself move the watermark the cache is checked against
+def test_table_watermark_follows_the_booking_table(snapshot, bookings):
+    before = table_watermark(duckdb_engine(snapshot))
+    added = generate_bookings(10, seed=3, first_bid=int(bookings['bid'].max()) + 1)
+    write_chunk(added, snapshot, 1)
+    assert table_watermark(duckdb_engine(snapshot)) != before
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from analytics.backends import duckdb_engine
+from analytics.refunds import (
+    REFUND_DIMENSIONS, classify_refund_rates, fetch_dimension_refunds, fetch_yearly_refunds, refund_rates_by_dimension,
+    refund_rates_by_year,
+)
+
+
+def test_classify_refund_rates():
+    df = pd.DataFrame({'year': [2019, 2020, 2021, 2022], 'total_orders': [100, 10, 0, 0], 'refund_count': [4, 12, 3, 0]})
+    df = classify_refund_rates(df)
+    assert df['refund_status'].tolist() == ['ok', 'anomaly', 'no orders', 'no orders']
+    assert df['refund_rate'].iloc[0] == 0.04
+    assert np.isnan(df['refund_rate'].iloc[1]) and np.isnan(df['refund_rate'].iloc[2])
+    assert df['refund_rate'].iloc[3] == 0.0
+
+
+# The yearly GROUP BY on (paidon year, refund year) rolls up to the same counts as the row-level frame
+def test_yearly_refund_query_matches_row_level(snapshot, bookings):
+    expected = refund_rates_by_year(bookings)
+    actual = fetch_yearly_refunds(duckdb_engine(snapshot))
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_single_scan_dimension_refunds_match_row_level(snapshot, bookings):
+    rows = bookings[REFUND_DIMENSIONS].copy()
+    rows['is_refund'] = bookings['refund_date'].notna().astype('int64')
+    expected = refund_rates_by_dimension(rows)
+    actual = fetch_dimension_refunds(duckdb_engine(snapshot))
+    for dimension in REFUND_DIMENSIONS:
+        left = actual[dimension].sort_values(dimension, ignore_index=True)
+        right = expected[dimension].sort_values(dimension, ignore_index=True)
+        pd.testing.assert_frame_equal(left, right[left.columns], check_dtype=False)
@@ -0,0 +1,25 @@
+import glob
+import os
+
+from analytics.backends import duckdb_engine
+from analytics.db import read_sql
+from analytics.runner import DEFAULT_SPECS, load_spec, plan, run
+
+SCRIPT_OUTPUTS = {'hypo_1.pdf', 'eps_analysis_report.pdf', 'hypothesis_testing_results.pdf', 'comparison_charts.pdf'}
+
+
+def test_specs_share_queries():
+    specs = [load_spec(p) for p in sorted(glob.glob(DEFAULT_SPECS))]
+    assert {s['name'] for s in specs} >= {'hypothesis_1', 'hypothesis_2', 'hypothesis_3', 'hypothesis_4'}
+    _, _, queries = plan(specs)
+    assert len(queries) < sum(len(s['queries']) for s in specs)
+    assert not {s['output'] for s in specs} & SCRIPT_OUTPUTS
+
+
+def test_run_all_specs(snapshot, tmp_path):
+    engine = duckdb_engine(snapshot)
+    output_dir = str(tmp_path / 'reports')
+    outputs, timings = run(sorted(glob.glob(DEFAULT_SPECS)), fetch=lambda sql: read_sql(sql, engine), output_dir=output_dir)
+    for name, output in outputs.items():
+        assert os.path.dirname(output) == output_dir and os.path.getsize(output) > 0
+    assert (timings['kind'] == 'chart').any()
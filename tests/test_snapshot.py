@@ -0,0 +1,86 @@
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from analytics.backends import sqlite_engine, sqlite_paths
+from analytics.snapshot import partition_files, read_manifest, refresh_snapshot
+from benchmarks.synthetic import TABLE, write_sqlite
+
+ROWS = 2000
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = write_sqlite(str(tmp_path / 'source'), ROWS, seed=3)
+    return path, sqlite_engine(path)
+
+
+def stored(path):
+    return pd.concat([pd.read_parquet(f) for f in partition_files(path)], ignore_index=True)
+
+
+# Refund 50 bookings after the first copy; their stamp moves past the high-water mark
+def refund_some(path, count=50):
+    with sqlite3.connect(sqlite_paths(path)[1]) as connection:
+        connection.execute(
+            f"UPDATE {TABLE} SET refund_date = '2024-06-01 00:00:00', stamp = '2024-06-01 00:00:00', refund_usd = 1.5 "
+            f"WHERE bid IN (SELECT bid FROM {TABLE} WHERE refund_date IS NULL ORDER BY bid LIMIT {count})"
+        )
+
+
+def test_incremental_refresh_replaces_updated_rows(source, tmp_path):
+    path, engine = source
+    snapshot = str(tmp_path / 'snapshot')
+    assert refresh_snapshot(engine, snapshot, chunksize=300) == ROWS
+    refund_some(path)
+
+    changes = []
+    assert refresh_snapshot(engine, snapshot, chunksize=20, on_change=lambda added, removed: changes.append(len(removed))) == 50
+    df = stored(snapshot)
+    assert len(df) == ROWS and df['bid'].is_unique
+    assert (df['refund_usd'] == 1.5).sum() == 50
+    assert sum(changes) == 50
+
+
+# A refresh that dies after some chunks leaves no duplicates behind once it is rerun
+def test_interrupted_refresh_is_rerun_without_duplicates(source, tmp_path):
+    path, engine = source
+    snapshot = str(tmp_path / 'snapshot')
+    refresh_snapshot(engine, snapshot, chunksize=300)
+    watermark = read_manifest(snapshot)['stamp']
+    refund_some(path)
+
+    def crash(added, removed, calls=[]):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError('connection lost')
+
+    with pytest.raises(RuntimeError):
+        refresh_snapshot(engine, snapshot, chunksize=20, on_change=crash)
+    assert read_manifest(snapshot)['stamp'] == watermark
+    # Also a temp file of a chunk that never got renamed
+    open(os.path.join(os.path.dirname(partition_files(snapshot)[0]), 'part-99999.parquet.tmp'), 'w').close()
+
+    refresh_snapshot(engine, snapshot, chunksize=20)
+    df = stored(snapshot)
+    assert len(df) == ROWS and df['bid'].is_unique
+    assert (df['refund_usd'] == 1.5).sum() == 50
+    assert not [f for f in os.listdir(os.path.dirname(partition_files(snapshot)[0])) if f.endswith('.tmp')]
+
+
+def test_interrupted_first_copy_starts_over(source, tmp_path):
+    path, engine = source
+    snapshot = str(tmp_path / 'snapshot')
+
+    def crash(added, removed, calls=[]):
+        calls.append(1)
+        if len(calls) == 3:
+            raise RuntimeError('connection lost')
+
+    with pytest.raises(RuntimeError):
+        refresh_snapshot(engine, snapshot, chunksize=300, on_change=crash)
+    refresh_snapshot(engine, snapshot, chunksize=300)
+    df = stored(snapshot)
+    assert len(df) == ROWS and df['bid'].is_unique
@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+from analytics.topn import top_n
+
+
+# Per-group selection picks the same rows as a full sort within each group, NaN never ranking
+def test_top_n_per_group_matches_sorted_groups():
+    rng = np.random.default_rng(5)
+    df = pd.DataFrame({
+        'year': rng.choice([2019, 2023], 500),
+        'vehclass_id': rng.choice(['bus', 'train', 'ferry', None], 500),
+        'EPS': rng.normal(5, 2, 500),
+    })
+    df.loc[rng.choice(500, 40, replace=False), 'EPS'] = np.nan
+    actual = top_n(df, 'EPS', 3, by=['year', 'vehclass_id'])
+    expected = (df.dropna(subset=['EPS']).sort_values('EPS', ascending=False)
+                .groupby(['year', 'vehclass_id'], dropna=False).head(3))
+    assert len(actual) == len(expected)
+    assert sorted(actual['EPS']) == sorted(expected['EPS'])
+    for _, group in actual.groupby(['year', 'vehclass_id'], dropna=False):
+        assert group['EPS'].is_monotonic_decreasing
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from analytics.user_agents import normalize_user_agents, user_agent_family
+
+AGENTS = [
+    'Mozilla/5.0 (Linux; Android 13; SM-S911B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 16_5 like Mac OS X) AppleWebKit/605.1.15 Version/16.5 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/116.0 Safari/537.36 Edg/116.0',
+    'Googlebot/2.1 (+http://www.google.com/bot.html)',
+    '',
+    None,
+]
+
+
+def test_family_labels():
+    assert user_agent_family(AGENTS[0]) == 'Mobile / Android / Chrome'
+    assert user_agent_family(AGENTS[1]) == 'Mobile / iOS / Safari'
+    assert user_agent_family(AGENTS[2]) == 'Desktop / Windows / Edge'
+    assert user_agent_family(AGENTS[3]) == 'Bot / Other / Other'
+    assert user_agent_family(None) is None
+
+
+@pytest.mark.parametrize('dtype', [object, 'category'])
+def test_normalize_matches_row_by_row(dtype):
+    values = pd.Series(AGENTS * 3, name='user_agent', dtype=dtype)
+    result = normalize_user_agents(values)
+    expected = [user_agent_family(None if pd.isna(ua) else ua) for ua in values.astype(object)]
+    assert result.name == 'user_agent_family'
+    assert result.astype(object).where(result.notna(), None).tolist() == expected
+
+
+@pytest.mark.parametrize('dtype', [object, 'category'])
+def test_normalize_all_null(dtype):
+    result = normalize_user_agents(pd.Series([None, None], dtype=dtype, name='user_agent'))
+    assert result.isna().all() and len(result) == 2
+
+
+def test_normalize_empty():
+    assert len(normalize_user_agents(pd.Series([], dtype='category', name='user_agent'))) == 0